@@ -0,0 +1,112 @@
+"""
+Benchmark JSON vs MessagePack pour /predict et /predict/batch
+
+Deux mesures par taille de lot (1 = /predict, N > 1 = /predict/batch):
+- codec: taille des corps et temps d'encodage/décodage de bout en bout, sans le
+  scoring (client encode la requête, service la décode et la valide, service
+  encode la réponse, client la décode)
+- app: latence moyenne des appels à l'application FastAPI en process
+  (transport ASGI, sans réseau), scoring compris
+
+Usage:
+    python benchmarks/bench_encoding.py [--sizes 1 100 1000] [--repeats 200]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from common.msgpack_codec import MSGPACK_AVAILABLE, decode_response, packb, request_options, unpackb  # noqa: E402
+from fraud_detection_service import main  # noqa: E402
+
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+ENCODINGS = ("json", "msgpack")
+
+
+def make_transactions(n: int) -> list:
+    merchants = ["Amazon", "Carrefour", "Netflix", "AB", "Bijouterie"]
+    return [{"transaction_id": f"TXN{i:08d}", "amount": round(12.5 + i * 37.31 % 9000, 2),
+             "merchant": merchants[i % len(merchants)], "category": "Shopping",
+             "user_id": f"user{i % 100}", "timestamp": "2026-01-01T12:00:00"} for i in range(n)]
+
+
+def request_payload(transactions: list):
+    return transactions[0] if len(transactions) == 1 else {"transactions": transactions}
+
+
+def response_model(transactions: list):
+    results = main.score_transactions([main.SimpleTransactionRequest(**t) for t in transactions])
+    if len(transactions) == 1:
+        return results[0]
+    return main.BatchFraudDetectionResponse(count=len(results), results=results)
+
+
+def codec_round_trip(transactions: list, encoding: str, repeats: int):
+    """(octets requête, octets réponse, µs par aller-retour) pour les étapes de sérialisation seules"""
+    payload = request_payload(transactions)
+    result = response_model(transactions)
+    request_cls = main.SimpleTransactionRequest if len(transactions) == 1 else main.BatchTransactionRequest
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        if encoding == "msgpack":
+            body = packb(payload)
+            request_cls.model_validate(unpackb(body))
+            response = packb(result.model_dump())
+            unpackb(response)
+        else:
+            body = json.dumps(payload).encode()
+            request_cls.model_validate_json(body)
+            response = result.model_dump_json().encode()
+            json.loads(response)
+    elapsed = time.perf_counter() - start
+    return len(body), len(response), elapsed / repeats * 1e6
+
+
+async def app_latency(transactions: list, encoding: str, repeats: int) -> float:
+    """Latence moyenne (ms) d'un appel à l'application, encodage et scoring compris"""
+    path = "/predict" if len(transactions) == 1 else "/predict/batch"
+    options = request_options(request_payload(transactions), encoding == "msgpack")
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(3):
+            (await client.post(path, **options)).raise_for_status()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            response = await client.post(path, **options)
+            response.raise_for_status()
+            decode_response(response)
+        return (time.perf_counter() - start) / repeats * 1000.0
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1, 100, 1000])
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+    if not MSGPACK_AVAILABLE:
+        parser.error("le paquet msgpack n'est pas installé (pip install msgpack)")
+
+    main.load_model()
+    # Sans lifespan, warm_start ne s'exécute pas: le scoring exige l'état prêt de /ready
+    main.ready = True
+    print(f"{'taille':>6} {'format':<8} {'req octets':>11} {'rép octets':>11} {'codec µs':>10} {'app ms':>8}")
+    for size in args.sizes:
+        transactions = make_transactions(size)
+        repeats = max(5, args.repeats // max(1, size // 100))
+        for encoding in ENCODINGS:
+            request_bytes, response_bytes, codec_us = codec_round_trip(transactions, encoding, repeats)
+            latency_ms = asyncio.run(app_latency(transactions, encoding, repeats))
+            print(f"{size:>6} {encoding:<8} {request_bytes:>11} {response_bytes:>11} {codec_us:>10.1f} {latency_ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main_cli()
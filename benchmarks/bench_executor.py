@@ -0,0 +1,92 @@
+"""
+Benchmark des modes d'exécution du scoring (inline, thread, process)
+
+Envoie des requêtes /predict concurrentes à l'application FastAPI en process
+(transport ASGI, sans réseau) et mesure en parallèle la latence de /health,
+pour montrer le blocage de la boucle asyncio en mode inline.
+
+Usage:
+    python benchmarks/bench_executor.py [--requests 2000] [--concurrency 32] [--workers 4]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from fraud_detection_service import main  # noqa: E402
+from fraud_detection_service.executor import EXECUTOR_MODES, ScoringExecutor  # noqa: E402
+
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+
+def percentiles(latencies):
+    latencies_ms = np.asarray(latencies) * 1000.0
+    return {p: float(np.percentile(latencies_ms, p)) for p in (50, 99)}
+
+
+async def run_load(n_requests: int, concurrency: int):
+    """Envoie n_requests /predict avec `concurrency` requêtes en vol, et sonde /health en parallèle"""
+    transport = httpx.ASGITransport(app=main.app)
+    predict_latencies, health_latencies = [], []
+    semaphore = asyncio.Semaphore(concurrency)
+    rng = np.random.default_rng(0)
+    amounts = rng.choice([25.0, 180.0, 1200.0, 7500.0, 60000.0], size=n_requests)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def predict(i):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/predict", json={"amount": float(amounts[i]), "merchant": f"M{i % 50}"})
+                predict_latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        async def probe_health(stop: asyncio.Event):
+            while not stop.is_set():
+                start = time.perf_counter()
+                await client.get("/health")
+                health_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.005)
+
+        stop = asyncio.Event()
+        probe = asyncio.create_task(probe_health(stop))
+        start = time.perf_counter()
+        await asyncio.gather(*[predict(i) for i in range(n_requests)])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await probe
+
+    return n_requests / elapsed, percentiles(predict_latencies), percentiles(health_latencies), len(health_latencies)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", default=list(EXECUTOR_MODES), choices=EXECUTOR_MODES)
+    args = parser.parse_args()
+
+    main.load_model()
+    # Sans lifespan, warm_start ne s'exécute pas: le scoring exige l'état prêt de /ready
+    main.ready = True
+    print(f"{'mode':<8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'health n':>9} {'health p50':>11} {'health p99':>11}")
+    for mode in args.modes:
+        main.executor = ScoringExecutor(mode, args.workers, preload=main.load_model)
+        main.executor.warmup(main.load_model)
+        try:
+            throughput, predict, health, n_health = asyncio.run(run_load(args.requests, args.concurrency))
+        finally:
+            main.executor.shutdown()
+            main.executor = None
+        print(f"{mode:<8} {throughput:>8.0f} {predict[50]:>8.2f} {predict[99]:>8.2f} {n_health:>9} {health[50]:>11.2f} {health[99]:>11.2f}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,91 @@
+"""
+Débit des endpoints dominés par la (dé)sérialisation JSON
+
+Appels séquentiels aux applications FastAPI en process (transport ASGI, sans
+réseau): /predict (cache des scores chaud, le coût restant est celui du
+framework et du JSON), GET /transactions (100 lignes) et GET /transactions/{id}.
+La base du service de transaction est un fichier SQLite temporaire.
+
+Usage:
+    python benchmarks/bench_json.py [--requests 2000] [--rows 100]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import httpx
+
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+DB_PATH = Path(tempfile.mkdtemp()) / "bench_json.db"
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_PATH}")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from fraud_detection_service import main as fraud_main  # noqa: E402
+from transaction_service import main as transaction_main  # noqa: E402
+from transaction_service.models import SessionLocal, Transaction  # noqa: E402
+
+
+def seed_transactions(n_rows: int) -> str:
+    db = SessionLocal()
+    try:
+        db.query(Transaction).delete()
+        for i in range(n_rows):
+            db.add(Transaction(transaction_id=f"TXN_{i:06d}", user_id=f"user{i % 10}", amount=10.0 + i,
+                               merchant=f"Marchand {i % 7}", category="Shopping", description="Achat de test",
+                               status="APPROVED", is_fraud=False, fraud_score=0.1, confidence=0.1))
+        db.commit()
+    finally:
+        db.close()
+    return f"TXN_{n_rows // 2:06d}"
+
+
+async def throughput(app, method: str, path: str, n_requests: int, payloads=None) -> float:
+    """Requêtes par seconde (après 50 appels de chauffe)"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def call(i):
+            options = {"json": payloads[i % len(payloads)]} if payloads else {}
+            response = await client.request(method, path, **options)
+            response.raise_for_status()
+
+        for i in range(50):
+            await call(i)
+        start = time.perf_counter()
+        for i in range(n_requests):
+            await call(i)
+        return n_requests / (time.perf_counter() - start)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=100)
+    args = parser.parse_args()
+
+    fraud_main.load_model()
+    # Sans lifespan, warm_start ne s'exécute pas: le scoring exige l'état prêt de /ready
+    fraud_main.ready = True
+    transaction_id = seed_transactions(args.rows)
+    predict_payloads = [{"transaction_id": f"T{i}", "amount": 12.5 + i, "merchant": f"M{i}", "category": "Shopping",
+                         "user_id": "user1", "timestamp": "2026-01-01T12:00:00"} for i in range(50)]
+
+    scenarios = [
+        ("POST /predict", fraud_main.app, "POST", "/predict", predict_payloads),
+        (f"GET /transactions ({args.rows})", transaction_main.app, "GET", f"/transactions?limit={args.rows}", None),
+        ("GET /transactions/{id}", transaction_main.app, "GET", f"/transactions/{transaction_id}", None),
+    ]
+    print(f"{'endpoint':<28} {'req/s':>8}")
+    for name, app, method, path, payloads in scenarios:
+        print(f"{name:<28} {asyncio.run(throughput(app, method, path, args.requests, payloads)):>8.0f}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,220 @@
+"""
+Benchmark de charge reproductible du service de détection (en process)
+
+Envoie des requêtes /predict à l'application FastAPI via le transport ASGI
+(sans réseau ni port ouvert), avec une concurrence et un mélange de requêtes
+configurables, puis affiche le débit et les latences p50/p95/p99. Les
+réglages du service (USE_COMPILED_FOREST, SCORING_EXECUTOR, MICROBATCH_ENABLED...)
+se passent par variables d'environnement, comme pour le service. En mode inline
+le scoring bloque la boucle asyncio: la concurrence ne recouvre alors que
+l'encodage et le transport.
+
+Types de requêtes (--mix):
+- low: petits montants (1-500), marchands variés (cache des scores peu utile)
+- high: gros montants (5 000-150 000), règles de montant déclenchées
+- repeat: quelques couples (marchand, montant) répétés (cache des scores chaud)
+
+Les résultats peuvent être enregistrés comme référence JSON (--save-baseline)
+puis comparés à chaque exécution (--baseline): le script sort en erreur (code 1)
+si le débit baisse ou si une latence augmente de plus de --tolerance. Une
+référence dépend de la machine: la régénérer sur la machine qui compare.
+
+Usage:
+    LOG_LEVEL=WARNING python benchmarks/bench_load.py [--requests 5000] [--concurrency 32] [--mix low=0.6,high=0.2,repeat=0.2]
+    python benchmarks/bench_load.py --save-baseline benchmarks/baselines/load.json
+    python benchmarks/bench_load.py --baseline benchmarks/baselines/load.json --tolerance 0.15
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import warnings
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from fraud_detection_service import main  # noqa: E402
+from fraud_detection_service.batching import MicroBatcher  # noqa: E402
+
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+KINDS = ("low", "high", "repeat")
+DEFAULT_MIX = "low=0.6,high=0.2,repeat=0.2"
+# Plus grand est meilleur pour le débit, plus petit pour les latences
+HIGHER_IS_BETTER = {"throughput_rps": True, "p50_ms": False, "p95_ms": False, "p99_ms": False}
+REPEATED = [("Amazon", 49.99), ("Carrefour", 120.0), ("Netflix", 15.99), ("Zara", 89.5), ("Apple", 1299.0)]
+# Réglages du service qui changent les performances, enregistrés avec la référence
+SERVICE_SETTINGS = ("USE_COMPILED_FOREST", "FOLD_SCALER", "MICROBATCH_ENABLED", "SCORING_EXECUTOR",
+                    "SCORE_CACHE_SIZE", "DECISION_AWARE_SCORING")
+
+
+def parse_mix(text: str) -> dict:
+    """'low=0.6,high=0.2,repeat=0.2' -> proportions normalisées"""
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in KINDS:
+            raise ValueError(f"Type de requête inconnu: {kind} (attendu: {', '.join(KINDS)})")
+        mix[kind.strip()] = float(weight)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError("Le mélange doit avoir au moins un poids positif")
+    return {kind: weight / total for kind, weight in mix.items()}
+
+
+def make_requests(n_requests: int, mix: dict, seed: int = 0) -> list:
+    """[(type, corps JSON)], tirés de façon reproductible"""
+    rng = np.random.default_rng(seed)
+    kinds = rng.choice(list(mix), size=n_requests, p=list(mix.values()))
+    requests = []
+    for i, kind in enumerate(kinds.tolist()):
+        if kind == "low":
+            body = {"amount": round(float(rng.uniform(1, 500)), 2), "merchant": f"Marchand {rng.integers(1000)}"}
+        elif kind == "high":
+            body = {"amount": round(float(rng.uniform(5000, 150000)), 2), "merchant": f"M{rng.integers(100)}"}
+        else:
+            merchant, amount = REPEATED[int(rng.integers(len(REPEATED)))]
+            body = {"amount": amount, "merchant": merchant}
+        requests.append((kind, {"transaction_id": f"BENCH_{i}", "category": "Shopping", **body}))
+    return requests
+
+
+def summarize(latencies, elapsed: float = None) -> dict:
+    latencies_ms = np.asarray(latencies) * 1000.0
+    summary = {f"p{p}_ms": float(np.percentile(latencies_ms, p)) for p in (50, 95, 99)}
+    if elapsed is not None:
+        summary = {"throughput_rps": len(latencies) / elapsed, **summary}
+    return summary
+
+
+async def run_load(requests: list, concurrency: int) -> dict:
+    """Exécute les requêtes avec `concurrency` requêtes en vol; débit et latences, globaux et par type"""
+    if main.MICROBATCH_ENABLED:
+        # Pas de lifespan avec le transport ASGI: le micro-batcher est créé ici
+        main.batcher = MicroBatcher(main.run_scoring, main.MICROBATCH_MAX_SIZE, main.MICROBATCH_MAX_WAIT_MS)
+    transport = httpx.ASGITransport(app=main.app)
+    latencies = {kind: [] for kind in KINDS}
+    errors = 0
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                kind, body = queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.post("/predict", json=body)
+                latencies[kind].append(time.perf_counter() - start)
+                errors += response.status_code != 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    if main.batcher is not None:
+        await main.batcher.stop()
+        main.batcher = None
+
+    everything = [latency for kind in KINDS for latency in latencies[kind]]
+    return {**summarize(everything, elapsed), "errors": errors,
+            "by_kind": {kind: {"requests": len(values), **summarize(values)} for kind, values in latencies.items() if values}}
+
+
+def median_run(runs: list) -> dict:
+    """Médiane, métrique par métrique, de plusieurs exécutions (moins sensible au bruit)"""
+    result = {metric: float(np.median([run[metric] for run in runs])) for metric in HIGHER_IS_BETTER}
+    result["errors"] = sum(run["errors"] for run in runs)
+    result["by_kind"] = runs[len(runs) // 2]["by_kind"]
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Régressions au-delà de la tolérance relative: [(métrique, référence, mesure, écart relatif)]"""
+    regressions = []
+    for metric, higher_is_better in HIGHER_IS_BETTER.items():
+        reference, measured = baseline["results"][metric], results[metric]
+        change = (measured - reference) / reference if reference else 0.0
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append((metric, reference, measured, change))
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--runs", type=int, default=3, help="Exécutions mesurées (médiane)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", type=Path, help="Référence JSON à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Écart relatif toléré (0.15 = 15 %%)")
+    parser.add_argument("--save-baseline", type=Path, help="Enregistre les résultats comme référence")
+    args = parser.parse_args()
+
+    config = {"requests": args.requests, "concurrency": args.concurrency, "mix": parse_mix(args.mix), "seed": args.seed,
+              "settings": {**{name: getattr(main, name) for name in SERVICE_SETTINGS},
+                           "LOG_LEVEL": os.getenv("LOG_LEVEL", "INFO")}}
+    main.load_model()
+    # Sans lifespan, warm_start ne s'exécute pas: le scoring exige l'état prêt de /ready
+    main.ready = True
+    requests = make_requests(args.requests, config["mix"], args.seed)
+    # Chauffe: chargement paresseux, caches CPU, et cache des scores dans le même état à chaque exécution
+    asyncio.run(run_load(requests[:min(500, len(requests))], args.concurrency))
+
+    runs = []
+    for _ in range(args.runs):
+        if main.score_cache is not None:
+            main.score_cache.clear()
+        runs.append(asyncio.run(run_load(requests, args.concurrency)))
+    results = median_run(runs)
+
+    print(f"{args.requests} requêtes, concurrence {args.concurrency}, mix {args.mix}, médiane de {args.runs}")
+    print(f"{'type':<8} {'req':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for kind, stats in results["by_kind"].items():
+        print(f"{kind:<8} {stats['requests']:>6} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f}")
+    print(f"{'total':<8} {args.requests:>6} {results['p50_ms']:>8.2f} {results['p95_ms']:>8.2f} {results['p99_ms']:>8.2f}"
+          f"   {results['throughput_rps']:.0f} req/s, {results['errors']} erreurs")
+
+    if args.save_baseline and results["errors"]:
+        print(f"Référence non enregistrée: {results['errors']} erreurs", file=sys.stderr)
+        sys.exit(1)
+    if args.save_baseline:
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.save_baseline.write_text(json.dumps({
+            "benchmark": "load", "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(), "python": platform.python_version(), "machine": platform.machine(),
+            "cpu_count": os.cpu_count(), "config": config, "results": results,
+        }, indent=2) + "\n")
+        print(f"Référence enregistrée: {args.save_baseline}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline["config"] != json.loads(json.dumps(config)):
+            print("Attention: configuration différente de celle de la référence", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        for metric, reference, measured, change in regressions:
+            print(f"RÉGRESSION {metric}: {reference:.2f} -> {measured:.2f} ({change:+.1%})", file=sys.stderr)
+        if results["errors"] or regressions:
+            sys.exit(1)
+        print(f"Pas de régression au-delà de {args.tolerance:.0%} (référence {baseline['commit']})")
+
+
+if __name__ == "__main__":
+    main_cli()
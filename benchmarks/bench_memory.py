@@ -0,0 +1,92 @@
+"""
+Mémoire par worker selon le mode de chargement du modèle
+
+Démarre N processus (spawn, comme les workers uvicorn) qui chargent chacun le
+modèle puis restent vivants ensemble; la mémoire de chaque worker est lue dans
+/proc/<pid>/smaps_rollup (Linux). Le PSS répartit les pages partagées entre les
+processus qui les mappent: c'est la mesure qui montre ce que coûte un worker
+de plus.
+
+Modes:
+- pickle: joblib.load du Random Forest sklearn dans chaque worker
+- compiled: forêt compilée chargée en mémoire privée dans chaque worker
+- mmap: forêt compilée mappée en lecture seule (MODEL_MMAP=true)
+
+Usage:
+    python benchmarks/bench_memory.py [--workers 4] [--modes pickle compiled mmap]
+"""
+
+import argparse
+import multiprocessing
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+MODES = ("pickle", "compiled", "mmap")
+MEMORY_FIELDS = ("Rss", "Pss", "Shared_Clean", "Private_Clean", "Private_Dirty")
+
+
+def read_memory(pid="self") -> dict:
+    """Champs de /proc/<pid>/smaps_rollup, en Mo"""
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[0].rstrip(":") in MEMORY_FIELDS:
+                memory[parts[0].rstrip(":")] = int(parts[1]) / 1024.0
+    return memory
+
+
+def worker(mode: str, model_dir: str, ready, release):
+    """Charge le modèle, score une transaction puis attend que tous les workers soient mesurés"""
+    import warnings
+    warnings.filterwarnings("ignore")
+    from fraud_detection_service.model_bundle import ModelBundle
+
+    bundle = ModelBundle.load(model_dir, use_compiled=mode != "pickle", mmap=mode == "mmap")
+    bundle.predict_scores(bundle.feature_matrix([149.62], ["Amazon"]))
+    ready.put((multiprocessing.current_process().pid, bundle.model_type))
+    release.wait()
+
+
+def measure(mode: str, n_workers: int, model_dir: Path) -> list:
+    context = multiprocessing.get_context("spawn")
+    ready, release = context.Queue(), context.Event()
+    processes = [context.Process(target=worker, args=(mode, str(model_dir), ready, release)) for _ in range(n_workers)]
+    for process in processes:
+        process.start()
+    try:
+        pids = [ready.get(timeout=120)[0] for _ in processes]
+        return [read_memory(pid) for pid in pids]
+    finally:
+        release.set()
+        for process in processes:
+            process.join()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--model-dir", type=Path, default=Path(__file__).parent.parent / "ml_model" / "models")
+    args = parser.parse_args()
+
+    if not Path("/proc/self/smaps_rollup").exists():
+        sys.exit("smaps_rollup indisponible (Linux >= 4.14 requis)")
+
+    from fraud_detection_service.model_bundle import ensure_compiled
+    ensure_compiled(args.model_dir)
+
+    print(f"{'mode':<9} {'worker':>6} {'RSS Mo':>8} {'PSS Mo':>8} {'partagé':>8} {'privé':>8}")
+    for mode in args.modes:
+        results = measure(mode, args.workers, args.model_dir)
+        for i, memory in enumerate(results):
+            private = memory.get("Private_Clean", 0.0) + memory.get("Private_Dirty", 0.0)
+            print(f"{mode:<9} {i:>6} {memory['Rss']:>8.1f} {memory['Pss']:>8.1f} {memory.get('Shared_Clean', 0.0):>8.1f} {private:>8.1f}")
+        total_pss = sum(memory["Pss"] for memory in results)
+        print(f"{mode:<9} {'total':>6} {'':>8} {total_pss:>8.1f}   (PSS moyen par worker: {total_pss / len(results):.1f} Mo)")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,102 @@
+"""
+Point de bascule série / threads de predict_proba (Random Forest sklearn)
+
+Pour chaque taille de lot, mesure predict_proba en série puis avec 2, 4... threads
+joblib (jusqu'aux CPU alloués au processus: affinité et quota du cgroup), comme
+le fait le service pour les lots de INFERENCE_PARALLEL_MIN_ROWS lignes et plus.
+Le point de bascule est la plus petite taille à partir de laquelle le meilleur
+nombre de threads bat la série de plus de --margin pour tous les lots plus grands:
+c'est la valeur à donner à INFERENCE_PARALLEL_MIN_ROWS sur cette machine.
+
+Sous le point de bascule, le coût de répartition des arbres entre threads
+(et le GIL pendant la validation de chaque arbre) dépasse le gain.
+
+Usage:
+    python benchmarks/bench_parallel.py [--sizes 1,16,64,256,1024,4096,16384] [--jobs 1,2,4]
+"""
+
+import argparse
+import os
+import sys
+import warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+# Importé en premier: BLAS/OpenMP sur un thread, seuls les threads joblib varient
+from benchmarks.bench_stages import MODEL_DIR, measure, transactions  # noqa: E402
+from joblib import parallel_config  # noqa: E402
+
+from fraud_detection_service.executor import allocated_cpus, cgroup_cpu_quota  # noqa: E402
+from fraud_detection_service.model_bundle import ModelBundle  # noqa: E402
+
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+DEFAULT_SIZES = "1,16,64,256,1024,4096,16384"
+
+
+def default_jobs(cpus: int) -> list:
+    """1, 2, 4... jusqu'à cpus (inclus)"""
+    jobs = [1]
+    while jobs[-1] * 2 < cpus:
+        jobs.append(jobs[-1] * 2)
+    if cpus > 1:
+        jobs.append(cpus)
+    return jobs
+
+
+def crossover(timings: dict, margin: float):
+    """Plus petite taille de lot à partir de laquelle les threads gagnent pour tous les lots plus grands"""
+    point = None
+    for size in sorted(timings, reverse=True):
+        serial = timings[size][1]
+        best = min(median for jobs, median in timings[size].items() if jobs > 1) if len(timings[size]) > 1 else serial
+        if best >= serial * (1 - margin):
+            break
+        point = size
+    return point
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Tailles de lot, séparées par des virgules")
+    parser.add_argument("--jobs", help="Nombres de threads (défaut: 1, 2, 4... jusqu'aux CPU alloués)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.1, help="Durée min d'une répétition (s)")
+    parser.add_argument("--margin", type=float, default=0.05, help="Gain minimal des threads (0.05 = 5 %%)")
+    args = parser.parse_args()
+
+    cpus = allocated_cpus()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    jobs_list = [int(jobs) for jobs in args.jobs.split(",")] if args.jobs else default_jobs(cpus)
+    if 1 not in jobs_list:
+        jobs_list.insert(0, 1)
+    print(f"CPU hôte: {os.cpu_count()}, quota cgroup: {cgroup_cpu_quota() or 'aucun'}, CPU alloués: {cpus}")
+
+    bundle = ModelBundle.load(MODEL_DIR)
+    model = bundle.model
+    if not hasattr(model, "n_jobs"):
+        parser.error(f"Modèle sans n_jobs: {type(model).__name__}")
+    X = bundle.feature_matrix(*transactions(max(sizes)))
+
+    timings = {}
+    print(f"{'lot':>6} " + " ".join(f"{f'{jobs} thr. ms':>11}" for jobs in jobs_list) + f" {'meilleur':>9}")
+    for size in sizes:
+        timings[size] = {}
+        for jobs in jobs_list:
+            def predict(batch=X[:size], jobs=jobs):
+                with parallel_config(backend="threading", n_jobs=jobs):
+                    model.predict_proba(batch)
+            timings[size][jobs] = measure(predict, args.repeats, args.min_time)["median_us"] / 1000
+        best = min(timings[size], key=timings[size].get)
+        print(f"{size:>6} " + " ".join(f"{timings[size][jobs]:>11.2f}" for jobs in jobs_list)
+              + f" {f'x{timings[size][1] / timings[size][best]:.2f}':>9}")
+
+    point = crossover(timings, args.margin)
+    if point is None:
+        print("Pas de point de bascule: la série reste la plus rapide (INFERENCE_MAX_JOBS=1)")
+    else:
+        print(f"Point de bascule: {point} lignes -> INFERENCE_PARALLEL_MIN_ROWS={point}")
+
+
+if __name__ == "__main__":
+    main_cli()
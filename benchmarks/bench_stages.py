@@ -0,0 +1,192 @@
+"""
+Micro-benchmarks de chaque étape du pipeline de scoring, enregistrés par commit
+
+Étapes mesurées (une fonction chaude chacune, hors framework HTTP):
+- seed: graine MD5 d'une transaction (common.features.feature_seed)
+- features: vecteur de 29 features d'une transaction, puis matrice d'un lot de 256
+- scaler: scaler.transform (StandardScaler ajusté sur des features synthétiques
+  si le modèle n'a pas de scaler.pkl)
+- predict_proba: Random Forest sklearn et forêt compilée, lots de 1/16/256/4096
+- explain: score et contributions par feature (forêt compilée), lots de 1/16/256
+- to_dict: Transaction.to_dict du service de transaction
+- rules: cascade des règles métier (RuleSet.evaluate), 1 et 256 transactions
+
+Conditions contrôlées: un seul processus, BLAS/OpenMP et sklearn sur un thread
+(n_jobs=1), CPU épinglé avec --cpu, ramasse-miettes coupé pendant les mesures
+(timeit). Chaque mesure: chauffe, calibrage du nombre d'appels par répétition
+(>= --min-time), puis --repeats répétitions; le résumé est en µs par appel.
+
+Les résultats sont écrits dans benchmarks/results/stages-<commit>.json
+(suffixe -dirty si l'arbre de travail est modifié); --compare <commit|fichier>
+affiche le rapport des médianes avec une mesure précédente.
+
+Usage:
+    python benchmarks/bench_stages.py [--repeats 7] [--min-time 0.05] [--cpu 0] [--only predict_proba]
+    python benchmarks/bench_stages.py --compare a1199a1
+"""
+
+import os
+
+# Un seul thread de calcul: les mesures ne dépendent pas du nombre de coeurs libres
+for _variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_variable, "1")
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import platform  # noqa: E402
+import statistics  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import tempfile  # noqa: E402
+import timeit  # noqa: E402
+import warnings  # noqa: E402
+from datetime import datetime, timezone  # noqa: E402
+from pathlib import Path  # noqa: E402
+
+import numpy as np  # noqa: E402
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+# Transaction.to_dict ne touche pas la base, mais l'import du module crée l'engine
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench_stages.db'}")
+from common.features import feature_seed, generate_feature_matrix, generate_features  # noqa: E402
+from fraud_detection_service.model_bundle import ModelBundle  # noqa: E402
+from fraud_detection_service.rules import RuleSet  # noqa: E402
+from fraud_detection_service.tree_engine import CompiledForest  # noqa: E402
+
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+MODEL_DIR = ROOT / "ml_model" / "models"
+RESULTS_DIR = Path(__file__).parent / "results"
+PREDICT_BATCH_SIZES = (1, 16, 256, 4096)
+EXPLAIN_BATCH_SIZES = (1, 16, 256)
+
+
+def measure(fn, repeats: int, min_time: float) -> dict:
+    """Chauffe, calibre le nombre d'appels par répétition puis résume les temps par appel (µs)"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    # autorange vise 0,2 s: ramené à min_time par répétition
+    single = timer.timeit(number) / number
+    number = max(1, int(min_time / single)) if single > 0 else number
+    timer.timeit(number)
+    per_call = [t / number * 1e6 for t in timer.repeat(repeat=repeats, number=number)]
+    return {
+        "calls_per_repeat": number,
+        "repeats": repeats,
+        "min_us": min(per_call),
+        "median_us": statistics.median(per_call),
+        "mean_us": statistics.fmean(per_call),
+        "stdev_us": statistics.stdev(per_call) if len(per_call) > 1 else 0.0,
+        "max_us": max(per_call),
+    }
+
+
+def transactions(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    amounts = np.round(rng.lognormal(5, 2, n), 2).tolist()
+    merchants = [f"Marchand {i}" for i in rng.integers(0, 500, n).tolist()]
+    return amounts, merchants
+
+
+def build_benchmarks(bundle: ModelBundle) -> dict:
+    """Nom -> fonction sans argument, dans l'ordre du pipeline"""
+    from sklearn.preprocessing import StandardScaler
+    from transaction_service.models import Transaction
+
+    amounts, merchants = transactions(4096)
+    features = {size: bundle.feature_matrix(amounts[:size], merchants[:size]) for size in PREDICT_BATCH_SIZES}
+    scaler = bundle.scaler
+    if scaler is None:
+        scaler = StandardScaler().fit(features[4096])
+    rules = RuleSet.load()
+    transaction = Transaction(id=1, transaction_id="TXN_20260101120000_1234", user_id="user1", amount=149.62,
+                              merchant="Amazon", category="Shopping", description="Achat", status="APPROVED",
+                              is_fraud=False, fraud_score=0.1, confidence=0.1,
+                              created_at=datetime(2026, 1, 1, 12), updated_at=datetime(2026, 1, 1, 12, 0, 1))
+
+    benchmarks = {
+        "seed": lambda: feature_seed("Amazon", 149.62),
+        "features[1]": lambda: generate_features(149.62, "Amazon"),
+        "features[256]": lambda: generate_feature_matrix(amounts[:256], merchants[:256]),
+        "scaler[1]": lambda: scaler.transform(features[1]),
+        "scaler[256]": lambda: scaler.transform(features[256]),
+    }
+    model = bundle.model if hasattr(bundle.model, "estimators_") else None
+    compiled = bundle.compiled_forest
+    if compiled is None and model is not None:
+        compiled = CompiledForest.from_sklearn(model)
+    for size in PREDICT_BATCH_SIZES:
+        if model is not None:
+            benchmarks[f"predict_proba.sklearn[{size}]"] = lambda X=features[size]: model.predict_proba(X)
+        if compiled is not None:
+            benchmarks[f"predict_proba.compiled[{size}]"] = lambda X=features[size]: compiled.predict_proba(X)
+    if bundle.explainable:
+        bundle.get_explainer()  # construite hors mesure
+        for size in EXPLAIN_BATCH_SIZES:
+            benchmarks[f"explain[{size}]"] = lambda X=features[size]: bundle.explain(X)
+    benchmarks["to_dict"] = transaction.to_dict
+    benchmarks["rules[1]"] = lambda: rules.evaluate(amounts[:1], merchants[:1])
+    benchmarks["rules[256]"] = lambda: rules.evaluate(amounts[:256], merchants[:256])
+    return benchmarks
+
+
+def git_commit() -> str:
+    def git(*args):
+        return subprocess.run(["git", *args], capture_output=True, text=True, cwd=ROOT, check=True).stdout.strip()
+    try:
+        commit = git("rev-parse", "--short", "HEAD")
+        return commit + ("-dirty" if git("status", "--porcelain", "--untracked-files=no") else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_results(reference: str) -> dict:
+    path = Path(reference)
+    if not path.exists():
+        path = RESULTS_DIR / f"stages-{reference}.json"
+    return json.loads(path.read_text())
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.05, help="Durée min d'une répétition (s)")
+    parser.add_argument("--cpu", type=int, help="CPU sur lequel épingler le processus (Linux)")
+    parser.add_argument("--only", nargs="+", default=[], help="Préfixes des mesures à lancer (ex: predict_proba rules)")
+    parser.add_argument("--output-dir", type=Path, default=RESULTS_DIR)
+    parser.add_argument("--compare", help="Commit ou fichier de résultats de référence")
+    args = parser.parse_args()
+
+    if args.cpu is not None:
+        os.sched_setaffinity(0, {args.cpu})
+    # Bundle en série (max_jobs=1 par défaut): n_jobs=-1 du pickle ignoré
+    bundle = ModelBundle.load(MODEL_DIR)
+    benchmarks = build_benchmarks(bundle)
+    if args.only:
+        benchmarks = {name: fn for name, fn in benchmarks.items() if name.startswith(tuple(args.only))}
+
+    reference = load_results(args.compare)["results"] if args.compare else {}
+    results = {}
+    print(f"{'étape':<28} {'médiane µs':>11} {'min µs':>9} {'écart-type':>10}" + ("   vs réf." if reference else ""))
+    for name, fn in benchmarks.items():
+        results[name] = measure(fn, args.repeats, args.min_time)
+        line = f"{name:<28} {results[name]['median_us']:>11.1f} {results[name]['min_us']:>9.1f} {results[name]['stdev_us']:>10.1f}"
+        if name in reference:
+            line += f"   x{results[name]['median_us'] / reference[name]['median_us']:.2f}"
+        print(line)
+
+    commit = git_commit()
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    path = args.output_dir / f"stages-{commit}.json"
+    path.write_text(json.dumps({
+        "benchmark": "stages", "commit": commit, "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+        "cpu_count": os.cpu_count(), "cpu": args.cpu, "model_type": bundle.model_type, "model_version": bundle.version,
+        "scaler": "scaler.pkl" if bundle.scaler is not None else "synthetic", "results": results,
+    }, indent=2) + "\n")
+    print(f"Résultats: {path}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,64 @@
+"""
+Tests unitaires pour les benchmarks (benchmark de charge)
+"""
+
+import json
+import sys
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from common.features import FEATURE_NAMES
+from fraud_detection_service import main
+from .bench_load import compare, main_cli, make_requests, parse_mix
+
+
+def train_test_model(n_estimators=10, max_depth=6):
+    """Entraîne un petit Random Forest sur des données synthétiques (29 features)"""
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(500, len(FEATURE_NAMES)))
+    X[:, -1] = rng.exponential(2000, size=500)
+    y = ((X[:, 3] + X[:, 10] > 1.0) | (X[:, -1] > 6000)).astype(int)
+    model = RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth, random_state=0)
+    model.fit(X, y)
+    return model
+
+
+class TestLoadBenchmark:
+    """benchmarks/bench_load.py: mélange reproductible et détection des régressions"""
+
+    def test_requests_reproducible(self):
+        mix = parse_mix("low=3,high=1,repeat=0")
+        first, second = make_requests(200, mix, seed=1), make_requests(200, mix, seed=1)
+
+        assert mix == {"low": 0.75, "high": 0.25, "repeat": 0.0}
+        assert first == second
+        assert {kind for kind, _ in first} == {"low", "high"}
+        assert all(body["amount"] >= 5000 for kind, body in first if kind == "high")
+
+    def test_compare_against_baseline(self):
+        baseline = {"results": {"throughput_rps": 1000.0, "p50_ms": 2.0, "p95_ms": 4.0, "p99_ms": 8.0}}
+        within = {"throughput_rps": 900.0, "p50_ms": 2.2, "p95_ms": 3.0, "p99_ms": 9.0}
+        slower = {"throughput_rps": 800.0, "p50_ms": 2.0, "p95_ms": 5.0, "p99_ms": 8.0}
+
+        assert compare(within, baseline, tolerance=0.15) == []
+        assert [metric for metric, *_ in compare(slower, baseline, tolerance=0.15)] == ["throughput_rps", "p95_ms"]
+
+    def test_end_to_end_against_app(self, tmp_path, monkeypatch):
+        """Le script complet sur l'application (démarrage comme en CLI): aucune erreur, référence enregistrée"""
+        joblib.dump(train_test_model(), tmp_path / main.MODEL_FILE)
+        monkeypatch.setattr(main, "MODEL_DIR", tmp_path)
+        monkeypatch.setattr(main, "bundle", None)
+        monkeypatch.setattr(main, "ready", False)
+        baseline = tmp_path / "load.json"
+        monkeypatch.setattr(sys, "argv", ["bench_load.py", "--requests", "60", "--concurrency", "4", "--runs", "1",
+                                          "--save-baseline", str(baseline)])
+        main_cli()
+
+        saved = json.loads(baseline.read_text())
+        assert saved["results"]["errors"] == 0
+        assert sum(stats["requests"] for stats in saved["results"]["by_kind"].values()) == 60
+
+        # Même exécution comparée à sa propre référence: pas de sortie en erreur
+        monkeypatch.setattr(sys, "argv", ["bench_load.py", "--requests", "60", "--concurrency", "4", "--runs", "1",
+                                          "--baseline", str(baseline), "--tolerance", "100"])
+        main_cli()
@@ -0,0 +1,3 @@
+"""
+Code partagé entre les services (transaction, détection de fraude)
+"""
@@ -0,0 +1,89 @@
+"""
+Sérialisation JSON rapide et validation des corps depuis les octets bruts (services FastAPI)
+
+- FastJSONResponse: réponse par défaut, encodée avec orjson (datetime, UUID,
+  tableaux NumPy gérés nativement); sans orjson, repli sur json avec les dates
+  en ISO 8601. Un endpoint qui retourne directement FastJSONResponse(...) évite
+  aussi jsonable_encoder, l'encodeur générique de FastAPI.
+- RawBodyRoute: pour un corps JSON décrit par un seul modèle Pydantic, la
+  validation se fait directement sur les octets (model_validate_json), sans
+  dict intermédiaire. En cas d'erreur, FastAPI reprend son chemin habituel:
+  les réponses 422 sont identiques.
+"""
+
+import json
+from datetime import date, datetime, time
+from typing import Any, Callable, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, ValidationError
+from starlette.responses import Response
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+def _default(obj: Any):
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Type non sérialisable en JSON: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content en JSON compact (UTF-8)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def is_json(content_type: Optional[str]) -> bool:
+    """Même règle que FastAPI: pas de Content-Type, application/json ou application/*+json"""
+    if not content_type:
+        return True
+    maintype, _, subtype = content_type.split(";", 1)[0].strip().lower().partition("/")
+    return maintype == "application" and (subtype == "json" or subtype.endswith("+json"))
+
+
+class RawBodyRoute(APIRoute):
+    """Route dont le corps JSON est validé directement depuis les octets reçus"""
+
+    def body_model(self) -> Optional[type]:
+        """Modèle Pydantic du corps s'il est l'unique paramètre de corps (non embed), sinon None"""
+        body_params = self.dependant.body_params
+        if len(body_params) != 1 or getattr(body_params[0].field_info, "embed", None):
+            return None
+        annotation = body_params[0].field_info.annotation
+        return annotation if isinstance(annotation, type) and issubclass(annotation, BaseModel) else None
+
+    def get_route_handler(self) -> Callable:
+        # Appelée par APIRoute.__init__, une fois self.dependant construit
+        handler = super().get_route_handler()
+        body_model = self.body_model()
+        if body_model is None:
+            return handler
+
+        async def route_handler(request: Request) -> Response:
+            if not hasattr(request, "_json") and is_json(request.headers.get("content-type")):
+                body = await request.body()
+                if body:
+                    try:
+                        # FastAPI relit request.json(): l'instance validée passe telle quelle
+                        request._json = body_model.model_validate_json(body)
+                    except ValidationError:
+                        pass
+            return await handler(request)
+
+        return route_handler
@@ -0,0 +1,95 @@
+"""
+Génération des features synthétiques (V1-V28 + Amount) d'une transaction
+
+Les features sont une fonction pure de (merchant, amount): la graine est
+dérivée du hash MD5 de "{merchant}_{amount}" et chaque graine a son propre
+np.random.Generator (pas de np.random.seed global, donc thread-safe).
+Le service de transaction et le service de détection utilisent ce module et
+obtiennent exactement les mêmes valeurs.
+"""
+
+import hashlib
+from functools import lru_cache
+from typing import Sequence
+
+import numpy as np
+
+FEATURE_NAMES = [f'V{i}' for i in range(1, 29)] + ['Amount']
+N_COMPONENTS = 28
+N_SEEDS = 10000
+
+# Montant au-delà duquel V4, V11, V12 et V14 prennent des valeurs extrêmes
+SUSPICIOUS_AMOUNT = 5000
+SUSPICIOUS_COLUMNS = np.array([3, 10, 11, 13])  # V4, V11, V12, V14
+
+
+def feature_seed(merchant: str, amount: float) -> int:
+    """Graine déterministe d'une transaction (MD5 de "{merchant}_{amount}")"""
+    return int(hashlib.md5(f"{merchant}_{float(amount)}".encode()).hexdigest(), 16) % N_SEEDS
+
+
+@lru_cache(maxsize=N_SEEDS)
+def _seed_draws(seed: int) -> np.ndarray:
+    """Tirages d'une graine: 28 normales puis 4 valeurs extrêmes signées"""
+    rng = np.random.default_rng(seed)
+    draws = np.empty(N_COMPONENTS + len(SUSPICIOUS_COLUMNS))
+    draws[:N_COMPONENTS] = rng.standard_normal(N_COMPONENTS)
+    draws[N_COMPONENTS:] = rng.uniform(2, 4, len(SUSPICIOUS_COLUMNS)) * rng.choice([1.0, -1.0], len(SUSPICIOUS_COLUMNS))
+    draws.flags.writeable = False
+    return draws
+
+
+def feature_seeds(amounts: Sequence[float], merchants: Sequence[str]) -> np.ndarray:
+    """Graines d'un lot de transactions (une par transaction)"""
+    return np.fromiter((feature_seed(merchant, amount) for merchant, amount in zip(merchants, amounts)),
+                       dtype=np.int64, count=len(amounts))
+
+
+def features_from_seeds(seeds: np.ndarray, amounts: Sequence[float]) -> np.ndarray:
+    """
+    Assemble la matrice N x 29 (ordre FEATURE_NAMES, float32) à partir des graines
+
+    Les tirages sont calculés une fois par graine distincte, puis la matrice
+    est assemblée en une seule passe vectorisée.
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    if len(seeds) == 1:
+        return generate_features_from_seed(int(seeds[0]), float(amounts[0])).reshape(1, -1)
+
+    unique_seeds, inverse = np.unique(seeds, return_inverse=True)
+    draws = np.stack([_seed_draws(int(seed)) for seed in unique_seeds])[inverse.reshape(-1)]
+
+    features = np.empty((len(amounts), len(FEATURE_NAMES)), dtype=np.float32)
+    features[:, :N_COMPONENTS] = draws[:, :N_COMPONENTS]
+
+    suspicious = amounts > SUSPICIOUS_AMOUNT
+    features[np.ix_(suspicious, SUSPICIOUS_COLUMNS)] = draws[suspicious, N_COMPONENTS:]
+    features[:, N_COMPONENTS] = amounts
+    return features
+
+
+def generate_feature_matrix(amounts: Sequence[float], merchants: Sequence[str]) -> np.ndarray:
+    """Génère la matrice N x 29 (ordre FEATURE_NAMES, float32) d'un lot de transactions"""
+    amounts = np.asarray(amounts, dtype=np.float64)
+    return features_from_seeds(feature_seeds(amounts.tolist(), merchants), amounts)
+
+
+def generate_features(amount: float, merchant: str) -> np.ndarray:
+    """Vecteur de 29 features (ordre FEATURE_NAMES, float32) d'une transaction"""
+    return generate_features_from_seed(feature_seed(merchant, amount), amount)
+
+
+def generate_features_from_seed(seed: int, amount: float) -> np.ndarray:
+    draws = _seed_draws(seed)
+    features = np.empty(len(FEATURE_NAMES), dtype=np.float32)
+    features[:N_COMPONENTS] = draws[:N_COMPONENTS]
+    if amount > SUSPICIOUS_AMOUNT:
+        features[SUSPICIOUS_COLUMNS] = draws[N_COMPONENTS:]
+    features[N_COMPONENTS] = amount
+    return features
+
+
+@lru_cache(maxsize=32)
+def column_order(feature_columns: tuple) -> np.ndarray:
+    """Index des colonnes de FEATURE_NAMES dans l'ordre attendu par le modèle"""
+    return np.array([FEATURE_NAMES.index(column) for column in feature_columns])
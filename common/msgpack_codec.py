@@ -0,0 +1,56 @@
+"""
+Encodage MessagePack des échanges entre services (application/msgpack)
+
+Optionnel: sans le paquet msgpack, MSGPACK_AVAILABLE est False, le service de
+détection refuse les corps msgpack (415) et répond en JSON, et les clients
+restent en JSON. Le JSON reste le format par défaut (navigateurs, tests).
+"""
+
+import json
+from typing import Any, Optional
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    """Content-Type msgpack (paramètres ignorés)"""
+    return bool(content_type) and content_type.split(";", 1)[0].strip().lower() in MSGPACK_MEDIA_TYPES
+
+
+def accepts_msgpack(accept: Optional[str]) -> bool:
+    """L'en-tête Accept demande explicitement msgpack (et le paquet est installé)"""
+    if not MSGPACK_AVAILABLE or not accept:
+        return False
+    return any(is_msgpack(media_range) and not media_range.replace(" ", "").endswith(";q=0")
+               for media_range in accept.split(","))
+
+
+def packb(obj: Any) -> bytes:
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def unpackb(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False)
+
+
+def request_options(payload: Any, use_msgpack: bool) -> dict:
+    """Arguments httpx (content/json, headers) pour envoyer payload en msgpack ou en JSON"""
+    if use_msgpack and MSGPACK_AVAILABLE:
+        return {"content": packb(payload),
+                "headers": {"Content-Type": MSGPACK_MEDIA_TYPE, "Accept": MSGPACK_MEDIA_TYPE}}
+    return {"json": payload, "headers": {}}
+
+
+def decode_response(response) -> Any:
+    """Corps d'une réponse httpx selon son Content-Type (msgpack ou JSON)"""
+    if is_msgpack(response.headers.get("content-type")):
+        return unpackb(response.content)
+    return json.loads(response.content)
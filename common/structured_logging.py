@@ -0,0 +1,246 @@
+"""
+Logs structurés (une ligne JSON par événement) écrits hors du chemin des requêtes
+
+Le code des services appelle le module logging standard. Le handler du
+service ne fait que déposer l'enregistrement dans une file bornée
+(put_nowait); un QueueListener formate en JSON et écrit sur stdout depuis un
+thread dédié. Si la file est pleine, l'enregistrement est abandonné et compté:
+une requête n'attend jamais une écriture.
+
+Avant la mise en file, des filtres peu coûteux:
+- request_id: identifiant de la requête courante (contextvar, en-tête X-Request-ID)
+- échantillonnage des événements INFO marqués extra={"sample": True}
+- limite de débit par niveau (enregistrements par seconde)
+
+Configuration par variables d'environnement: LOG_LEVEL, LOG_SAMPLE_RATE,
+LOG_RATE_LIMITS (ex: "INFO=200,WARNING=50"), LOG_QUEUE_SIZE.
+"""
+
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+REQUEST_ID_HEADER = "x-request-id"
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# Attributs d'un LogRecord standard: tout le reste vient de extra={...}
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sample"}
+
+_listeners: Dict[str, logging.handlers.QueueListener] = {}
+_lock = threading.Lock()
+
+
+def parse_rate_limits(value: Optional[str]) -> Dict[int, float]:
+    """Parse "INFO=200,WARNING=50" en {logging.INFO: 200.0, logging.WARNING: 50.0}"""
+    limits = {}
+    for part in (value or "").split(","):
+        if "=" not in part:
+            continue
+        level, rate = part.split("=", 1)
+        limits[logging.getLevelName(level.strip().upper())] = float(rate)
+    return limits
+
+
+class RequestIdFilter(logging.Filter):
+    """Ajoute request_id à l'enregistrement (lu dans le contexte de l'appelant)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Garde une fraction des événements INFO marqués extra={"sample": True}"""
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0 or record.levelno != logging.INFO or not getattr(record, "sample", False):
+            return True
+        if random.random() < self.rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Seau à jetons par niveau: au plus `rate` enregistrements par seconde
+    Le premier enregistrement accepté après des suppressions porte leur nombre (suppressed).
+    """
+
+    def __init__(self, limits: Dict[int, float]):
+        super().__init__()
+        self.limits = limits
+        self._buckets = {level: [rate, time.monotonic()] for level, rate in limits.items()}
+        self._suppressed = {level: 0 for level in limits}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.limits.get(record.levelno)
+        if rate is None:
+            return True
+        with self._lock:
+            bucket = self._buckets[record.levelno]
+            now = time.monotonic()
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1.0:
+                self._suppressed[record.levelno] += 1
+                return False
+            bucket[0] -= 1.0
+            suppressed, self._suppressed[record.levelno] = self._suppressed[record.levelno], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par enregistrement (exécuté dans le thread du listener)"""
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler qui abandonne l'enregistrement si la file est pleine"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Instantané au moment de l'appel, comme QueueHandler.prepare: msg % args et les
+        # conteneurs passés en extra peuvent être modifiés avant que le listener formate.
+        # Le JSON et le traceback restent formatés par le listener.
+        record.msg = record.getMessage()
+        record.args = None
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and isinstance(value, (dict, list, set)):
+                setattr(record, key, value.copy())
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(service: str, level: Optional[str] = None, sample_rate: Optional[float] = None,
+                      rate_limits: Optional[Dict[int, float]] = None, queue_size: Optional[int] = None,
+                      stream=None) -> logging.Logger:
+    """
+    Configure le logger `service` (et ses enfants `service.xxx`), idempotent par service
+
+    Returns:
+        Le logger du service
+    """
+    logger = logging.getLogger(service)
+    with _lock:
+        if service in _listeners:
+            return logger
+
+        level = level or os.getenv("LOG_LEVEL", "INFO")
+        sample_rate = float(os.getenv("LOG_SAMPLE_RATE", "1.0")) if sample_rate is None else sample_rate
+        rate_limits = parse_rate_limits(os.getenv("LOG_RATE_LIMITS")) if rate_limits is None else rate_limits
+        queue_size = int(os.getenv("LOG_QUEUE_SIZE", "10000")) if queue_size is None else queue_size
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter(service))
+
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+        handler.addFilter(RequestIdFilter())
+        handler.addFilter(SamplingFilter(sample_rate))
+        if rate_limits:
+            handler.addFilter(RateLimitFilter(rate_limits))
+
+        listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=False)
+        listener.start()
+        _listeners[service] = listener
+
+        logger.handlers = [handler]
+        logger.setLevel(level.upper())
+        logger.propagate = False
+    return logger
+
+
+@atexit.register
+def shutdown_logging(service: Optional[str] = None):
+    """Vide les files et arrête les threads d'écriture (d'un service ou de tous)"""
+    with _lock:
+        services = [service] if service is not None else list(_listeners)
+        for name in services:
+            listener = _listeners.pop(name, None)
+            if listener is not None:
+                listener.stop()
+                logging.getLogger(name).handlers = []
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+class RequestIdMiddleware:
+    """
+    Middleware ASGI: reprend l'en-tête X-Request-ID (ou en génère un), le place
+    dans le contexte des logs et le renvoie dans la réponse
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or new_request_id()
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER.encode(), request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
@@ -0,0 +1,164 @@
+"""
+Micro-batching dynamique des requêtes /predict
+
+Les requêtes concurrentes sont mises en file d'attente puis scorées ensemble
+en une seule inférence dès que MICROBATCH_MAX_SIZE requêtes sont en attente
+ou que MICROBATCH_MAX_WAIT_MS s'est écoulé depuis la première.
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, List, Optional
+
+# Bornes des buckets de l'histogramme des tailles de lot (1, 2, 4, ... 1024)
+BATCH_SIZE_BUCKETS = [2 ** i for i in range(11)]
+
+
+class MicroBatcher:
+    """Agrège les appels concurrents en lots pour une fonction de scoring vectorisée"""
+
+    def __init__(self, score_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 64, max_wait_ms: float = 2.0):
+        """
+        Args:
+            score_fn: Fonction (ou coroutine) qui score une liste d'éléments
+                et retourne une liste de résultats dans le même ordre
+            max_batch_size: Taille maximale d'un lot
+            max_wait_ms: Attente maximale (ms) après la première requête d'un lot
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size doit être >= 1")
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Lot en cours de constitution ou de scoring, échoué par stop() s'il est interrompu
+        self._batch: list = []
+
+        # Métriques
+        self.batches = 0
+        self.items = 0
+        self.max_observed_batch = 0
+        self.flush_on_size = 0
+        self.flush_on_timeout = 0
+        self.batch_size_histogram = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    def start(self):
+        """Démarre la boucle de traitement dans la boucle asyncio courante"""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def stop(self):
+        """
+        Arrête la boucle de traitement
+
+        Les appelants encore en attente (lot interrompu et file) reçoivent une
+        RuntimeError au lieu de rester bloqués jusqu'au timeout du client.
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        pending = self._batch
+        self._batch = []
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Micro-batcher arrêté"))
+
+    async def submit(self, item: Any) -> Any:
+        """Ajoute un élément au prochain lot et attend son résultat"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _collect(self) -> list:
+        """Attend la première requête puis remplit le lot jusqu'à la taille ou au délai max"""
+        batch = self._batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        if len(batch) >= self.max_batch_size:
+            self.flush_on_size += 1
+        else:
+            self.flush_on_timeout += 1
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Les requêtes annulées (client déconnecté) ne sont pas scorées
+            batch = self._batch = [(item, future) for item, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+
+            self._record(len(batch))
+            try:
+                results = await self._score([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._batch = []
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            self._batch = []
+
+    async def _score(self, items: List[Any]) -> List[Any]:
+        if asyncio.iscoroutinefunction(self.score_fn):
+            return await self.score_fn(items)
+        return self.score_fn(items)
+
+    def _record(self, size: int):
+        self.batches += 1
+        self.items += size
+        self.max_observed_batch = max(self.max_observed_batch, size)
+        for i, bound in enumerate(BATCH_SIZE_BUCKETS):
+            if size <= bound:
+                self.batch_size_histogram[i] += 1
+                break
+        else:
+            self.batch_size_histogram[-1] += 1
+
+    def stats(self) -> dict:
+        """Métriques sur les lots effectivement formés"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_observed_batch_size": self.max_observed_batch,
+            "flush_on_size": self.flush_on_size,
+            "flush_on_timeout": self.flush_on_timeout,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "batch_size_histogram": {
+                **{f"le_{bound}": count for bound, count in zip(BATCH_SIZE_BUCKETS, self.batch_size_histogram)},
+                "le_inf": self.batch_size_histogram[-1],
+            },
+        }
@@ -0,0 +1,86 @@
+"""
+Cache LRU/TTL des scores
+
+Le score d'une transaction est une fonction pure de (merchant, amount) pour
+un modèle donné: les features sont dérivées du MD5 de "{merchant}_{amount}".
+Les entrées sont indexées par (version du modèle, merchant, amount), donc un
+nouveau modèle ne relit jamais les scores de l'ancien.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class ScoreCache:
+    """Cache LRU borné en taille, avec expiration optionnelle, thread-safe"""
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 0.0):
+        """
+        Args:
+            max_size: Nombre max d'entrées (éviction LRU au-delà)
+            ttl_seconds: Durée de vie d'une entrée (0 = pas d'expiration)
+        """
+        if max_size < 1:
+            raise ValueError("max_size doit être >= 1")
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Retourne la valeur en cache ou None (et la marque comme récemment utilisée)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Invalide toutes les entrées (rechargement du modèle)"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
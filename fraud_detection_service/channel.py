@@ -0,0 +1,160 @@
+"""
+Canal WebSocket de scoring pour les producteurs à haut débit (/ws/predict)
+
+Une trame contient une transaction (objet) ou plusieurs (tableau); chaque
+transaction porte un identifiant de corrélation "id" choisi par le client, repris
+dans sa réponse. La réponse à une trame a la même forme (objet ou tableau, dans
+l'ordre de la trame) et le même encodage: texte JSON, ou binaire msgpack.
+
+Les trames sont traitées concurremment quand concurrent=True (micro-batching
+actif): leurs réponses peuvent arriver dans un autre ordre que les requêtes.
+Fenêtre bornée: au plus max_in_flight transactions en cours; au-delà, le canal
+cesse de lire la socket jusqu'à ce que des réponses partent (contre-pression
+TCP jusqu'au client).
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+from pydantic import BaseModel, ValidationError
+from starlette.websockets import WebSocket
+
+from common.fast_json import dumps
+from common.msgpack_codec import MSGPACK_AVAILABLE, packb, unpackb
+
+logger = logging.getLogger("fraud_detection_service.channel")
+
+
+class ScoringChannel:
+    """Lecture des trames, fenêtre de transactions en cours et réponses corrélées pour une connexion"""
+
+    def __init__(self, websocket: WebSocket, validate: Callable[[Any], BaseModel],
+                 score: Callable[[List[BaseModel]], Awaitable[List[BaseModel]]], max_in_flight: int = 256,
+                 concurrent: bool = False, on_scored: Optional[Callable[[list, list, float], Awaitable[None]]] = None):
+        """
+        Args:
+            websocket: Connexion déjà acceptée
+            validate: Construit une transaction depuis un objet décodé (lève ValidationError)
+            score: Coroutine qui score une liste de transactions (résultats dans le même ordre)
+            max_in_flight: Nombre max de transactions reçues dont la réponse n'est pas partie
+            concurrent: Traite les trames en parallèle (réponses dans le désordre possible)
+            on_scored: Appelée après l'envoi de chaque réponse (transactions, résultats, durée en s),
+                aussi quand le scoring échoue (résultats vides)
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight doit être >= 1")
+        self.websocket = websocket
+        self.validate = validate
+        self.score = score
+        self.max_in_flight = max_in_flight
+        self.concurrent = concurrent
+        self.on_scored = on_scored
+        self._window = asyncio.Semaphore(max_in_flight)
+        self._send_lock = asyncio.Lock()
+        self._tasks = set()
+        self.in_flight = 0
+
+        self.frames = 0
+        self.scored = 0
+        self.errors = 0
+        self.max_observed_in_flight = 0
+
+    async def run(self):
+        """Traite les trames jusqu'à la déconnexion du client"""
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                binary = message.get("bytes") is not None
+                try:
+                    items, single = self._decode(message, binary)
+                except ValueError as e:
+                    self.errors += 1
+                    await self._send({"id": None, "error": str(e)}, binary)
+                    continue
+
+                self.frames += 1
+                for _ in items:
+                    await self._window.acquire()
+                self.in_flight += len(items)
+                self.max_observed_in_flight = max(self.max_observed_in_flight, self.in_flight)
+                if self.concurrent:
+                    task = asyncio.create_task(self._handle(items, single, binary))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                else:
+                    await self._handle(items, single, binary)
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+
+    def _decode(self, message: dict, binary: bool):
+        """(objets décodés, True si la trame était un objet seul)"""
+        if binary and not MSGPACK_AVAILABLE:
+            raise ValueError("Trames binaires (msgpack) non supportées: paquet msgpack absent")
+        try:
+            payload = unpackb(message["bytes"]) if binary else json.loads(message["text"])
+        except Exception as e:
+            raise ValueError(f"Trame illisible: {str(e) or type(e).__name__}")
+        if isinstance(payload, dict):
+            return [payload], True
+        if not isinstance(payload, list) or not payload:
+            raise ValueError("Trame attendue: un objet transaction ou un tableau non vide d'objets")
+        if len(payload) > self.max_in_flight:
+            raise ValueError(f"Trame de {len(payload)} transactions (max {self.max_in_flight})")
+        return payload, False
+
+    async def _handle(self, items: list, single: bool, binary: bool):
+        started = time.perf_counter()
+        transactions, results = [], []
+        try:
+            responses: List[Optional[dict]] = [None] * len(items)
+            positions = []
+            for i, item in enumerate(items):
+                try:
+                    transactions.append(self.validate(item))
+                    positions.append(i)
+                except ValidationError as e:
+                    self.errors += 1
+                    responses[i] = {"id": item.get("id") if isinstance(item, dict) else None, "error": "; ".join(
+                        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors())}
+
+            try:
+                results = await self.score(transactions) if transactions else []
+            except Exception as e:
+                logger.exception("Erreur de scoring sur le canal WebSocket")
+                self.errors += len(positions)
+                for i in positions:
+                    responses[i] = {"id": items[i].get("id"), "error": f"Erreur ML: {e}"}
+            for i, result in zip(positions, results):
+                responses[i] = {"id": items[i].get("id"), **result.model_dump()}
+            self.scored += len(results)
+
+            await self._send(responses[0] if single else responses, binary)
+        except Exception:
+            # Connexion fermée pendant l'envoi: la trame est perdue, le canal s'arrête à la lecture suivante
+            if self.concurrent:
+                logger.debug("Réponse WebSocket non envoyée", exc_info=True)
+                return
+            raise
+        finally:
+            self.in_flight -= len(items)
+            for _ in items:
+                self._window.release()
+        if self.on_scored is not None and transactions:
+            await self.on_scored(transactions, results, time.perf_counter() - started)
+
+    async def _send(self, payload: Any, binary: bool):
+        async with self._send_lock:
+            if binary and MSGPACK_AVAILABLE:
+                await self.websocket.send_bytes(packb(payload))
+            else:
+                await self.websocket.send_text(dumps(payload).decode("utf-8"))
+
+    def stats(self) -> dict:
+        return {"frames": self.frames, "scored": self.scored, "errors": self.errors,
+                "max_in_flight": self.max_in_flight, "max_observed_in_flight": self.max_observed_in_flight}
@@ -0,0 +1,160 @@
+"""
+Couche d'exécution du pipeline de scoring
+
+Le scoring (hash MD5, génération des features, scaler, predict_proba) est
+CPU-bound: exécuté directement dans la boucle asyncio, il bloque /health et
+toutes les autres requêtes du worker. Trois modes sont disponibles:
+
+- inline: exécution dans la boucle asyncio (comportement historique)
+- thread: pool de threads (NumPy et sklearn relâchent le GIL)
+- process: pool de processus, le modèle est préchargé dans chaque enfant
+"""
+
+import asyncio
+import contextvars
+import functools
+import math
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional
+
+EXECUTOR_MODES = ("inline", "thread", "process")
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+
+def parse_cpu_list(value: Optional[str]) -> List[int]:
+    """Parse une liste de CPU au format "0,1,4-7" """
+    cpus = []
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def cgroup_cpu_quota(root: Path = CGROUP_ROOT) -> Optional[float]:
+    """Quota CPU du cgroup en nombre de CPU (cgroup v2 cpu.max, ou v1 cfs_quota_us), None si illimité"""
+    try:
+        quota, period = (root / "cpu.max").read_text().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        quota = int((root / "cpu" / "cpu.cfs_quota_us").read_text())
+        period = int((root / "cpu" / "cpu.cfs_period_us").read_text())
+    except (OSError, ValueError):
+        return None
+    return quota / period if quota > 0 and period > 0 else None
+
+
+def allocated_cpus(root: Path = CGROUP_ROOT) -> int:
+    """
+    CPU réellement utilisables par le processus: affinité, bornée par le quota du cgroup
+
+    Dans un conteneur limité (docker --cpus, limits Kubernetes), os.cpu_count()
+    retourne les CPU de l'hôte: dimensionner un pool dessus sur-souscrit le quota.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    quota = cgroup_cpu_quota(root)
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+
+def _pin_to_next_cpu(cpu_queue):
+    # Chaque worker prend un CPU de la liste (round robin via la file partagée)
+    cpu = cpu_queue.get()
+    cpu_queue.put(cpu)
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+
+
+def _init_worker(cpu_queue, preload: Optional[Callable]):
+    """Initialisation d'un worker: affinité CPU puis préchargement du modèle"""
+    if cpu_queue is not None:
+        _pin_to_next_cpu(cpu_queue)
+    if preload is not None:
+        preload()
+
+
+class ScoringExecutor:
+    """Exécute une fonction de scoring selon le mode configuré"""
+
+    def __init__(self, mode: str = "inline", workers: Optional[int] = None,
+                 cpu_affinity: Optional[List[int]] = None, preload: Optional[Callable] = None):
+        """
+        Args:
+            mode: inline, thread ou process
+            workers: Taille du pool (par défaut: nombre de CPU alloués)
+            cpu_affinity: CPU sur lesquels épingler les workers (un CPU par worker)
+            preload: Fonction appelée dans chaque processus enfant pour charger le modèle
+        """
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Mode d'exécution inconnu: {mode} (attendu: {', '.join(EXECUTOR_MODES)})")
+        self.mode = mode
+        self.cpu_affinity = list(cpu_affinity or [])
+        self.workers = workers or len(self.cpu_affinity) or allocated_cpus()
+        self._pool = None
+
+        if mode == "inline":
+            return
+
+        if mode == "thread":
+            cpu_queue = self._cpu_queue()
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="scoring",
+                initializer=_init_worker if cpu_queue is not None else None,
+                initargs=(cpu_queue, None) if cpu_queue is not None else (),
+            )
+        else:
+            # spawn: pas de fork d'un processus déjà multi-threadé (uvicorn, pool)
+            context = multiprocessing.get_context("spawn")
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._cpu_queue(context), preload),
+            )
+
+    def _cpu_queue(self, context=None):
+        if not self.cpu_affinity:
+            return None
+        cpu_queue = context.Queue() if context is not None else queue.Queue()
+        for cpu in self.cpu_affinity:
+            cpu_queue.put(cpu)
+        return cpu_queue
+
+    async def run(self, fn: Callable, *args):
+        """Exécute fn(*args) sans bloquer la boucle asyncio (sauf en mode inline)"""
+        if self._pool is None:
+            return fn(*args)
+        if self.mode == "thread":
+            # Le thread reprend le contexte de la requête (request_id des logs)
+            fn = functools.partial(contextvars.copy_context().run, fn)
+        return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+    def warmup(self, fn: Callable, *args):
+        """Exécute fn(*args) une fois par worker pour démarrer tout le pool"""
+        if self._pool is None:
+            return
+        futures = [self._pool.submit(fn, *args) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def shutdown(self, wait: bool = True):
+        """Arrête le pool (wait=False: les tâches en cours terminent en arrière-plan)"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=wait)
+            self._pool = None
+
+    def describe(self) -> dict:
+        return {"mode": self.mode, "workers": self.workers if self.mode != "inline" else 0, "cpu_affinity": self.cpu_affinity}
@@ -1,19 +1,62 @@
-from fastapi import FastAPI, HTTPException
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Header, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import Optional
-import joblib
-import numpy as np
+from fastapi.responses import PlainTextResponse, Response
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from typing import Optional, List
+import asyncio
 import json
+import numpy as np
 from pathlib import Path
 import os
-import hashlib
+import sys
+import threading
+try:
+    from common.features import feature_seeds
+except ImportError:
+    # Lancement depuis le dossier du service (uvicorn main:app): code partagé à la racine du dépôt
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from common.features import feature_seeds
+from common.fast_json import FastJSONResponse
+from common.structured_logging import RequestIdMiddleware, configure_logging
+try:
+    from .batching import MicroBatcher
+    from .cache import ScoreCache
+    from .channel import ScoringChannel
+    from .executor import ScoringExecutor, allocated_cpus, parse_cpu_list
+    from .metrics import Registry, StageTimer, sample_lines
+    from .model_bundle import ModelBundle, COMPILED_DIR, FEATURES_FILE, MODEL_FILE, SCALER_FILE
+    from .negotiation import MsgpackRoute, encode_result
+    from .rules import DEFAULT_RULES_PATH, RuleSet
+    from .shadow import ShadowScorer
+    from .streaming import NDJSON_MEDIA_TYPE, RequestStreamingResponse, is_csv, iter_records
+except ImportError:
+    from batching import MicroBatcher
+    from cache import ScoreCache
+    from channel import ScoringChannel
+    from executor import ScoringExecutor, allocated_cpus, parse_cpu_list
+    from metrics import Registry, StageTimer, sample_lines
+    from model_bundle import ModelBundle, COMPILED_DIR, FEATURES_FILE, MODEL_FILE, SCALER_FILE
+    from negotiation import MsgpackRoute, encode_result
+    from rules import DEFAULT_RULES_PATH, RuleSet
+    from shadow import ShadowScorer
+    from streaming import NDJSON_MEDIA_TYPE, RequestStreamingResponse, is_csv, iter_records
+
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+logger = configure_logging("fraud_detection_service")
 
 app = FastAPI(
     title="Fraud Detection Service",
     description="Service de detection de fraude en temps reel avec ML",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=FastJSONResponse
 )
+# Corps JSON validés depuis les octets bruts; application/msgpack aussi accepté sur les POST
+app.router.route_class = MsgpackRoute
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,181 +65,916 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestIdMiddleware)
 
 # Chemins des modèles
 MODEL_DIR = Path("/app/ml_model/models")
 if not MODEL_DIR.exists():
     MODEL_DIR = Path(__file__).parent.parent / "ml_model" / "models"
 
-MODEL_PATH_RF = MODEL_DIR / "random_forest_model.pkl"
-SCALER_PATH = MODEL_DIR / "scaler.pkl"
-FEATURES_PATH = MODEL_DIR / "feature_columns.json"
+MODEL_PATH_RF = MODEL_DIR / MODEL_FILE
+SCALER_PATH = MODEL_DIR / SCALER_FILE
+FEATURES_PATH = MODEL_DIR / FEATURES_FILE
+COMPILED_MODEL_DIR = MODEL_DIR / COMPILED_DIR
 
-# Variables globales
-model = None
-scaler = None
-feature_columns = None
-model_type = None
+# Bundle actif (modèle, scaler, colonnes, version) - remplacé atomiquement au rechargement
+bundle = None
+
+# Règles métier (paliers de montant, ajustements) - rechargeables comme le modèle
+RULES_PATH = Path(os.getenv("RULES_PATH", str(DEFAULT_RULES_PATH)))
+rules = RuleSet.load(RULES_PATH)
+
+# Démarrage en arrière-plan: /ready répond 503 jusqu'à la première prédiction préchauffée
+ready = False
+startup_error = None
+startup_timings = {"import": IMPORT_SECONDS}
+_startup_task = None
 FRAUD_THRESHOLD = float(os.getenv("FRAUD_THRESHOLD", "0.5"))
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "10000"))
+# /predict/stream: transactions scorées par lot, longueur max d'une ligne du corps
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "1000"))
+STREAM_MAX_LINE_BYTES = int(os.getenv("STREAM_MAX_LINE_BYTES", "65536"))
+# /ws/predict: transactions reçues sans réponse envoyée, par connexion (au-delà, la lecture s'arrête)
+WS_MAX_IN_FLIGHT = int(os.getenv("WS_MAX_IN_FLIGHT", "256"))
+ws_connections = 0
+
+# Micro-batching des requêtes /predict concurrentes (désactivé par défaut)
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "false").lower() == "true"
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "64"))
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "2"))
+batcher = None
+
+# Moteur d'inférence compilé (tableaux NumPy, sans sklearn) - désactivé par défaut
+USE_COMPILED_FOREST = os.getenv("USE_COMPILED_FOREST", "false").lower() == "true"
+# Au-delà de cette taille de lot, le Random Forest sklearn est utilisé s'il est chargé
+COMPILED_FOREST_MAX_ROWS = int(os.getenv("COMPILED_FOREST_MAX_ROWS", "256"))
+# Replie le StandardScaler dans les seuils de la forêt compilée (plus de scaler.transform)
+FOLD_SCALER = os.getenv("FOLD_SCALER", "true").lower() == "true"
+# Forêt compilée mappée en lecture seule: pages partagées entre workers uvicorn/processus
+MODEL_MMAP = os.getenv("MODEL_MMAP", "false").lower() == "true"
+# Parallélisme de predict_proba sklearn (le n_jobs=-1 du pickle est ignoré): série sous
+# INFERENCE_PARALLEL_MIN_ROWS lignes, puis threads, au plus INFERENCE_MAX_JOBS
+# (défaut: CPU alloués au conteneur, partagés entre les WEB_CONCURRENCY workers uvicorn)
+INFERENCE_PARALLEL_MIN_ROWS = int(os.getenv("INFERENCE_PARALLEL_MIN_ROWS", "1024"))
+INFERENCE_MAX_JOBS = int(os.getenv("INFERENCE_MAX_JOBS", "0")) or max(1, allocated_cpus() // int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# Scoring orienté décision: le ML est sauté quand les règles décident déjà la fraude, et la
+# forêt compilée s'arrête dès que la décision est acquise (scores alors approchés, score_exact=false).
+# Le paramètre exact_score des requêtes remplace ce réglage.
+DECISION_AWARE_SCORING = os.getenv("DECISION_AWARE_SCORING", "false").lower() == "true"
+EARLY_EXIT_STRIDE = int(os.getenv("EARLY_EXIT_STRIDE", "20"))
+
+# Explications (?explain=true): nombre de features retournées, par |contribution| décroissante
+EXPLAIN_TOP_K = int(os.getenv("EXPLAIN_TOP_K", "5"))
+
+# Exécution du scoring: inline (boucle asyncio), thread ou process
+SCORING_EXECUTOR = os.getenv("SCORING_EXECUTOR", "inline")
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", "0")) or None
+SCORING_CPU_AFFINITY = parse_cpu_list(os.getenv("SCORING_CPU_AFFINITY"))
+executor = None
+
+# Cache des scores par (version du modèle, merchant, amount) - SCORE_CACHE_SIZE=0 le désactive
+SCORE_CACHE_SIZE = int(os.getenv("SCORE_CACHE_SIZE", "10000"))
+SCORE_CACHE_TTL = float(os.getenv("SCORE_CACHE_TTL", "0"))
+score_cache = ScoreCache(SCORE_CACHE_SIZE, SCORE_CACHE_TTL) if SCORE_CACHE_SIZE > 0 else None
+
+# Scoring fantôme d'un modèle candidat (SHADOW_MODEL_DIR), après l'envoi des réponses
+SHADOW_MODEL_DIR = os.getenv("SHADOW_MODEL_DIR")
+SHADOW_QUEUE_SIZE = int(os.getenv("SHADOW_QUEUE_SIZE", "1000"))
+SHADOW_MAX_BATCH = int(os.getenv("SHADOW_MAX_BATCH", "256"))
+SHADOW_LOG_PATH = os.getenv("SHADOW_LOG_PATH")
+SHADOW_LOG_MIN_DELTA = float(os.getenv("SHADOW_LOG_MIN_DELTA", "0"))
+SHADOW_LOG_MAX_BYTES = int(os.getenv("SHADOW_LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+shadow = None
+
+# Rechargement à chaud: surveillance de MODEL_DIR (0 = désactivée), jeton admin optionnel
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "0"))
+RELOAD_MAX_CANARY_DELTA = float(os.getenv("RELOAD_MAX_CANARY_DELTA", "1.0"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+_reload_lock = threading.Lock()
+_watcher_stop = threading.Event()
+
+# Métriques exposées sur /metrics (format texte Prometheus)
+registry = Registry()
+STAGE_SECONDS = registry.histogram("fraud_scoring_stage_seconds", "Durée de chaque étape du scoring, par appel", label_names=("stage",))
+REQUEST_SECONDS = registry.histogram("fraud_request_seconds", "Durée de traitement des requêtes de prédiction", label_names=("endpoint",))
+DECISIONS = registry.counter("fraud_decisions_total", "Décisions rendues (y compris depuis le cache)", ("decision",))
+ERRORS = registry.counter("fraud_errors_total", "Requêtes de prédiction en erreur", ("endpoint", "type"))
+SHORTCUTS = registry.counter("fraud_scoring_shortcuts_total", "Transactions scorées en mode décision, par raccourci appliqué", ("shortcut",))
+TREES_SKIPPED = registry.counter("fraud_early_exit_trees_skipped_total", "Arbres non parcourus grâce à l'arrêt anticipé")
+
+# Transactions de contrôle scorées par tout nouveau modèle avant activation
+CANARY_TRANSACTIONS = [
+    (12.5, "Carrefour"), (49.99, "Netflix"), (250.0, "Amazon"), (1500.0, "AB"),
+    (7000.0, "Zara"), (25000.0, "Apple"), (75000.0, "X"), (150000.0, "Bijouterie"),
+]
 
 class SimpleTransactionRequest(BaseModel):
+    transaction_id: Optional[str] = None
     amount: float
     merchant: str
     category: Optional[str] = "Other"
     user_id: Optional[str] = None
     timestamp: Optional[str] = None
 
+class FeatureContribution(BaseModel):
+    feature: str
+    value: float
+    contribution: float
+
+class Explanation(BaseModel):
+    """Décomposition du score ML: ml_score = bias + somme des contributions + other"""
+    ml_score: float
+    # Probabilité de fraude moyenne à la racine des arbres (avant tout split)
+    bias: float
+    contributions: List[FeatureContribution]
+    # Somme des contributions des features hors du top k
+    other: float
+
 class FraudDetectionResponse(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    
     transaction_id: Optional[str] = None
     is_fraud: bool
     fraud_score: float
     confidence: float
     reason: Optional[str] = None
+    model_version: Optional[str] = None
+    # False: score approché (mode décision), la décision is_fraud est identique au score exact
+    score_exact: bool = True
+    explanation: Optional[Explanation] = None
+
+class BatchTransactionRequest(BaseModel):
+    transactions: List[SimpleTransactionRequest] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+class BatchFraudDetectionResponse(BaseModel):
+    count: int
+    results: List[FraudDetectionResponse]
+
+def load_bundle(model_dir: Path) -> ModelBundle:
+    """Charge un bundle avec les réglages d'inférence du service"""
+    return ModelBundle.load(model_dir, USE_COMPILED_FOREST, FOLD_SCALER, COMPILED_FOREST_MAX_ROWS, MODEL_MMAP,
+                            INFERENCE_PARALLEL_MIN_ROWS, INFERENCE_MAX_JOBS)
 
 def load_model():
     """Charge le modèle Random Forest et le scaler"""
-    global model, scaler, feature_columns, model_type
+    global bundle
     
-    if model is None:
-        if not MODEL_PATH_RF.exists():
-            raise FileNotFoundError(f"Modèle Random Forest non trouvé: {MODEL_PATH_RF}")
+    if bundle is None:
+        bundle = load_bundle(MODEL_DIR)
+        if score_cache is not None:
+            score_cache.clear()
         
-        print(f"📦 Chargement du modèle Random Forest...")
-        model = joblib.load(MODEL_PATH_RF)
-        model_type = 'random_forest'
-        print(f"✅ Modèle chargé: {type(model).__name__}")
+        logger.info("Service ML prêt", extra={"model_type": bundle.model_type, "model_version": bundle.version, "threshold": FRAUD_THRESHOLD})
+
+def validate_canary(candidate: ModelBundle, current: Optional[ModelBundle] = None) -> dict:
+    """
+    Score les transactions de contrôle avec le nouveau bundle (ce qui le préchauffe)
+    Lève ValueError si les scores sont invalides ou trop éloignés du modèle actif
+    """
+    amounts = [amount for amount, _ in CANARY_TRANSACTIONS]
+    merchants = [merchant for _, merchant in CANARY_TRANSACTIONS]
+    scores = np.asarray(candidate.predict_scores(candidate.feature_matrix(amounts, merchants)), dtype=np.float64)
+    
+    if scores.shape != (len(CANARY_TRANSACTIONS),) or not np.all(np.isfinite(scores)):
+        raise ValueError("Scores de contrôle invalides")
+    if np.any(scores < 0) or np.any(scores > 1):
+        raise ValueError("Scores de contrôle hors de [0, 1]")
+    
+    report = {"transactions": len(scores), "mean_score": float(scores.mean())}
+    if current is not None:
+        current_scores = current.predict_scores(current.feature_matrix(amounts, merchants))
+        report["max_delta"] = float(np.max(np.abs(scores - current_scores)))
+        if report["max_delta"] > RELOAD_MAX_CANARY_DELTA:
+            raise ValueError(f"Écart de score {report['max_delta']:.3f} > RELOAD_MAX_CANARY_DELTA={RELOAD_MAX_CANARY_DELTA}")
+    return report
+
+def reload_model(force: bool = False) -> dict:
+    """
+    Charge, préchauffe et valide un nouveau bundle depuis MODEL_DIR puis l'active
+    Le bundle courant reste actif si le chargement ou la validation échoue.
+    Après un démarrage en échec, un rechargement réussi rend le service prêt
+    (les scores de contrôle tiennent lieu de préchauffage).
+    """
+    global bundle, executor, ready, startup_error
+    
+    with _reload_lock:
+        current = bundle
+        candidate = load_bundle(MODEL_DIR)
+        if current is not None and candidate.version == current.version and not force:
+            return {"status": "unchanged", "model_version": current.version}
         
-        # Chargement du scaler
-        if SCALER_PATH.exists():
-            scaler = joblib.load(SCALER_PATH)
-            print(f"✅ Scaler chargé")
-        else:
-            scaler = None
-            print(f"⚠️ Scaler non trouvé")
+        canary = validate_canary(candidate, current)
         
-        # Chargement des features
-        if FEATURES_PATH.exists():
-            with open(FEATURES_PATH, 'r') as f:
-                feature_columns = json.load(f)
-            print(f"✅ Features: {len(feature_columns)} colonnes")
-        else:
-            feature_columns = [f'V{i}' for i in range(1, 29)] + ['Amount']
-            print(f"⚠️ Features par défaut: {len(feature_columns)} colonnes")
+        # En mode process, un nouveau pool est démarré avec le nouveau modèle
+        old_executor = None
+        if executor is not None and executor.mode == "process":
+            new_executor = ScoringExecutor(executor.mode, executor.workers, executor.cpu_affinity, preload=load_model)
+            new_executor.warmup(load_model)
+            old_executor, executor = executor, new_executor
+        
+        # Remplacement atomique: les requêtes en cours gardent l'ancien bundle
+        bundle = candidate
+        if score_cache is not None:
+            score_cache.clear()
+        if startup_error is not None:
+            startup_error = None
+            ready = True
+        if old_executor is not None:
+            old_executor.shutdown(wait=False)
         
-        print(f"✅ Service ML prêt - Type: {model_type}, Seuil: {FRAUD_THRESHOLD}")
+        previous = current.version if current is not None else None
+        logger.info("Modèle rechargé", extra={"previous_version": previous, "model_version": candidate.version})
+        return {"status": "reloaded", "model_version": candidate.version, "previous_version": previous, "canary": canary}
+
+def reload_rules() -> dict:
+    """Charge et compile RULES_PATH puis remplace les règles actives (inchangées en cas d'erreur)"""
+    global rules
+    
+    with _reload_lock:
+        current = rules
+        candidate = RuleSet.load(RULES_PATH)
+        if candidate.version == current.version:
+            return {"status": "unchanged", "rules_version": current.version}
+        
+        rules = candidate
+        # Les clés du cache contiennent la version des règles: on libère seulement la place
+        if score_cache is not None:
+            score_cache.clear()
+        logger.info("Règles rechargées", extra={"previous_version": current.version, "rules_version": candidate.version})
+        return {"status": "reloaded", "rules_version": candidate.version, "previous_version": current.version}
+
+def _files_signature(paths):
+    """Date de modification et taille des fichiers"""
+    signature = []
+    for path in paths:
+        try:
+            stat = path.stat()
+            signature.append((path.name, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append((path.name, None, None))
+    return tuple(signature)
+
+def _model_files_signature():
+    paths = [MODEL_DIR / MODEL_FILE, MODEL_DIR / SCALER_FILE, MODEL_DIR / FEATURES_FILE]
+    if (MODEL_DIR / COMPILED_DIR).exists():
+        paths.extend(sorted((MODEL_DIR / COMPILED_DIR).iterdir()))
+    return _files_signature(paths)
+
+def _rules_file_signature():
+    return _files_signature([RULES_PATH])
+
+def _watch_model_dir():
+    """Recharge le modèle (MODEL_DIR) ou les règles (RULES_PATH) quand leurs fichiers changent puis restent stables"""
+    watched = [(_model_files_signature, reload_model), (_rules_file_signature, reload_rules)]
+    last = [signature() for signature, _ in watched]
+    while not _watcher_stop.wait(MODEL_WATCH_INTERVAL):
+        for i, (signature, reload) in enumerate(watched):
+            current = signature()
+            if current == last[i]:
+                continue
+            # Attendre un intervalle sans changement (copie du fichier terminée)
+            if _watcher_stop.wait(MODEL_WATCH_INTERVAL) or signature() != current:
+                continue
+            last[i] = current
+            try:
+                reload()
+            except Exception as e:
+                logger.error("Rechargement refusé (%s): %s", reload.__name__, e)
+
+def start_shadow() -> ShadowScorer:
+    """Charge le bundle fantôme et démarre son thread de scoring"""
+    shadow_bundle = load_bundle(Path(SHADOW_MODEL_DIR))
+    validate_canary(shadow_bundle)
+    scorer = ShadowScorer(shadow_bundle, FRAUD_THRESHOLD, SHADOW_LOG_PATH, SHADOW_QUEUE_SIZE, SHADOW_MAX_BATCH,
+                          SHADOW_LOG_MIN_DELTA, SHADOW_LOG_MAX_BYTES)
+    scorer.start()
+    logger.info("Scoring fantôme actif", extra={"shadow_version": shadow_bundle.version, "path": SHADOW_MODEL_DIR,
+                                                "log_path": SHADOW_LOG_PATH})
+    return scorer
+
+def shadow_task(transactions: List[SimpleTransactionRequest],
+                results: List[FraudDetectionResponse]) -> Optional[BackgroundTask]:
+    """Tâche exécutée après l'envoi de la réponse: dépose le lot dans la file du scoring fantôme"""
+    if shadow is None:
+        return None
+    return BackgroundTask(
+        enqueue_shadow,
+        [transaction.amount for transaction in transactions],
+        [transaction.merchant for transaction in transactions],
+        [result.fraud_score for result in results],
+        [result.is_fraud for result in results],
+        rules,
+    )
+
+async def enqueue_shadow(amounts, merchants, primary_scores, primary_decisions, active_rules):
+    # Coroutine: exécutée directement dans la boucle (put_nowait), sans passer par un thread
+    active_shadow = shadow
+    if active_shadow is not None:
+        active_shadow.submit(amounts, merchants, primary_scores, primary_decisions, active_rules)
+
+def start_executor() -> ScoringExecutor:
+    """Crée le pool d'exécution et charge le modèle dans chaque worker"""
+    pool = ScoringExecutor(SCORING_EXECUTOR, SCORING_WORKERS, SCORING_CPU_AFFINITY, preload=load_model)
+    pool.warmup(load_model)
+    logger.info("Exécution du scoring", extra=pool.describe())
+    return pool
+
+async def warm_start():
+    """
+    Chargement du modèle, démarrage du pool et prédiction de préchauffage
+    Exécuté après le démarrage du serveur: /health répond pendant le chargement.
+    """
+    global executor, ready, startup_error, shadow
+    try:
+        phase_started = time.perf_counter()
+        await asyncio.to_thread(load_model)
+        startup_timings["model_load"] = time.perf_counter() - phase_started
+        
+        if SCORING_EXECUTOR != "inline" and executor is None:
+            phase_started = time.perf_counter()
+            executor = await asyncio.to_thread(start_executor)
+            startup_timings["executor"] = time.perf_counter() - phase_started
+        
+        # Première inférence hors trafic (caches NumPy/sklearn, pages du modèle)
+        phase_started = time.perf_counter()
+        warmup_transactions = [SimpleTransactionRequest(amount=amount, merchant=merchant)
+                               for amount, merchant in CANARY_TRANSACTIONS]
+        await execute_scoring(warmup_transactions, bundle, rules, not DECISION_AWARE_SCORING)
+        startup_timings["warmup"] = time.perf_counter() - phase_started
+        startup_timings["total"] = time.perf_counter() - _IMPORT_STARTED
+        
+        ready = True
+        logger.info("Service prêt en %.2fs", startup_timings["total"], extra={"startup_seconds": startup_timings})
+    except Exception as e:
+        startup_error = f"{type(e).__name__}: {e}"
+        logger.exception("Échec du démarrage")
+        return
+    
+    if SHADOW_MODEL_DIR and shadow is None:
+        # Hors du chemin de readiness: un candidat invalide n'empêche pas de servir
+        try:
+            shadow = await asyncio.to_thread(start_shadow)
+        except Exception:
+            logger.exception("Scoring fantôme désactivé", extra={"path": SHADOW_MODEL_DIR})
+    
+    if MODEL_WATCH_INTERVAL > 0:
+        _watcher_stop.clear()
+        threading.Thread(target=_watch_model_dir, name="model-watcher", daemon=True).start()
+        logger.info("Surveillance du modèle", extra={"path": str(MODEL_DIR), "interval_seconds": MODEL_WATCH_INTERVAL})
 
 @app.on_event("startup")
 async def startup_event():
-    """Charge le modèle au démarrage"""
-    load_model()
+    """Démarre le micro-batcher et lance le chargement du modèle en arrière-plan"""
+    global batcher, _startup_task
+    
+    if MICROBATCH_ENABLED:
+        batcher = MicroBatcher(run_scoring, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS)
+        batcher.start()
+        logger.info("Micro-batching actif", extra={"max_batch_size": MICROBATCH_MAX_SIZE, "max_wait_ms": MICROBATCH_MAX_WAIT_MS})
+    
+    _startup_task = asyncio.create_task(warm_start())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Arrête le chargement en cours, le micro-batcher, la surveillance du modèle, le pool d'exécution et le scoring fantôme"""
+    if _startup_task is not None and not _startup_task.done():
+        _startup_task.cancel()
+    _watcher_stop.set()
+    if batcher is not None:
+        await batcher.stop()
+    if executor is not None:
+        executor.shutdown()
+    if shadow is not None:
+        await asyncio.to_thread(shadow.stop)
 
 @app.get("/")
 async def root():
     return {
         "service": "Fraud Detection Service",
         "status": "running",
-        "model_loaded": model is not None,
-        "model_type": model_type,
-        "threshold": FRAUD_THRESHOLD
+        "model_loaded": bundle is not None,
+        "model_type": bundle.model_type if bundle is not None else None,
+        "model_version": bundle.version if bundle is not None else None,
+        "threshold": FRAUD_THRESHOLD,
+        "decision_aware_scoring": DECISION_AWARE_SCORING
     }
 
 @app.get("/health")
 async def health_check():
+    """Liveness: le processus répond (le modèle peut être encore en chargement)"""
     return {
         "status": "healthy",
-        "model_loaded": model is not None,
-        "model_type": model_type
+        "ready": ready,
+        "model_loaded": bundle is not None,
+        "model_type": bundle.model_type if bundle is not None else None,
+        "model_version": bundle.version if bundle is not None else None
     }
 
-@app.post("/predict", response_model=FraudDetectionResponse)
-async def predict_fraud(transaction: SimpleTransactionRequest):
+@app.get("/ready")
+async def readiness():
+    """Readiness: 200 une fois le modèle chargé et une prédiction de préchauffage réussie"""
+    body = {
+        "status": "ready" if ready else ("failed" if startup_error else "starting"),
+        "model_version": bundle.version if bundle is not None else None,
+        "startup_seconds": startup_timings,
+        "error": startup_error,
+    }
+    return FastJSONResponse(status_code=200 if ready else 503, content=body)
+
+@app.get("/model")
+async def model_info():
+    """Description du bundle actif"""
+    if bundle is None:
+        raise HTTPException(status_code=503, detail="Modèle non chargé")
+    return bundle.describe()
+
+@app.post("/admin/reload")
+async def admin_reload(force: bool = False, x_admin_token: Optional[str] = Header(None)):
     """
-    Endpoint principal de détection de fraude
-    Combine règles métier + Machine Learning
+    Recharge le modèle depuis MODEL_DIR sans redémarrage
+    Chargement et validation dans un thread; le modèle courant sert les requêtes jusqu'au remplacement.
     """
-    if model is None:
-        raise HTTPException(status_code=503, detail="Modèle non chargé")
-    
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Jeton admin invalide")
     try:
-        # === RÈGLES MÉTIER ===
-        risk_score = 0.0
-        reasons = []
-        
-        # Détection par montant
-        if transaction.amount > 100000:
-            risk_score = 0.95
-            reasons.append("Montant tres eleve (>100K)")
-        elif transaction.amount > 50000:
-            risk_score = 0.85
-            reasons.append("Montant eleve (>50K)")
-        elif transaction.amount > 20000:
-            risk_score = 0.75
-            reasons.append("Montant suspect (>20K)")
-        elif transaction.amount > 10000:
-            risk_score = 0.65
-            reasons.append("Montant moyen (>10K)")
-        elif transaction.amount > 5000:
-            risk_score = 0.55
-            reasons.append("Montant suspect (>5K)")
-        else:
-            risk_score = 0.1
-        
-        # Marchand suspect (nom très court + montant élevé)
-        if len(transaction.merchant) <= 2 and transaction.amount > 1000:
-            risk_score += 0.1
-            reasons.append("Marchand suspect")
-        
-        # === GÉNÉRATION FEATURES SYNTHÉTIQUES ===
-        seed = int(hashlib.md5(f"{transaction.merchant}_{transaction.amount}".encode()).hexdigest(), 16) % 10000
-        np.random.seed(seed)
-        
-        features = {}
-        for i in range(1, 29):
-            # Features spéciales pour montants suspects
-            if transaction.amount > 5000 and i in [4, 11, 12, 14]:
-                features[f'V{i}'] = float(np.random.uniform(2, 4) * np.random.choice([1, -1]))
-            else:
-                features[f'V{i}'] = float(np.random.normal(0, 1))
-        
-        features['Amount'] = float(transaction.amount)
-        
-        # === PRÉDICTION ML ===
-        feature_array = np.array([features[col] for col in feature_columns], dtype=np.float32).reshape(1, -1)
-        
-        if scaler is not None:
-            feature_array = scaler.transform(feature_array)
-        
-        # Prédiction avec Random Forest
-        if hasattr(model, 'predict_proba'):
-            proba = model.predict_proba(feature_array)[0]
-            ml_score = float(proba[1])  # Probabilité de fraude
+        return await asyncio.to_thread(reload_model, force)
+    except (FileNotFoundError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"Rechargement refusé: {e}")
+
+@app.get("/rules")
+async def rules_info():
+    """Description des règles métier actives"""
+    return rules.describe()
+
+@app.post("/admin/rules/reload")
+async def admin_reload_rules(x_admin_token: Optional[str] = Header(None)):
+    """Recharge les règles métier depuis RULES_PATH sans redémarrage"""
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Jeton admin invalide")
+    try:
+        return await asyncio.to_thread(reload_rules)
+    except (OSError, ValueError, KeyError) as e:
+        raise HTTPException(status_code=422, detail=f"Rechargement refusé: {e}")
+
+def score_transactions_timed(transactions: List[SimpleTransactionRequest],
+                             active_bundle: Optional[ModelBundle] = None,
+                             active_rules: Optional[RuleSet] = None,
+                             exact: bool = True, explain: bool = False):
+    """
+    Score un lot de transactions: règles métier vectorisées sur le lot,
+    puis un seul appel scaler/predict_proba sur la matrice complète
+    
+    Avec exact=False, les transactions que les règles classent déjà en fraude ne
+    passent pas par le ML, et la forêt compilée s'arrête dès que la décision est acquise.
+    Avec explain=True (score exact), le score ML et ses contributions par feature
+    viennent du même parcours de la forêt.
+    Retourne (résultats, [(étape, durée en secondes), ...], {raccourci: nombre}).
+    """
+    active_bundle = active_bundle or bundle
+    active_rules = active_rules or rules
+    timer = StageTimer()
+    amounts = [transaction.amount for transaction in transactions]
+    merchants = [transaction.merchant for transaction in transactions]
+    risk_scores, reasons = active_rules.evaluate(amounts, merchants)
+    timer.mark("rules")
+    
+    shortcuts = {}
+    ml_rows = None
+    if not exact:
+        # max(ML, règles) >= seuil est acquis si les règles seules atteignent le seuil
+        ml_rows = np.flatnonzero(risk_scores < FRAUD_THRESHOLD)
+        shortcuts["rules"] = len(transactions) - len(ml_rows)
+        if len(ml_rows) < len(transactions):
+            amounts = [amounts[i] for i in ml_rows]
+            merchants = [merchants[i] for i in ml_rows]
+    
+    explanations = [None] * len(transactions)
+    if exact:
+        seeds = feature_seeds(amounts, merchants)
+        timer.mark("seeding")
+        feature_matrix = active_bundle.features_from_seeds(seeds, amounts)
+        timer.mark("features")
+        if explain:
+            ml_scores, bias, contributions = active_bundle.explain(feature_matrix)
+            timer.mark("predict")
+            explanations = build_explanations(active_bundle.feature_columns, feature_matrix, ml_scores, bias, contributions)
         else:
-            ml_score = 0.5
+            feature_matrix = active_bundle.scale(feature_matrix)
+            timer.mark("scaling")
+            ml_scores = active_bundle.predict_scaled(feature_matrix)
+            timer.mark("predict")
+        scores_exact = [True] * len(transactions)
+    else:
+        # Transactions décidées par les règles: score final = score des règles (borne basse)
+        ml_scores = np.zeros(len(transactions))
+        scores_exact = np.zeros(len(transactions), dtype=bool)
+        if len(ml_rows):
+            seeds = feature_seeds(amounts, merchants)
+            timer.mark("seeding")
+            feature_matrix = active_bundle.features_from_seeds(seeds, amounts)
+            timer.mark("features")
+            feature_matrix = active_bundle.scale(feature_matrix)
+            timer.mark("scaling")
+            row_scores, row_exact, shortcuts["trees_skipped"] = active_bundle.predict_decision(
+                feature_matrix, FRAUD_THRESHOLD, EARLY_EXIT_STRIDE)
+            timer.mark("predict")
+            shortcuts["early_exit"] = int(len(row_exact) - row_exact.sum())
+            shortcuts["none"] = int(row_exact.sum())
+            ml_scores[ml_rows] = row_scores
+            scores_exact[ml_rows] = row_exact
+        scores_exact = scores_exact.tolist()
+    
+    results = []
+    for transaction, risk_score, reason, ml_score, score_exact, explanation in zip(
+            transactions, risk_scores.tolist(), reasons, ml_scores, scores_exact, explanations):
+        ml_score = float(ml_score)
         
-        # === SCORE FINAL ===
         # Prendre le maximum entre ML et règles métier
         final_score = max(ml_score, risk_score)
         is_fraud = final_score >= FRAUD_THRESHOLD
         
-        reason_msg = " | ".join(reasons) if reasons else None
-        
-        # Logs
-        emoji = "🚨 FRAUDE" if is_fraud else "✅ OK"
-        print(f"{emoji} {transaction.merchant}: {transaction.amount:.0f}€, score={final_score:.2f}, ML={ml_score:.2f}, Rules={risk_score:.2f}")
-        
-        return FraudDetectionResponse(
+        results.append(FraudDetectionResponse(
+            transaction_id=transaction.transaction_id,
             is_fraud=is_fraud,
             fraud_score=final_score,
             confidence=final_score,
-            reason=reason_msg
-        )
+            reason=reason,
+            model_version=active_bundle.version,
+            score_exact=score_exact,
+            explanation=explanation
+        ))
+        
+        if len(transactions) == 1:
+            # Événement à fort volume: les transactions légitimes sont échantillonnées (LOG_SAMPLE_RATE)
+            logger.info("Transaction scorée", extra={
+                "sample": not is_fraud, "transaction_id": transaction.transaction_id, "merchant": transaction.merchant,
+                "amount": transaction.amount, "is_fraud": is_fraud, "fraud_score": final_score,
+                "ml_score": ml_score if exact or len(ml_rows) else None, "rules_score": risk_score,
+                "score_exact": score_exact,
+            })
+    timer.mark("response")
+    
+    return results, timer.durations, shortcuts
+
+def build_explanations(feature_columns: List[str], feature_matrix: np.ndarray, ml_scores: np.ndarray,
+                       bias: float, contributions: np.ndarray) -> List[Explanation]:
+    """Top EXPLAIN_TOP_K des features par |contribution|, avec la valeur brute de chaque feature"""
+    top = np.argsort(-np.abs(contributions), axis=1, kind="stable")[:, :EXPLAIN_TOP_K]
+    explanations = []
+    for row, columns in enumerate(top.tolist()):
+        explanations.append(Explanation(
+            ml_score=float(ml_scores[row]),
+            bias=bias,
+            contributions=[FeatureContribution(feature=feature_columns[column], value=float(feature_matrix[row, column]),
+                                               contribution=float(contributions[row, column])) for column in columns],
+            other=float(contributions[row].sum() - contributions[row, columns].sum()),
+        ))
+    return explanations
+
+def score_transactions(transactions: List[SimpleTransactionRequest],
+                       active_bundle: Optional[ModelBundle] = None,
+                       active_rules: Optional[RuleSet] = None,
+                       exact: bool = True, explain: bool = False) -> List[FraudDetectionResponse]:
+    """Score un lot de transactions et enregistre la durée des étapes"""
+    results, durations, shortcuts = score_transactions_timed(transactions, active_bundle, active_rules, exact, explain)
+    record_stages(durations)
+    record_shortcuts(shortcuts)
+    return results
+
+def record_stages(durations):
+    for stage, seconds in durations:
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+def record_shortcuts(shortcuts: dict):
+    for shortcut in ("rules", "early_exit", "none"):
+        if shortcuts.get(shortcut):
+            SHORTCUTS.inc(shortcuts[shortcut], shortcut=shortcut)
+    if shortcuts.get("trees_skipped"):
+        TREES_SKIPPED.inc(shortcuts["trees_skipped"])
+
+@app.get("/batching/stats")
+async def batching_stats():
+    """Métriques du micro-batching (taille des lots formés)"""
+    if batcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **batcher.stats()}
+
+async def execute_scoring(transactions: List[SimpleTransactionRequest],
+                          active_bundle: ModelBundle, active_rules: RuleSet,
+                          exact: bool = True, explain: bool = False) -> List[FraudDetectionResponse]:
+    """Exécute score_transactions via le pool configuré (hors de la boucle asyncio)"""
+    if executor is None:
+        return score_transactions(transactions, active_bundle, active_rules, exact, explain)
+    if executor.mode == "process":
+        # Chaque processus enfant a son propre bundle préchargé; les règles (légères) sont envoyées
+        # à chaque appel pour suivre les rechargements. Durées et raccourcis reviennent au parent.
+        results, durations, shortcuts = await executor.run(score_transactions_timed, transactions, None, active_rules, exact,
+                                                           explain)
+    else:
+        results, durations, shortcuts = await executor.run(score_transactions_timed, transactions, active_bundle,
+                                                           active_rules, exact, explain)
+    record_stages(durations)
+    record_shortcuts(shortcuts)
+    return results
+
+async def run_scoring(transactions: List[SimpleTransactionRequest],
+                      exact: Optional[bool] = None, explain: bool = False) -> List[FraudDetectionResponse]:
+    """Score un lot en ne calculant que les transactions absentes du cache (explain: score toujours exact)"""
+    exact = True if explain else not DECISION_AWARE_SCORING if exact is None else exact
+    # Bundle et règles lus une seule fois: un rechargement pendant la requête ne la change pas
+    active_bundle, active_rules = bundle, rules
+    if score_cache is None:
+        return record_decisions(await execute_scoring(transactions, active_bundle, active_rules, exact, explain))
+    
+    # Un score approché (mode décision) n'est jamais servi à une requête exacte
+    keys = [(active_bundle.version, active_rules.version, exact, explain, transaction.merchant, transaction.amount)
+            for transaction in transactions]
+    results = [score_cache.get(key) for key in keys]
+    # Le transaction_id n'entre pas dans le score: il est repris de la requête
+    results = [
+        None if cached is None else cached.model_copy(update={"transaction_id": transaction.transaction_id})
+        for transaction, cached in zip(transactions, results)
+    ]
+    
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        computed = await execute_scoring([transactions[i] for i in missing], active_bundle, active_rules, exact, explain)
+        for i, result in zip(missing, computed):
+            if result.model_version == active_bundle.version:
+                score_cache.put(keys[i], result)
+            results[i] = result
+    return record_decisions(results)
+
+def record_decisions(results: List[FraudDetectionResponse]) -> List[FraudDetectionResponse]:
+    n_fraud = sum(result.is_fraud for result in results)
+    if n_fraud:
+        DECISIONS.inc(n_fraud, decision="fraud")
+    if len(results) > n_fraud:
+        DECISIONS.inc(len(results) - n_fraud, decision="legit")
+    return results
+
+def serialize_response(result: BaseModel, background: Optional[BackgroundTask] = None,
+                  accept: Optional[str] = None) -> Response:
+    """Sérialise la réponse (étape serialization des métriques), en msgpack si Accept le demande"""
+    with STAGE_SECONDS.time(stage="serialization"):
+        body, media_type = encode_result(result, accept)
+    return Response(content=body, media_type=media_type, background=background)
+
+@app.get("/shadow/stats")
+async def shadow_stats():
+    """Comparaison du modèle fantôme avec le modèle actif (désaccords, écarts, abandons)"""
+    if shadow is None:
+        return {"enabled": False}
+    return {"enabled": True, "model_version": bundle.version if bundle is not None else None, **shadow.stats()}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Compteurs du cache des scores (hits, misses, évictions)"""
+    if score_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, "model_version": bundle.version if bundle is not None else None, **score_cache.stats()}
+
+def collect_service_metrics():
+    """Version du modèle, état et compteurs du cache/micro-batching, lus au rendu de /metrics"""
+    active_bundle = bundle
+    lines = sample_lines("fraud_model_info", "Modèle actif", "gauge",
+                         [({"version": active_bundle.version, "type": active_bundle.model_type}, 1)] if active_bundle else [])
+    lines += sample_lines("fraud_rules_info", "Règles métier actives", "gauge", [({"version": rules.version}, 1)])
+    lines += sample_lines("fraud_ready", "1 si le service est prêt (/ready)", "gauge", [(None, int(ready))])
+    if score_cache is not None:
+        stats = score_cache.stats()
+        lines += sample_lines("fraud_cache_lookups_total", "Consultations du cache des scores", "counter",
+                              [({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])])
+        lines += sample_lines("fraud_cache_entries", "Entrées du cache des scores", "gauge", [(None, stats["size"])])
+    if shadow is not None:
+        stats = shadow.stats()
+        lines += sample_lines("fraud_shadow_transactions_total", "Transactions envoyées au scoring fantôme", "counter",
+                              [({"result": "scored"}, stats["scored"]), ({"result": "dropped"}, stats["dropped"]),
+                               ({"result": "error"}, stats["errors"])])
+        lines += sample_lines("fraud_shadow_disagreements_total", "Décisions différentes entre modèle actif et fantôme", "counter",
+                              [({"shadow_version": stats["shadow_version"]}, stats["disagreements"])])
+        lines += sample_lines("fraud_shadow_queue_depth", "Lots en attente du scoring fantôme", "gauge", [(None, stats["queue_depth"])])
+    lines += sample_lines("fraud_ws_connections", "Connexions ouvertes sur /ws/predict", "gauge", [(None, ws_connections)])
+    if batcher is not None:
+        stats = batcher.stats()
+        lines += sample_lines("fraud_microbatch_batches_total", "Lots formés par le micro-batcher", "counter", [(None, stats["batches"])])
+        lines += sample_lines("fraud_microbatch_items_total", "Requêtes traitées par le micro-batcher", "counter", [(None, stats["items"])])
+    return lines
+
+registry.add_collector(collect_service_metrics)
+
+@app.get("/metrics")
+async def metrics():
+    """Métriques au format texte Prometheus"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def unavailable_reason() -> Optional[str]:
+    """Raison du refus de scorer, ou None si le service est prêt (même état que /ready)"""
+    if bundle is not None and ready:
+        return None
+    if startup_error:
+        return f"Échec du démarrage: {startup_error}"
+    return "Modèle non chargé" if bundle is None else "Préchauffage en cours"
+
+def require_ready(endpoint: str):
+    """503 tant que le chargement et le préchauffage n'ont pas réussi"""
+    reason = unavailable_reason()
+    if reason is not None:
+        ERRORS.inc(endpoint=endpoint, type="model_unavailable")
+        raise HTTPException(status_code=503, detail=reason)
+
+def require_explainer():
+    if not bundle.explainable:
+        raise HTTPException(status_code=400, detail=f"Explications non disponibles pour le modèle {bundle.model_type}")
+
+@app.post("/predict", response_model=FraudDetectionResponse)
+async def predict_fraud(transaction: SimpleTransactionRequest, exact_score: Optional[bool] = None,
+                        explain: bool = False, accept: Optional[str] = Header(None)):
+    """
+    Endpoint principal de détection de fraude
+    Combine règles métier + Machine Learning
+    exact_score: force (true) ou non (false) le calcul du score exact, sinon DECISION_AWARE_SCORING
+    explain: ajoute la décomposition du score ML par feature (top EXPLAIN_TOP_K)
+    Corps et réponse en JSON, ou en msgpack (Content-Type / Accept: application/msgpack)
+    """
+    require_ready("/predict")
+    if explain:
+        require_explainer()
+    
+    try:
+        with REQUEST_SECONDS.time(endpoint="/predict"):
+            if batcher is not None and not explain and (exact_score is None or exact_score != DECISION_AWARE_SCORING):
+                # Le micro-batcher score dans le mode par défaut du service
+                result = await batcher.submit(transaction)
+            else:
+                result = (await run_scoring([transaction], exact_score, explain))[0]
+            return serialize_response(result, shadow_task([transaction], [result]), accept)
     
     except Exception as e:
-        import traceback
-        print(f"❌ Erreur: {str(e)}")
-        traceback.print_exc()
+        ERRORS.inc(endpoint="/predict", type="internal")
+        logger.exception("Erreur de prédiction", extra={"endpoint": "/predict"})
         raise HTTPException(status_code=500, detail=f"Erreur ML: {str(e)}")
 
+@app.post("/predict/batch", response_model=BatchFraudDetectionResponse)
+async def predict_fraud_batch(batch: BatchTransactionRequest, exact_score: Optional[bool] = None,
+                              explain: bool = False, accept: Optional[str] = Header(None)):
+    """
+    Détection de fraude en lot
+    Mêmes règles que /predict, mais une seule inférence sur la matrice N x 29.
+    Les résultats sont retournés dans l'ordre des transactions reçues.
+    explain: ajoute la décomposition du score ML par feature à chaque résultat
+    Corps et réponse en JSON, ou en msgpack (Content-Type / Accept: application/msgpack)
+    """
+    require_ready("/predict/batch")
+    if explain:
+        require_explainer()
+    
+    try:
+        with REQUEST_SECONDS.time(endpoint="/predict/batch"):
+            results = await run_scoring(batch.transactions, exact_score, explain)
+            n_fraud = sum(result.is_fraud for result in results)
+            logger.info("Lot scoré", extra={"count": len(results), "n_fraud": n_fraud})
+            return serialize_response(BatchFraudDetectionResponse(count=len(results), results=results),
+                                 shadow_task(batch.transactions, results), accept)
+    
+    except Exception as e:
+        ERRORS.inc(endpoint="/predict/batch", type="internal")
+        logger.exception("Erreur de prédiction", extra={"endpoint": "/predict/batch"})
+        raise HTTPException(status_code=500, detail=f"Erreur ML: {str(e)}")
+
+async def stream_scores(request: Request, exact_score: Optional[bool]):
+    """
+    Lit le corps ligne à ligne, score par lots de STREAM_CHUNK_SIZE et produit une ligne
+    NDJSON par ligne reçue, dans l'ordre: le résultat, ou {"line": n, "error": ...}
+    """
+    started = time.perf_counter()
+    csv_format = is_csv(request.headers.get("content-type", ""))
+    pending = []
+    n_scored = n_errors = n_failed = 0
+    
+    async def flush():
+        nonlocal n_scored, n_failed
+        transactions = [item for _, item in pending if isinstance(item, SimpleTransactionRequest)]
+        try:
+            results = await run_scoring(transactions, exact_score) if transactions else []
+        except Exception as e:
+            # Le lot est perdu mais pas le flux: une ligne d'erreur par transaction du lot
+            logger.exception("Erreur de scoring du flux", extra={"endpoint": "/predict/stream", "count": len(transactions)})
+            ERRORS.inc(len(transactions), endpoint="/predict/stream", type="scoring")
+            n_failed += len(transactions)
+            failure, transactions, results = f"Erreur ML: {str(e)}", [], None
+        ordered = iter(results or [])
+        lines = []
+        for line_number, item in pending:
+            if not isinstance(item, SimpleTransactionRequest):
+                lines.append(json.dumps({"line": line_number, "error": item}, ensure_ascii=False))
+            elif results is None:
+                lines.append(json.dumps({"line": line_number, "error": failure}, ensure_ascii=False))
+            else:
+                lines.append(next(ordered).model_dump_json())
+        n_scored += len(transactions)
+        pending.clear()
+        return "\n".join(lines) + "\n", transactions, results
+    
+    # Seule la lecture du corps lève ValueError (ligne trop longue, décodage): le scoring
+    # reste hors du try pour ne pas être compté comme corps invalide ni rejoué
+    records = iter_records(request.stream(), csv_format, STREAM_MAX_LINE_BYTES).__aiter__()
+    body_error = None
+    while True:
+        try:
+            line_number, record = await records.__anext__()
+        except StopAsyncIteration:
+            break
+        except ValueError as e:
+            body_error = str(e)
+            break
+        try:
+            if isinstance(record, bytes):
+                pending.append((line_number, SimpleTransactionRequest.model_validate_json(record)))
+            else:
+                pending.append((line_number, SimpleTransactionRequest.model_validate(record)))
+        except ValidationError as e:
+            n_errors += 1
+            pending.append((line_number, "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors())))
+        if len(pending) >= STREAM_CHUNK_SIZE:
+            body, transactions, results = await flush()
+            yield body
+            await enqueue_stream_shadow(transactions, results)
+    
+    if pending:
+        body, transactions, results = await flush()
+        yield body
+        await enqueue_stream_shadow(transactions, results)
+    if body_error is not None:
+        ERRORS.inc(endpoint="/predict/stream", type="invalid_body")
+        yield json.dumps({"error": body_error}, ensure_ascii=False) + "\n"
+    if n_errors:
+        ERRORS.inc(n_errors, endpoint="/predict/stream", type="invalid_line")
+    REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="/predict/stream")
+    logger.info("Flux scoré", extra={"count": n_scored, "errors": n_errors, "failed": n_failed,
+                                     "format": "csv" if csv_format else "ndjson"})
+
+async def enqueue_stream_shadow(transactions: List[SimpleTransactionRequest], results: List[FraudDetectionResponse]):
+    # Après l'envoi du lot: même file bornée que /predict et /predict/batch
+    task = shadow_task(transactions, results) if transactions else None
+    if task is not None:
+        await task()
+
+@app.post("/predict/stream")
+async def predict_fraud_stream(request: Request, exact_score: Optional[bool] = None):
+    """
+    Rescoring de gros exports: corps NDJSON (une transaction JSON par ligne) ou CSV
+    (Content-Type: text/csv, ligne d'en-tête), réponse NDJSON produite au fil de l'eau
+    Mémoire constante: au plus STREAM_CHUNK_SIZE transactions en cours.
+    """
+    require_ready("/predict/stream")
+    return RequestStreamingResponse(stream_scores(request, exact_score), media_type=NDJSON_MEDIA_TYPE)
+
+@app.websocket("/ws/predict")
+async def predict_fraud_websocket(websocket: WebSocket, exact_score: Optional[bool] = None):
+    """
+    Canal de scoring continu: une trame = une transaction (objet) ou un tableau de transactions,
+    chacune avec un identifiant de corrélation "id" repris dans sa réponse
+    Texte JSON ou binaire msgpack (réponse dans le même encodage). Avec le micro-batching, les
+    trames sont scorées en parallèle et leurs réponses peuvent arriver dans le désordre.
+    """
+    global ws_connections
+    await websocket.accept()
+    reason = unavailable_reason()
+    if reason is not None:
+        ERRORS.inc(endpoint="/ws/predict", type="model_unavailable")
+        await websocket.close(code=1013, reason=reason[:120])
+        return
+    
+    # Même règle que /predict: le micro-batcher ne sert que le mode de scoring par défaut
+    use_batcher = batcher is not None and (exact_score is None or exact_score != DECISION_AWARE_SCORING)
+    
+    async def score(transactions: List[SimpleTransactionRequest]) -> List[FraudDetectionResponse]:
+        if use_batcher:
+            return list(await asyncio.gather(*(batcher.submit(transaction) for transaction in transactions)))
+        return await run_scoring(transactions, exact_score)
+    
+    async def on_scored(transactions, results, seconds):
+        REQUEST_SECONDS.observe(seconds, endpoint="/ws/predict")
+        if results:
+            await enqueue_stream_shadow(transactions, results)
+    
+    channel = ScoringChannel(websocket, SimpleTransactionRequest.model_validate, score, WS_MAX_IN_FLIGHT,
+                             concurrent=use_batcher, on_scored=on_scored)
+    ws_connections += 1
+    try:
+        await channel.run()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        ws_connections -= 1
+        stats = channel.stats()
+        if stats["errors"]:
+            ERRORS.inc(stats["errors"], endpoint="/ws/predict", type="invalid_message")
+        logger.info("Canal WebSocket fermé", extra=stats)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8002)
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+Métriques du service au format texte Prometheus (GET /metrics)
+
+Histogrammes à buckets fixes et compteurs en mémoire, sans dépendance: une
+observation coûte une recherche dichotomique et quelques incréments sous un
+verrou, ce qui reste négligeable devant une prédiction. Les buckets sont
+cumulés uniquement au rendu.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Durées des étapes du scoring: de 10 µs à 2.5 s
+STAGE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Étapes du pipeline de scoring, dans l'ordre
+STAGES = ("rules", "seeding", "features", "scaling", "predict", "response", "serialization")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Compteur monotone, éventuellement étiqueté"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple([labels[name] for name in self.label_names])
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels[name] for name in self.label_names), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(tuple(zip(self.label_names, key)))} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Histogramme à buckets fixes, éventuellement étiqueté"""
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = STAGE_BUCKETS,
+                 label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.label_names = tuple(label_names)
+        # Par série: [effectif de chaque bucket (+Inf en dernier), somme]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple([labels[name] for name in self.label_names])
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(labels[name] for name in self.label_names))
+        return sum(series[0]) if series is not None else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in items:
+            labels = tuple(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {repr(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Ensemble de métriques rendues ensemble par /metrics"""
+
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = STAGE_BUCKETS,
+                  label_names: Sequence[str] = ()) -> Histogram:
+        metric = Histogram(name, documentation, buckets, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]):
+        """Fonction appelée au rendu, qui retourne des lignes déjà formatées (jauges, état)"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+def sample_lines(name: str, documentation: str, metric_type: str,
+                 samples: Iterable[Tuple[Optional[dict], float]]) -> List[str]:
+    """Lignes d'une métrique lue au rendu (cache, état): samples = [(labels, valeur), ...]"""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(tuple((labels or {}).items()))} {_format_value(value)}")
+    return lines
+
+
+class StageTimer:
+    """Durées des étapes d'un appel de scoring (liste simple: revient aussi des processus enfants)"""
+
+    def __init__(self):
+        self.durations: List[Tuple[str, float]] = []
+        self._last = time.perf_counter()
+
+    def mark(self, stage: str):
+        """Termine l'étape en cours: durée depuis le mark précédent (ou la création)"""
+        now = time.perf_counter()
+        self.durations.append((stage, now - self._last))
+        self._last = now
@@ -0,0 +1,353 @@
+"""
+Bundle du modèle servi: Random Forest (ou forêt compilée), scaler,
+colonnes de features et version
+
+Parallélisme d'inférence: le Random Forest est entraîné avec n_jobs=-1, réglage
+conservé dans le pickle. Au chargement, n_jobs est retiré du modèle; chaque appel
+choisit son nombre de threads selon la taille du lot (série pour les petits lots,
+threads joblib au-delà de parallel_min_rows, au plus max_jobs).
+
+Explications (explain): décomposition du score par feature, calculée par la forêt
+compilée pendant le parcours. Sans moteur compilé, une forêt compilée est construite
+depuis le modèle sklearn à la première explication demandée (avec la variation de
+chaque noeud): un service qui n'explique pas ne garde pas de seconde copie de la forêt.
+
+Un bundle n'est plus modifié après son chargement. Le rechargement à chaud
+construit un nouveau bundle puis remplace la référence active: les requêtes
+en cours terminent sur le bundle qu'elles ont pris au départ.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import joblib
+import numpy as np
+from joblib import parallel_config
+
+from common.features import FEATURE_NAMES, column_order, feature_seeds, features_from_seeds
+try:
+    from .tree_engine import CompiledForest, compile_model, fold_scaler
+except ImportError:
+    from tree_engine import CompiledForest, compile_model, fold_scaler
+
+logger = logging.getLogger("fraud_detection_service.model_bundle")
+
+MODEL_FILE = "random_forest_model.pkl"
+SCALER_FILE = "scaler.pkl"
+FEATURES_FILE = "feature_columns.json"
+COMPILED_DIR = "compiled_forest"
+
+
+def compute_model_version(paths) -> str:
+    """Empreinte SHA-256 (12 caractères) du contenu des fichiers du modèle"""
+    digest = hashlib.sha256()
+    for path in sorted(Path(p) for p in paths):
+        if path.is_dir():
+            digest.update(compute_model_version(path.iterdir()).encode())
+        elif path.exists():
+            digest.update(path.name.encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def compiled_is_current(model_dir, fold: bool = True) -> bool:
+    """
+    Vrai si model_dir/compiled_forest correspond au pickle, au scaler et au réglage fold
+
+    La forêt doit être plus récente que le pickle; le scaler y est replié si et
+    seulement si fold=True et scaler.pkl existe, et dans ce cas la forêt doit
+    être plus récente que scaler.pkl. Sans pickle, le dossier compilé est gardé
+    tel quel (rien pour le recompiler).
+    """
+    model_dir = Path(model_dir)
+    model_path = model_dir / MODEL_FILE
+    scaler_path = model_dir / SCALER_FILE
+    meta_path = model_dir / COMPILED_DIR / "meta.json"
+    if not meta_path.exists():
+        return False
+    if not model_path.exists():
+        return True
+    meta_mtime = meta_path.stat().st_mtime_ns
+    if meta_mtime < model_path.stat().st_mtime_ns:
+        return False
+    with open(meta_path, "r") as f:
+        folded = json.load(f).get("scaler_folded", False)
+    if folded != (fold and scaler_path.exists()):
+        return False
+    return not folded or meta_mtime >= scaler_path.stat().st_mtime_ns
+
+
+def ensure_compiled(model_dir, fold: bool = True) -> Path:
+    """
+    Compile random_forest_model.pkl dans model_dir/compiled_forest si le dossier
+    n'existe pas ou n'est plus à jour (compiled_is_current), scaler replié si fold=True
+
+    La forêt est écrite dans un dossier temporaire puis publiée par renommage:
+    les fichiers déjà mappés par les workers ne sont jamais réécrits en place,
+    et quand plusieurs workers démarrent en même temps un seul dossier est publié.
+    """
+    model_dir = Path(model_dir)
+    compiled_dir = model_dir / COMPILED_DIR
+    model_path = model_dir / MODEL_FILE
+    meta_path = compiled_dir / "meta.json"
+    if compiled_is_current(model_dir, fold):
+        return compiled_dir
+    if not model_path.exists():
+        raise FileNotFoundError(f"Modèle Random Forest non trouvé: {model_path}")
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f".{COMPILED_DIR}-", dir=model_dir))
+    os.chmod(tmp_dir, 0o755)
+    try:
+        compile_model(model_path, tmp_dir, model_dir / SCALER_FILE if fold else None)
+    except Exception:
+        _remove_dir(tmp_dir)
+        raise
+    if compiled_dir.exists():
+        # L'ancien dossier est mis de côté; les mappings existants restent valides
+        old_dir = Path(tempfile.mkdtemp(prefix=f".{COMPILED_DIR}-old-", dir=model_dir)) / COMPILED_DIR
+        try:
+            _remove_dir(compiled_dir.rename(old_dir))
+        except FileNotFoundError:
+            old_dir.parent.rmdir()
+    try:
+        tmp_dir.rename(compiled_dir)
+        logger.info("Forêt compilée publiée", extra={"path": str(compiled_dir)})
+    except OSError:
+        # Un autre worker a publié le dossier entre-temps
+        _remove_dir(tmp_dir)
+        if not meta_path.exists():
+            raise
+    return compiled_dir
+
+
+def _remove_dir(directory: Path):
+    for path in directory.iterdir():
+        path.unlink()
+    directory.rmdir()
+    if directory.parent.name.startswith(f".{COMPILED_DIR}-old-"):
+        directory.parent.rmdir()
+
+
+class ModelBundle:
+    """Modèle chargé et artefacts associés"""
+
+    def __init__(self, model, scaler=None, feature_columns: Optional[List[str]] = None,
+                 model_type: str = "random_forest", version: Optional[str] = None,
+                 compiled_forest: Optional[CompiledForest] = None, compiled_max_rows: int = 256,
+                 parallel_min_rows: int = 1024, max_jobs: int = 1):
+        """
+        Args:
+            model: Modèle avec predict_proba (RandomForestClassifier ou CompiledForest)
+            scaler: StandardScaler appliqué avant le modèle (None si absent ou replié)
+            feature_columns: Ordre des colonnes attendu par le modèle
+            model_type: random_forest ou compiled_forest
+            version: Empreinte des fichiers du modèle
+            compiled_forest: Moteur compilé utilisé pour les petits lots
+            compiled_max_rows: Au-delà, le modèle sklearn est utilisé s'il est chargé
+            parallel_min_rows: Taille de lot à partir de laquelle predict_proba sklearn passe en threads
+            max_jobs: Nombre max de threads par appel (1: toujours en série)
+        """
+        self.model = model
+        self.scaler = scaler
+        self.feature_columns = list(feature_columns or FEATURE_NAMES)
+        self.model_type = model_type
+        self.version = version
+        self.compiled_forest = compiled_forest
+        self.compiled_max_rows = compiled_max_rows
+        self.parallel_min_rows = max(1, parallel_min_rows)
+        self.max_jobs = max(1, max_jobs)
+        if hasattr(model, "n_jobs"):
+            # n_jobs=-1 du pickle: pool joblib sur tous les coeurs de l'hôte à chaque appel, même
+            # pour une ligne. Sans n_jobs, joblib suit parallel_config (série par défaut)
+            model.n_jobs = None
+        # Forêt qui calcule les explications, construite à la première demande (get_explainer)
+        self.explainable = compiled_forest is not None or hasattr(model, "estimators_")
+        self._explainer: Optional[CompiledForest] = None
+        self._explainer_lock = threading.Lock()
+        self.loaded_at = time.time()
+        self._column_order = column_order(tuple(self.feature_columns))
+
+    @classmethod
+    def load(cls, model_dir, use_compiled: bool = False, fold: bool = True, compiled_max_rows: int = 256,
+             mmap: bool = False, parallel_min_rows: int = 1024, max_jobs: int = 1) -> "ModelBundle":
+        """
+        Charge le modèle, le scaler et les colonnes depuis model_dir
+
+        Avec mmap=True, seule la forêt compilée est chargée, en lecture seule via
+        np.load(mmap_mode='r'): les pages des tableaux de noeuds viennent du cache
+        de pages du noyau et sont partagées par tous les workers qui ouvrent les
+        mêmes fichiers (le pickle sklearn n'est pas chargé).
+        """
+        model_dir = Path(model_dir)
+        model_path = model_dir / MODEL_FILE
+        scaler_path = model_dir / SCALER_FILE
+        features_path = model_dir / FEATURES_FILE
+        compiled_dir = model_dir / COMPILED_DIR
+        compiled_forest = None
+
+        if mmap:
+            try:
+                ensure_compiled(model_dir, fold)
+                use_compiled = True
+            except OSError as e:
+                # Dossier du modèle en lecture seule: chargement privé par worker
+                logger.warning("Forêt compilée indisponible, chargement sans mmap: %s", e)
+                mmap = False
+
+        if use_compiled and (mmap or compiled_is_current(model_dir, fold)):
+            # Forêt déjà compilée: ni pickle ni import de sklearn
+            logger.info("Chargement de la forêt compilée", extra={"mmap": mmap})
+            compiled_forest = CompiledForest.load(compiled_dir, mmap_mode="r" if mmap else None)
+            model = compiled_forest
+            model_type = 'compiled_forest'
+        else:
+            if not model_path.exists():
+                raise FileNotFoundError(f"Modèle Random Forest non trouvé: {model_path}")
+
+            logger.info("Chargement du modèle Random Forest")
+            model = joblib.load(model_path)
+            model_type = 'random_forest'
+
+            if use_compiled:
+                compiled_forest = CompiledForest.from_sklearn(model)
+        logger.info("Modèle chargé: %s", type(model).__name__)
+        if compiled_forest is not None:
+            logger.info("Forêt compilée", extra={"n_estimators": compiled_forest.n_estimators, "node_count": compiled_forest.node_count})
+
+        # Chargement du scaler
+        if compiled_forest is not None and compiled_forest.scaler_folded and model is compiled_forest:
+            scaler = None
+            logger.info("Scaler déjà replié dans la forêt compilée")
+        elif scaler_path.exists():
+            scaler = joblib.load(scaler_path)
+            logger.info("Scaler chargé")
+        else:
+            scaler = None
+            logger.warning("Scaler non trouvé")
+
+        if fold and scaler is not None and compiled_forest is not None and not compiled_forest.scaler_folded:
+            try:
+                folded = fold_scaler(compiled_forest, scaler)
+                if model is compiled_forest:
+                    model = folded
+                compiled_forest = folded
+                logger.info("Scaler replié dans les seuils de la forêt compilée")
+            except ValueError as e:
+                logger.warning("Repliement du scaler refusé, scaler.transform conservé: %s", e)
+
+        # Chargement des features
+        if features_path.exists():
+            with open(features_path, 'r') as f:
+                feature_columns = json.load(f)
+            logger.info("Features: %d colonnes", len(feature_columns))
+        else:
+            feature_columns = list(FEATURE_NAMES)
+            logger.warning("Features par défaut: %d colonnes", len(feature_columns))
+
+        model_source = compiled_dir if model_type == 'compiled_forest' else model_path
+        version = compute_model_version([model_source, scaler_path, features_path])
+
+        return cls(model, scaler, feature_columns, model_type, version, compiled_forest, compiled_max_rows,
+                   parallel_min_rows, max_jobs)
+
+    def feature_matrix(self, amounts: Sequence[float], merchants: Sequence[str]) -> np.ndarray:
+        """Matrice N x len(feature_columns), colonnes dans l'ordre attendu par le modèle"""
+        return self.features_from_seeds(feature_seeds(amounts, merchants), amounts)
+
+    def features_from_seeds(self, seeds: np.ndarray, amounts: Sequence[float]) -> np.ndarray:
+        # Réordonne les colonnes selon feature_columns.json
+        return features_from_seeds(seeds, amounts)[:, self._column_order]
+
+    def predict_scores(self, feature_matrix: np.ndarray) -> np.ndarray:
+        """Retourne la probabilité de fraude du modèle pour chaque ligne de la matrice"""
+        return self.predict_scaled(self.scale(feature_matrix))
+
+    def _use_compiled(self, n_rows: int) -> bool:
+        return self.compiled_forest is not None and (self.model is self.compiled_forest or n_rows <= self.compiled_max_rows)
+
+    def inference_jobs(self, n_rows: int) -> int:
+        """Threads pour predict_proba sklearn: 1 sous parallel_min_rows, puis un de plus par tranche"""
+        if n_rows < self.parallel_min_rows:
+            return 1
+        return min(self.max_jobs, n_rows // self.parallel_min_rows + 1)
+
+    def scale(self, feature_matrix: np.ndarray) -> np.ndarray:
+        """Applique le scaler, sauf s'il est replié dans la forêt compilée qui scorera ce lot"""
+        if self.scaler is None:
+            return feature_matrix
+        if self._use_compiled(len(feature_matrix)) and self.compiled_forest.scaler_folded:
+            # Scaler replié: les seuils sont déjà exprimés sur les features brutes
+            return feature_matrix
+        return self.scaler.transform(feature_matrix)
+
+    def predict_scaled(self, feature_matrix: np.ndarray) -> np.ndarray:
+        """Probabilité de fraude sur une matrice déjà passée par scale()"""
+        if self._use_compiled(len(feature_matrix)):
+            return self.compiled_forest.predict_proba(feature_matrix)[:, 1]
+        if hasattr(self.model, 'predict_proba'):
+            n_jobs = self.inference_jobs(len(feature_matrix))
+            if n_jobs == 1:
+                return self.model.predict_proba(feature_matrix)[:, 1]  # Probabilité de fraude
+            # parallel_config est propre au thread appelant: pas d'effet sur les autres requêtes
+            with parallel_config(backend="threading", n_jobs=n_jobs):
+                return self.model.predict_proba(feature_matrix)[:, 1]
+        return np.full(len(feature_matrix), 0.5)
+
+    def explain(self, feature_matrix: np.ndarray):
+        """
+        Scores et contributions par feature sur des features brutes (avant scale())
+
+        Returns:
+            (scores, biais, contributions n_lignes x n_features), colonnes dans l'ordre de feature_columns
+        """
+        explainer = self.get_explainer()
+        if explainer is None:
+            raise ValueError(f"Explications non disponibles pour le modèle {type(self.model).__name__}")
+        if self.scaler is not None and not explainer.scaler_folded:
+            feature_matrix = self.scaler.transform(feature_matrix)
+        return explainer.explain(feature_matrix)
+
+    def get_explainer(self) -> Optional[CompiledForest]:
+        """Forêt des explications (None si le modèle n'a pas d'arbres), construite au premier appel"""
+        if self._explainer is None and self.explainable:
+            with self._explainer_lock:
+                if self._explainer is None:
+                    explainer = self.compiled_forest or CompiledForest.from_sklearn(self.model)
+                    explainer.path_deltas()
+                    self._explainer = explainer
+        return self._explainer
+
+    def predict_decision(self, feature_matrix: np.ndarray, threshold: float, stride: int = 20):
+        """
+        Comme predict_scaled, mais la forêt compilée s'arrête dès que score >= threshold est tranché
+
+        Returns:
+            (scores, exact, arbres non parcourus): exact[i] est False si le score de la
+            ligne i est une estimation (décision garantie identique)
+        """
+        if self._use_compiled(len(feature_matrix)):
+            scores, exact, trees = self.compiled_forest.predict_decision(feature_matrix, threshold, stride)
+            return scores, exact, int(self.compiled_forest.n_estimators * len(trees) - trees.sum())
+        return self.predict_scaled(feature_matrix), np.ones(len(feature_matrix), dtype=bool), 0
+
+    def describe(self) -> dict:
+        return {
+            "model_version": self.version,
+            "model_type": self.model_type,
+            "n_features": len(self.feature_columns),
+            "scaler": self.scaler is not None,
+            "compiled_forest": self.compiled_forest is not None,
+            "explainable": self.explainable,
+            "scaler_folded": bool(self.compiled_forest is not None and self.compiled_forest.scaler_folded),
+            "mmap": isinstance(getattr(self.compiled_forest, "feature", None), np.memmap),
+            "parallel_min_rows": self.parallel_min_rows,
+            "max_jobs": self.max_jobs,
+            "loaded_at": self.loaded_at,
+        }
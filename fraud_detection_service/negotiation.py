@@ -0,0 +1,64 @@
+"""
+Négociation du format des échanges: JSON (défaut) ou MessagePack
+
+Requête: un corps Content-Type: application/msgpack est décodé puis validé par
+FastAPI exactement comme un corps JSON (mêmes modèles, mêmes erreurs 422).
+Réponse: msgpack si l'en-tête Accept le demande, JSON sinon (navigateurs, tests).
+"""
+
+from typing import Callable, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel
+from starlette.responses import Response
+
+from common.fast_json import RawBodyRoute
+from common.msgpack_codec import MSGPACK_AVAILABLE, MSGPACK_MEDIA_TYPE, accepts_msgpack, is_msgpack, packb, unpackb
+
+
+class MsgpackRoute(RawBodyRoute):
+    """Route dont le corps peut être envoyé en msgpack (décodé avant la validation FastAPI)"""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            if is_msgpack(request.headers.get("content-type")):
+                request = await decode_msgpack_request(request)
+            return await handler(request)
+
+        return route_handler
+
+
+async def decode_msgpack_request(request: Request) -> Request:
+    """
+    Requête équivalente dont le corps déjà décodé est présenté comme du JSON
+
+    Raises:
+        HTTPException: 415 si le paquet msgpack n'est pas installé
+        RequestValidationError: Corps msgpack illisible (422, comme un JSON invalide)
+    """
+    if not MSGPACK_AVAILABLE:
+        raise HTTPException(status_code=415, detail="application/msgpack non supporté (paquet msgpack absent)")
+    body = await request.body()
+    try:
+        payload = unpackb(body) if body else None
+    except Exception as e:
+        raise RequestValidationError([{"type": "msgpack_invalid", "loc": ("body",), "msg": "MessagePack decode error",
+                                       "input": {}, "ctx": {"error": str(e) or type(e).__name__}}])
+    scope = dict(request.scope)
+    scope["headers"] = [(name, value) for name, value in request.scope["headers"] if name != b"content-type"]
+    scope["headers"].append((b"content-type", b"application/json"))
+    decoded = Request(scope, request.receive)
+    # FastAPI relit request.body() puis request.json(): les deux sont déjà en cache
+    decoded._body = body
+    decoded._json = payload
+    return decoded
+
+
+def encode_result(result: BaseModel, accept: Optional[str]) -> Tuple[bytes, str]:
+    """(corps, media type): msgpack si Accept le demande, JSON sinon"""
+    if accepts_msgpack(accept):
+        return packb(result.model_dump()), MSGPACK_MEDIA_TYPE
+    return result.model_dump_json().encode(), "application/json"
@@ -0,0 +1,163 @@
+"""
+Règles métier chargées depuis un fichier de configuration (rules.json)
+
+Les règles sont compilées en tableaux NumPy et évaluées sur tout un lot:
+- paliers de montant: np.searchsorted sur les seuils triés (montant > seuil)
+- ajustements: conjonction de prédicats (champ, opérateur, valeur), chacun
+  ajoute son score et sa raison, dans l'ordre du fichier
+
+Le score d'un palier puis les ajustements sont additionnés dans le même ordre
+que l'ancienne chaîne if/elif: les scores et les raisons sont identiques au
+bit près. Un RuleSet n'est plus modifié après compilation; le rechargement en
+construit un nouveau.
+"""
+
+import hashlib
+import json
+import operator
+from bisect import bisect_left
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+REASON_SEPARATOR = " | "
+
+# Champs disponibles dans les prédicats, calculés une fois par lot
+FIELDS = ("amount", "merchant_length")
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+# Au-delà, les raisons sont assemblées ligne par ligne plutôt que précalculées
+MAX_PRECOMPUTED_ADJUSTMENTS = 8
+
+DEFAULT_RULES_PATH = Path(__file__).parent / "rules.json"
+
+
+class RuleSet:
+    """Paliers de montant et ajustements compilés pour une évaluation vectorisée"""
+
+    def __init__(self, config: dict, source: Optional[str] = None):
+        """
+        Args:
+            config: Définition des règles (format de rules.json)
+            source: Fichier d'origine (affiché par describe)
+
+        Raises:
+            ValueError: Configuration invalide
+        """
+        self.config = config
+        self.source = source
+        self.version = hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
+        tiers_config = config.get("amount_tiers", {})
+        tiers = tiers_config.get("tiers", [])
+        self.thresholds = np.array([float(tier["above"]) for tier in tiers], dtype=np.float64)
+        if np.any(np.diff(self.thresholds) <= 0):
+            raise ValueError("Les seuils des paliers doivent être strictement croissants")
+        # Index 0: aucun palier franchi
+        self.tier_scores = np.array([float(tiers_config.get("default_score", 0.0))]
+                                    + [float(tier["score"]) for tier in tiers], dtype=np.float64)
+        self.tier_reasons = [None] + [tier.get("reason") for tier in tiers]
+
+        self.adjustments = []
+        for adjustment in config.get("adjustments", []):
+            conditions = []
+            for condition in adjustment.get("when", []):
+                if condition["field"] not in FIELDS:
+                    raise ValueError(f"Champ de règle inconnu: {condition['field']} (attendu: {', '.join(FIELDS)})")
+                if condition["op"] not in OPERATORS:
+                    raise ValueError(f"Opérateur de règle inconnu: {condition['op']}")
+                conditions.append((condition["field"], OPERATORS[condition["op"]], float(condition["value"])))
+            self.adjustments.append((conditions, float(adjustment["score"]), adjustment.get("reason")))
+
+        if not np.all(np.isfinite(self.tier_scores)) or not all(np.isfinite(score) for _, score, _ in self.adjustments):
+            raise ValueError("Les scores des règles doivent être finis")
+
+        # Copies Python pour l'évaluation d'une seule transaction (/predict)
+        self._threshold_list = self.thresholds.tolist()
+        self._tier_score_list = self.tier_scores.tolist()
+        self._reason_table = self._build_reason_table() if len(self.adjustments) <= MAX_PRECOMPUTED_ADJUSTMENTS else None
+
+    @classmethod
+    def load(cls, path=DEFAULT_RULES_PATH) -> "RuleSet":
+        path = Path(path)
+        with open(path, "r") as f:
+            return cls(json.load(f), source=str(path))
+
+    def _reasons_for(self, tier: int, mask: int) -> Optional[str]:
+        reasons = [self.tier_reasons[tier]] if self.tier_reasons[tier] else []
+        reasons += [reason for i, (_, _, reason) in enumerate(self.adjustments) if mask >> i & 1 and reason]
+        return REASON_SEPARATOR.join(reasons) if reasons else None
+
+    def _build_reason_table(self) -> List[Optional[str]]:
+        # Une chaîne par combinaison (palier, ajustements déclenchés): code = palier << n | masque
+        n_masks = 1 << len(self.adjustments)
+        return [self._reasons_for(code // n_masks, code % n_masks) for code in range(len(self.tier_scores) * n_masks)]
+
+    def evaluate(self, amounts: Sequence[float], merchants: Sequence[str]) -> Tuple[np.ndarray, List[Optional[str]]]:
+        """
+        Évalue les règles sur un lot
+
+        Returns:
+            (scores de risque, raisons jointes par " | " ou None), dans l'ordre du lot
+        """
+        if len(amounts) == 1:
+            return self._evaluate_one(float(amounts[0]), merchants[0])
+
+        amounts = np.asarray(amounts, dtype=np.float64)
+        fields = {"amount": amounts}
+        if any(field == "merchant_length" for conditions, _, _ in self.adjustments for field, _, _ in conditions):
+            fields["merchant_length"] = np.fromiter((len(merchant) for merchant in merchants), dtype=np.float64,
+                                                    count=len(amounts))
+
+        # Nombre de seuils strictement inférieurs au montant = index du palier
+        tiers = np.searchsorted(self.thresholds, amounts, side="left")
+        scores = self.tier_scores[tiers]
+        codes = tiers << len(self.adjustments)
+
+        for i, (conditions, score, _) in enumerate(self.adjustments):
+            triggered = np.ones(len(amounts), dtype=bool)
+            for field, compare, value in conditions:
+                triggered &= compare(fields[field], value)
+            scores = np.where(triggered, scores + score, scores)
+            codes |= triggered.astype(codes.dtype) << i
+
+        if self._reason_table is not None:
+            table = self._reason_table
+            reasons = [table[code] for code in codes.tolist()]
+        else:
+            n_masks = 1 << len(self.adjustments)
+            reasons = [self._reasons_for(code // n_masks, code % n_masks) for code in codes.tolist()]
+        return scores, reasons
+
+    def _evaluate_one(self, amount: float, merchant: str) -> Tuple[np.ndarray, List[Optional[str]]]:
+        # Même calcul en scalaire: NumPy coûte plus cher que les règles sur une ligne
+        tier = bisect_left(self._threshold_list, amount)
+        score = self._tier_score_list[tier]
+        fields = {"amount": amount, "merchant_length": len(merchant)}
+        mask = 0
+        for i, (conditions, adjustment_score, _) in enumerate(self.adjustments):
+            if all(compare(fields[field], value) for field, compare, value in conditions):
+                score += adjustment_score
+                mask |= 1 << i
+        if self._reason_table is not None:
+            reason = self._reason_table[tier << len(self.adjustments) | mask]
+        else:
+            reason = self._reasons_for(tier, mask)
+        return np.array([score]), [reason]
+
+    def describe(self) -> dict:
+        return {
+            "rules_version": self.version,
+            "source": self.source,
+            "amount_tiers": len(self.thresholds),
+            "adjustments": [adjustment.get("name") for adjustment in self.config.get("adjustments", [])],
+        }
@@ -0,0 +1,214 @@
+"""
+Scoring fantôme (shadow): un second bundle score le trafic réel sans effet sur les décisions
+
+Les transactions déjà servies sont déposées dans une file bornée (put_nowait)
+après l'envoi de la réponse; un thread dédié les score par lots avec le bundle
+candidat, recalcule la décision (max(ML, règles) >= seuil) et la compare à celle
+du modèle actif. Si la file est pleine, le travail est abandonné et compté: le
+chemin principal n'attend jamais le modèle fantôme.
+
+Le vecteur de features est une fonction pure de (merchant, amount): le thread
+fantôme le reconstruit à l'identique au lieu de le recevoir.
+
+Journal sur disque compact: enregistrements binaires de taille fixe
+(LOG_DTYPE, 26 octets), écrits par lot, lisibles avec read_shadow_log.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from common.features import feature_seeds
+
+logger = logging.getLogger("fraud_detection_service.shadow")
+
+# Un enregistrement par transaction: horodatage, montant, scores final actif/fantôme, décisions
+LOG_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("amount", "<f8"),
+    ("primary_score", "<f4"),
+    ("shadow_score", "<f4"),
+    ("primary_fraud", "u1"),
+    ("shadow_fraud", "u1"),
+])
+
+# Écarts de score absolus (histogramme de /shadow/stats)
+DELTA_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+
+def read_shadow_log(path) -> np.ndarray:
+    """Relit un journal fantôme (tableau structuré LOG_DTYPE)"""
+    return np.fromfile(path, dtype=LOG_DTYPE)
+
+
+class ShadowScorer:
+    """File bornée + thread de scoring pour un bundle fantôme"""
+
+    def __init__(self, shadow_bundle, threshold: float, log_path=None, queue_size: int = 1000,
+                 max_batch: int = 256, min_log_delta: float = 0.0, max_log_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            shadow_bundle: ModelBundle candidat
+            threshold: Seuil de décision (FRAUD_THRESHOLD du service)
+            log_path: Journal binaire (None = pas de journal, statistiques seulement)
+            queue_size: Nombre max de lots en attente (au-delà, abandon)
+            max_batch: Nombre max de transactions scorées en une inférence
+            min_log_delta: Écart minimal pour journaliser un accord (les désaccords le sont toujours)
+            max_log_bytes: Taille au-delà de laquelle le journal passe en .1 (un seul ancien fichier)
+        """
+        if queue_size < 1:
+            raise ValueError("queue_size doit être >= 1")
+        self.bundle = shadow_bundle
+        self.threshold = threshold
+        self.log_path = Path(log_path) if log_path else None
+        self.max_batch = max_batch
+        self.min_log_delta = min_log_delta
+        self.max_log_bytes = max_log_bytes
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.dropped = 0
+        self.scored = 0
+        self.disagreements = 0
+        self.errors = 0
+        self.logged = 0
+        self.delta_sum = 0.0
+        self.max_delta = 0.0
+        self.delta_histogram = [0] * (len(DELTA_BUCKETS) + 1)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="shadow-scorer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Traite ce qui est en file puis arrête le thread"""
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, amounts: Sequence[float], merchants: Sequence[str], primary_scores: Sequence[float],
+               primary_decisions: Sequence[bool], rules) -> bool:
+        """
+        Dépose un lot déjà servi (ne bloque jamais)
+
+        Returns:
+            False si la file est pleine et que le lot a été abandonné
+        """
+        try:
+            self._queue.put_nowait((amounts, merchants, primary_scores, primary_decisions, rules))
+        except queue.Full:
+            self.dropped += len(amounts)
+            return False
+        self.submitted += len(amounts)
+        return True
+
+    def flush(self):
+        """Attend que tous les lots déposés soient traités (tests, arrêt)"""
+        self._queue.join()
+
+    def _collect(self) -> list:
+        """Premier lot bloquant, puis ce qui est déjà en file jusqu'à max_batch transactions"""
+        jobs = [self._queue.get()]
+        size = len(jobs[0][0]) if jobs[0] is not None else 0
+        while jobs[-1] is not None and size < self.max_batch:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            jobs.append(job)
+            size += len(job[0]) if job is not None else 0
+        return jobs
+
+    def _run(self):
+        while True:
+            jobs = self._collect()
+            work = [job for job in jobs if job is not None]
+            try:
+                if work:
+                    self._process(work)
+            except Exception:
+                self.errors += sum(len(job[0]) for job in work)
+                logger.exception("Erreur du scoring fantôme")
+            finally:
+                for _ in jobs:
+                    self._queue.task_done()
+            if len(work) < len(jobs):
+                return
+
+    def _process(self, jobs: list):
+        amounts: List[float] = []
+        merchants: List[str] = []
+        rule_scores = []
+        for job_amounts, job_merchants, _, _, job_rules in jobs:
+            amounts.extend(job_amounts)
+            merchants.extend(job_merchants)
+            rule_scores.append(job_rules.evaluate(job_amounts, job_merchants)[0])
+        primary_scores = np.fromiter((score for job in jobs for score in job[2]), dtype=np.float64, count=len(amounts))
+        primary_fraud = np.fromiter((decision for job in jobs for decision in job[3]), dtype=bool, count=len(amounts))
+
+        features = self.bundle.features_from_seeds(feature_seeds(amounts, merchants), amounts)
+        ml_scores = np.asarray(self.bundle.predict_scores(features), dtype=np.float64)
+        shadow_scores = np.maximum(ml_scores, np.concatenate(rule_scores))
+        shadow_fraud = shadow_scores >= self.threshold
+
+        deltas = np.abs(shadow_scores - primary_scores)
+        disagree = shadow_fraud != primary_fraud
+        counts = np.bincount(np.searchsorted(DELTA_BUCKETS, deltas, side="left"), minlength=len(self.delta_histogram))
+        with self._lock:
+            self.scored += len(amounts)
+            self.disagreements += int(disagree.sum())
+            self.delta_sum += float(deltas.sum())
+            self.max_delta = max(self.max_delta, float(deltas.max()))
+            for i, count in enumerate(counts.tolist()):
+                self.delta_histogram[i] += count
+
+        if self.log_path is not None:
+            keep = disagree | (deltas >= self.min_log_delta)
+            if keep.any():
+                records = np.empty(int(keep.sum()), dtype=LOG_DTYPE)
+                records["timestamp"] = time.time()
+                records["amount"] = np.asarray(amounts, dtype=np.float64)[keep]
+                records["primary_score"] = primary_scores[keep]
+                records["shadow_score"] = shadow_scores[keep]
+                records["primary_fraud"] = primary_fraud[keep]
+                records["shadow_fraud"] = shadow_fraud[keep]
+                self._write(records)
+
+    def _write(self, records: np.ndarray):
+        if self.log_path.exists() and self.log_path.stat().st_size + records.nbytes > self.max_log_bytes:
+            os.replace(self.log_path, self.log_path.with_name(self.log_path.name + ".1"))
+        with open(self.log_path, "ab") as f:
+            records.tofile(f)
+        self.logged += len(records)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "shadow_version": self.bundle.version,
+                "queue_depth": self._queue.qsize(),
+                "queue_size": self._queue.maxsize,
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "scored": self.scored,
+                "errors": self.errors,
+                "disagreements": self.disagreements,
+                "disagreement_rate": self.disagreements / self.scored if self.scored else 0.0,
+                "mean_abs_delta": self.delta_sum / self.scored if self.scored else 0.0,
+                "max_abs_delta": self.max_delta,
+                "delta_histogram": dict(zip([str(bound) for bound in DELTA_BUCKETS] + ["+Inf"], self.delta_histogram)),
+                "log_path": str(self.log_path) if self.log_path else None,
+                "logged": self.logged,
+            }
@@ -0,0 +1,84 @@
+"""
+Lecture incrémentale des corps NDJSON/CSV et réponse NDJSON en flux (POST /predict/stream)
+
+Le corps de la requête est découpé en lignes au fil de la réception: seule la
+ligne en cours est gardée en mémoire (bornée par max_line_bytes). Le découpage
+se fait sur l'octet \\n, qui n'apparaît jamais à l'intérieur d'un caractère
+UTF-8 multi-octets. En CSV, la première ligne donne les colonnes; les champs
+entre guillemets ne peuvent pas contenir de retour à la ligne.
+"""
+
+import csv
+from typing import AsyncIterator, Tuple, Union
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPES = ("text/csv", "application/csv")
+
+
+def is_csv(content_type: str) -> bool:
+    return content_type.split(";", 1)[0].strip().lower() in CSV_MEDIA_TYPES
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    Lignes non vides du flux, numérotées à partir de 1
+
+    Raises:
+        ValueError: Ligne plus longue que max_line_bytes (le flux s'arrête)
+    """
+    buffer = b""
+    line_number = 0
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        buffer += chunk
+        if b"\n" not in chunk:
+            if len(buffer) > max_line_bytes:
+                raise ValueError(f"Ligne {line_number + 1} trop longue (> {max_line_bytes} octets)")
+            continue
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            line = line.rstrip(b"\r")
+            if line.strip():
+                yield line_number, line
+        if len(buffer) > max_line_bytes:
+            raise ValueError(f"Ligne {line_number + 1} trop longue (> {max_line_bytes} octets)")
+    if buffer.strip():
+        yield line_number + 1, buffer.rstrip(b"\r")
+
+
+async def iter_records(chunks: AsyncIterator[bytes], csv_format: bool,
+                       max_line_bytes: int) -> AsyncIterator[Tuple[int, Union[bytes, dict]]]:
+    """
+    (numéro de ligne, enregistrement): octets JSON bruts (NDJSON) ou dict colonne -> valeur (CSV)
+    Les champs CSV vides sont omis (valeurs par défaut du modèle).
+    """
+    header = None
+    async for line_number, line in iter_lines(chunks, max_line_bytes):
+        if not csv_format:
+            yield line_number, line
+            continue
+        row = next(csv.reader([line.decode("utf-8-sig" if header is None else "utf-8")]))
+        if header is None:
+            header = [name.strip() for name in row]
+            continue
+        yield line_number, {name: value for name, value in zip(header, row) if value != ""}
+
+
+class RequestStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse dont le générateur lit lui-même le corps de la requête
+
+    StreamingResponse écoute http.disconnect sur receive pendant l'envoi, ce qui
+    consommerait les morceaux du corps encore en cours de réception. Ici, seul le
+    générateur lit receive (via request.stream(), qui signale aussi la déconnexion).
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,1424 @@
+"""
+Tests unitaires pour le service de détection de fraude
+"""
+
+import asyncio
+import io
+import json
+import logging
+import math
+import os
+import queue
+import time
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from concurrent.futures import ThreadPoolExecutor
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+from common.features import FEATURE_NAMES, feature_seed, generate_feature_matrix, generate_features
+from common.structured_logging import (NonBlockingQueueHandler, RateLimitFilter, configure_logging,
+                                       request_id_var, shutdown_logging)
+from . import main
+from .main import app
+from .batching import MicroBatcher
+from .cache import ScoreCache
+from .executor import ScoringExecutor, allocated_cpus, cgroup_cpu_quota, parse_cpu_list
+from .metrics import STAGES, Histogram
+from .model_bundle import ModelBundle
+from .rules import RuleSet
+from .shadow import ShadowScorer, read_shadow_log
+from .streaming import iter_lines
+from .tree_engine import CompiledForest, fold_scaler
+
+FEATURE_COLUMNS = list(FEATURE_NAMES)
+
+
+def train_test_model(n_estimators=10, max_depth=6):
+    """Entraîne un petit Random Forest sur des données synthétiques (29 features)"""
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(500, len(FEATURE_COLUMNS)))
+    X[:, -1] = rng.exponential(2000, size=500)
+    y = ((X[:, 3] + X[:, 10] > 1.0) | (X[:, -1] > 6000)).astype(int)
+    model = RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth, random_state=0)
+    model.fit(X, y)
+    return model
+
+
+def install_test_model():
+    """Installe le modèle de test dans les globales du service"""
+    main.bundle = ModelBundle(train_test_model(), feature_columns=FEATURE_COLUMNS, version='test')
+    # Démarrage réussi: les endpoints de scoring suivent l'état de /ready
+    main.ready = True
+    # Sans cache: chaque test exerce le pipeline complet
+    main.score_cache = None
+
+
+client = TestClient(app)
+
+
+class TestFraudDetectionService:
+    """Tests pour le service de détection de fraude"""
+
+    def setup_method(self):
+        """Setup avant chaque test: modèle de test chargé en mémoire"""
+        install_test_model()
+
+    def teardown_method(self):
+        main.bundle = None
+
+    def test_health_check(self):
+        """Test du health check"""
+        response = client.get("/health")
+        assert response.status_code == 200
+        assert response.json()["model_loaded"] is True
+
+    def test_predict(self):
+        """Test de prédiction simple"""
+        response = client.post("/predict", json={"amount": 120.0, "merchant": "Amazon"})
+
+        assert response.status_code == 200
+        assert 0.0 <= response.json()["fraud_score"] <= 1.0
+        assert response.json()["reason"] is None
+
+    def test_predict_high_amount_rules(self):
+        """Test des règles métier: montant > 100K"""
+        response = client.post("/predict", json={"amount": 150000.0, "merchant": "XY"})
+
+        assert response.status_code == 200
+        assert response.json()["is_fraud"] is True
+        assert response.json()["fraud_score"] >= 0.95
+        assert response.json()["reason"] == "Montant tres eleve (>100K) | Marchand suspect"
+
+    def test_predict_without_model(self):
+        """Test de prédiction sans modèle chargé"""
+        main.bundle = None
+        response = client.post("/predict", json={"amount": 100.0, "merchant": "Amazon"})
+
+        assert response.status_code == 503
+
+
+class TestBatchPrediction:
+    """Tests pour l'endpoint /predict/batch"""
+
+    def setup_method(self):
+        install_test_model()
+
+    def teardown_method(self):
+        main.bundle = None
+
+    def test_batch_matches_single(self):
+        """Le lot retourne les mêmes résultats que /predict, dans le même ordre"""
+        transactions = [
+            {"transaction_id": f"TXN_{i}", "amount": amount, "merchant": merchant}
+            for i, (amount, merchant) in enumerate([
+                (12.5, "Carrefour"), (7000.0, "Zara"), (1500.0, "AB"),
+                (25000.0, "Apple"), (120000.0, "X"), (12.5, "Carrefour"),
+            ])
+        ]
+        response = client.post("/predict/batch", json={"transactions": transactions})
+
+        assert response.status_code == 200
+        assert response.json()["count"] == len(transactions)
+        results = response.json()["results"]
+        for transaction, result in zip(transactions, results):
+            single = client.post("/predict", json=transaction).json()
+            assert result == single
+            assert result["transaction_id"] == transaction["transaction_id"]
+
+    def test_batch_empty(self):
+        """Un lot vide est refusé"""
+        response = client.post("/predict/batch", json={"transactions": []})
+
+        assert response.status_code == 422
+
+    def test_batch_without_model(self):
+        """Test du lot sans modèle chargé"""
+        main.bundle = None
+        response = client.post("/predict/batch", json={"transactions": [{"amount": 10.0, "merchant": "Amazon"}]})
+
+        assert response.status_code == 503
+
+
+class TestMicroBatcher:
+    """Tests pour le micro-batching des requêtes concurrentes"""
+
+    def setup_method(self):
+        install_test_model()
+
+    def teardown_method(self):
+        main.bundle = None
+        main.batcher = None
+
+    def test_concurrent_requests_are_batched(self):
+        """Les requêtes concurrentes sont regroupées et chacune reçoit son propre résultat"""
+        calls = []
+
+        def score_fn(items):
+            calls.append(len(items))
+            return [item * 2 for item in items]
+
+        async def run():
+            batcher = MicroBatcher(score_fn, max_batch_size=4, max_wait_ms=50)
+            results = await asyncio.gather(*[batcher.submit(i) for i in range(10)])
+            await batcher.stop()
+            return batcher, results
+
+        batcher, results = asyncio.run(run())
+
+        assert results == [i * 2 for i in range(10)]
+        assert calls == [4, 4, 2]
+        assert batcher.stats()["batches"] == 3
+        assert batcher.stats()["max_observed_batch_size"] == 4
+        assert batcher.stats()["flush_on_size"] == 2
+
+    def test_errors_are_propagated(self):
+        """Une erreur de scoring est propagée à tous les appelants du lot"""
+        def score_fn(items):
+            raise ValueError("boom")
+
+        async def run():
+            batcher = MicroBatcher(score_fn, max_batch_size=8, max_wait_ms=1)
+            results = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+            await batcher.stop()
+            return results
+
+        assert all(isinstance(result, ValueError) for result in asyncio.run(run()))
+
+    def test_stop_fails_pending_callers(self):
+        """stop() échoue le lot en cours de scoring et les requêtes encore en file"""
+        async def run():
+            started = asyncio.Event()
+
+            async def score_fn(items):
+                started.set()
+                await asyncio.sleep(10)
+
+            batcher = MicroBatcher(score_fn, max_batch_size=2, max_wait_ms=1)
+            calls = [asyncio.ensure_future(batcher.submit(i)) for i in range(5)]
+            await asyncio.wait_for(started.wait(), timeout=1)
+            await batcher.stop()
+            return await asyncio.wait_for(asyncio.gather(*calls, return_exceptions=True), timeout=1)
+
+        results = asyncio.run(run())
+
+        assert len(results) == 5
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    def test_predict_through_batcher(self):
+        """/predict garde le même contrat HTTP avec le micro-batching actif"""
+        transaction = {"amount": 7000.0, "merchant": "Zara"}
+        expected = client.post("/predict", json=transaction).json()
+
+        main.batcher = MicroBatcher(main.score_transactions, max_batch_size=8, max_wait_ms=1)
+        response = client.post("/predict", json=transaction)
+
+        assert response.status_code == 200
+        assert response.json() == expected
+        assert client.get("/batching/stats").json()["items"] == 1
+
+
+class TestCompiledForest:
+    """Équivalence du moteur compilé avec RandomForestClassifier.predict_proba"""
+
+    def setup_method(self):
+        self.model = train_test_model(n_estimators=25, max_depth=8)
+        self.forest = CompiledForest.from_sklearn(self.model)
+        rng = np.random.RandomState(1)
+        self.X = rng.normal(scale=2.0, size=(300, len(FEATURE_COLUMNS))).astype(np.float32)
+        self.X[:, -1] = rng.exponential(3000, size=300)
+
+    def teardown_method(self):
+        main.bundle = None
+
+    @pytest.mark.parametrize("n_rows", [1, 7, 32, 33, 300])
+    def test_predict_proba_matches_sklearn(self, n_rows):
+        """Probabilités identiques en parcours dense (petits lots) et compacté (gros lots)"""
+        expected = self.model.predict_proba(self.X[:n_rows])
+        np.testing.assert_allclose(self.forest.predict_proba(self.X[:n_rows]), expected, rtol=0, atol=1e-12)
+
+    def test_single_row_vector(self):
+        """Une ligne 1D est acceptée comme une matrice 1 x 29"""
+        np.testing.assert_allclose(self.forest.predict_proba(self.X[0]), self.model.predict_proba(self.X[:1]), atol=1e-12)
+
+    def test_thresholds_exactly_on_split(self):
+        """Valeurs égales aux seuils: même branche que sklearn (X <= seuil -> gauche)"""
+        X = self.X[:50].copy()
+        internal = self.forest.left != np.arange(self.forest.node_count)
+        for row, node in enumerate(np.flatnonzero(internal)[:50]):
+            X[row, self.forest.feature[node]] = np.float32(self.forest.threshold[node])
+        np.testing.assert_allclose(self.forest.predict_proba(X), self.model.predict_proba(X), atol=1e-12)
+
+    def test_apply_matches_sklearn_leaves(self):
+        """Les feuilles atteintes correspondent à model.apply"""
+        offsets = self.forest.roots
+        np.testing.assert_array_equal(self.forest.apply(self.X) - offsets, self.model.apply(self.X))
+
+    def test_save_load_roundtrip(self, tmp_path):
+        """Forêt sauvegardée puis rechargée (y compris en mmap)"""
+        self.forest.save(tmp_path)
+        for mmap_mode in (None, 'r'):
+            loaded = CompiledForest.load(tmp_path, mmap_mode=mmap_mode)
+            np.testing.assert_allclose(loaded.predict_proba(self.X), self.model.predict_proba(self.X), atol=1e-12)
+            np.testing.assert_array_equal(loaded.classes_, self.model.classes_)
+
+    def test_wrong_feature_count(self):
+        """Nombre de features incorrect refusé"""
+        with pytest.raises(ValueError):
+            self.forest.predict_proba(np.zeros((1, 5)))
+
+    def test_real_model(self):
+        """Équivalence sur random_forest_model.pkl s'il est disponible"""
+        if not main.MODEL_PATH_RF.exists():
+            pytest.skip("random_forest_model.pkl non disponible")
+        import joblib
+        model = joblib.load(main.MODEL_PATH_RF)
+        forest = CompiledForest.from_sklearn(model)
+        np.testing.assert_allclose(forest.predict_proba(self.X), model.predict_proba(self.X), atol=1e-12)
+
+    @pytest.mark.parametrize("threshold", [0.1, 0.3, 0.5, 0.8])
+    def test_predict_decision_matches_threshold(self, threshold):
+        """Arrêt anticipé: même décision que predict_proba, scores exacts là où annoncés"""
+        expected = self.forest.predict_proba(self.X)[:, 1]
+        scores, exact, trees = self.forest.predict_decision(self.X, threshold, stride=5)
+
+        np.testing.assert_array_equal(scores >= threshold, expected >= threshold)
+        np.testing.assert_allclose(scores[exact], expected[exact], rtol=0, atol=1e-12)
+        assert np.all(trees[exact] == self.forest.n_estimators)
+        assert np.all(trees[~exact] < self.forest.n_estimators)
+
+    def test_service_uses_compiled_forest(self):
+        """Le service donne les mêmes réponses avec le moteur compilé"""
+        install_test_model()
+        transactions = [{"amount": amount, "merchant": "Zara"} for amount in (10.0, 900.0, 7000.0, 30000.0)]
+        expected = client.post("/predict/batch", json={"transactions": transactions}).json()
+
+        forest = CompiledForest.from_sklearn(main.bundle.model)
+        main.bundle = ModelBundle(forest, feature_columns=FEATURE_COLUMNS, model_type='compiled_forest',
+                                  version='test', compiled_forest=forest)
+        response = client.post("/predict/batch", json={"transactions": transactions})
+
+        assert response.status_code == 200
+        assert response.json() == expected
+
+
+class TestScoringExecutor:
+    """Tests de la couche d'exécution du scoring (inline, thread, process)"""
+
+    def teardown_method(self):
+        if main.executor is not None:
+            main.executor.shutdown()
+        main.executor = None
+        main.bundle = None
+
+    @pytest.mark.parametrize("mode", ["inline", "thread", "process"])
+    def test_modes(self, mode):
+        """Chaque mode retourne le résultat de la fonction"""
+        executor = ScoringExecutor(mode, workers=2, preload=int)
+        try:
+            assert asyncio.run(executor.run(math.sqrt, 16.0)) == 4.0
+        finally:
+            executor.shutdown()
+
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError):
+            ScoringExecutor("gpu")
+
+    def test_parse_cpu_list(self):
+        assert parse_cpu_list("0,2-4, 7") == [0, 2, 3, 4, 7]
+        assert parse_cpu_list(None) == []
+
+    @pytest.mark.skipif(not hasattr(os, "sched_getaffinity"), reason="affinité CPU non supportée")
+    def test_thread_cpu_affinity(self):
+        """Les threads du pool sont épinglés sur les CPU configurés"""
+        cpu = sorted(os.sched_getaffinity(0))[0]
+        executor = ScoringExecutor("thread", workers=1, cpu_affinity=[cpu])
+        try:
+            assert asyncio.run(executor.run(os.sched_getaffinity, 0)) == {cpu}
+        finally:
+            executor.shutdown()
+
+    def test_predict_in_thread_pool(self):
+        """/predict et /predict/batch donnent les mêmes réponses hors de la boucle asyncio"""
+        install_test_model()
+        transactions = [{"amount": amount, "merchant": "Fnac"} for amount in (15.0, 6000.0, 60000.0)]
+        expected = client.post("/predict/batch", json={"transactions": transactions}).json()
+
+        main.executor = ScoringExecutor("thread", workers=2)
+        assert client.post("/predict/batch", json={"transactions": transactions}).json() == expected
+        assert client.post("/predict", json=transactions[1]).json() == expected["results"][1]
+
+
+class TestInferenceParallelism:
+    """n_jobs du pickle ignoré, threads selon la taille du lot, bornés par les CPU alloués"""
+
+    def test_cgroup_quota(self, tmp_path):
+        """cgroup v2 (cpu.max) puis v1 (cfs_quota_us); None sans limite"""
+        assert cgroup_cpu_quota(tmp_path) is None
+        (tmp_path / "cpu.max").write_text("max 100000\n")
+        assert cgroup_cpu_quota(tmp_path) is None
+        (tmp_path / "cpu.max").write_text("150000 100000\n")
+        assert cgroup_cpu_quota(tmp_path) == 1.5
+
+        v1 = tmp_path / "v1"
+        (v1 / "cpu").mkdir(parents=True)
+        (v1 / "cpu" / "cpu.cfs_quota_us").write_text("-1\n")
+        (v1 / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+        assert cgroup_cpu_quota(v1) is None
+        (v1 / "cpu" / "cpu.cfs_quota_us").write_text("200000\n")
+        assert cgroup_cpu_quota(v1) == 2.0
+
+    def test_allocated_cpus_bounded_by_quota(self, tmp_path):
+        (tmp_path / "cpu.max").write_text("50000 100000\n")
+        assert allocated_cpus(tmp_path) == 1
+        (tmp_path / "cpu.max").write_text("max 100000\n")
+        assert allocated_cpus(tmp_path) >= 1
+
+    def test_pickled_n_jobs_ignored(self):
+        model = train_test_model()
+        model.n_jobs = -1
+        ModelBundle(model)
+        assert model.n_jobs is None
+
+    def test_inference_jobs_by_batch_size(self):
+        bundle = ModelBundle(train_test_model(), parallel_min_rows=100, max_jobs=4)
+        assert [bundle.inference_jobs(n) for n in (1, 99, 100, 250, 10000)] == [1, 1, 2, 3, 4]
+        assert ModelBundle(train_test_model(), parallel_min_rows=1).inference_jobs(10000) == 1
+
+    def test_threaded_scores_match_serial(self):
+        """Mêmes scores en série et en threads; le réglage ne fuit pas hors de l'appel"""
+        from joblib import effective_n_jobs
+        model = train_test_model(n_estimators=8)
+        X = np.random.RandomState(4).normal(size=(300, len(FEATURE_COLUMNS)))
+        expected = model.predict_proba(X)[:, 1]
+        bundle = ModelBundle(model, parallel_min_rows=100, max_jobs=2)
+
+        np.testing.assert_allclose(bundle.predict_scores(X), expected, atol=1e-12)
+        np.testing.assert_allclose(bundle.predict_scores(X[:10]), expected[:10], atol=1e-12)
+        assert effective_n_jobs(model.n_jobs) == 1
+
+
+class TestFeatureGeneration:
+    """Tests du générateur de features partagé (common.features)"""
+
+    AMOUNTS = [12.5, 999.99, 5000.0, 5000.01, 7000.0, 150000.0, 12.5]
+    MERCHANTS = ["Carrefour", "Fnac", "AB", "Zara", "X", "Apple", "Carrefour"]
+
+    def test_deterministic(self):
+        """Mêmes (merchant, amount) -> mêmes features, graine issue du MD5"""
+        np.testing.assert_array_equal(generate_features(7000.0, "Zara"), generate_features(7000.0, "Zara"))
+        assert feature_seed("Zara", 7000) == feature_seed("Zara", 7000.0)
+        assert 0 <= feature_seed("Zara", 7000.0) < 10000
+
+    def test_batch_matches_single_bit_for_bit(self):
+        """La version lot donne exactement les mêmes valeurs que la version unitaire"""
+        matrix = generate_feature_matrix(self.AMOUNTS, self.MERCHANTS)
+
+        assert matrix.shape == (len(self.AMOUNTS), 29)
+        assert matrix.dtype == np.float32
+        for row, (amount, merchant) in enumerate(zip(self.AMOUNTS, self.MERCHANTS)):
+            assert generate_features(amount, merchant).tobytes() == matrix[row].tobytes()
+
+    def test_suspicious_amounts(self):
+        """Au-delà de 5000, V4/V11/V12/V14 sont dans [2, 4] en valeur absolue"""
+        features = generate_features(7000.0, "Zara")
+        suspicious = [FEATURE_NAMES.index(name) for name in ("V4", "V11", "V12", "V14")]
+        assert np.all((np.abs(features[suspicious]) >= 2) & (np.abs(features[suspicious]) <= 4))
+        assert features[-1] == 7000.0
+
+    def test_thread_safe(self):
+        """Aucune interférence entre threads (pas de graine globale)"""
+        expected = generate_feature_matrix(self.AMOUNTS * 20, self.MERCHANTS * 20)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            rows = list(pool.map(generate_features, self.AMOUNTS * 20, self.MERCHANTS * 20))
+        np.testing.assert_array_equal(np.stack(rows), expected)
+
+    def test_feature_columns_order(self):
+        """La matrice du service suit l'ordre de feature_columns.json"""
+        install_test_model()
+        transactions = [main.SimpleTransactionRequest(amount=amount, merchant=merchant)
+                        for amount, merchant in zip(self.AMOUNTS, self.MERCHANTS)]
+        reordered = ModelBundle(main.bundle.model, feature_columns=list(reversed(FEATURE_NAMES)))
+        main.bundle = None
+        matrix = reordered.feature_matrix([t.amount for t in transactions], [t.merchant for t in transactions])
+        np.testing.assert_array_equal(matrix, generate_feature_matrix(self.AMOUNTS, self.MERCHANTS)[:, ::-1])
+
+
+class TestScoreCache:
+    """Tests du cache LRU/TTL des scores"""
+
+    def setup_method(self):
+        install_test_model()
+        main.score_cache = ScoreCache(max_size=100)
+
+    def teardown_method(self):
+        main.bundle = None
+        main.score_cache = None
+
+    def test_lru_eviction(self):
+        cache = ScoreCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1 and cache.get("c") == 3
+        assert cache.stats()["evictions"] == 1
+
+    def test_ttl_expiration(self):
+        cache = ScoreCache(max_size=10, ttl_seconds=0.01)
+        cache.put("a", 1)
+        time.sleep(0.02)
+
+        assert cache.get("a") is None
+        assert cache.stats()["expirations"] == 1
+
+    def test_concurrent_access(self):
+        cache = ScoreCache(max_size=50)
+
+        def worker(i):
+            for j in range(200):
+                cache.put((i, j % 60), j)
+                cache.get((i, (j * 7) % 60))
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(worker, range(8)))
+
+        stats = cache.stats()
+        assert len(cache) <= 50
+        assert stats["hits"] + stats["misses"] == 8 * 200
+
+    def test_repeated_transactions_hit_cache(self):
+        """Une transaction répétée est servie par le cache, avec son propre transaction_id"""
+        first = client.post("/predict", json={"transaction_id": "T1", "amount": 49.99, "merchant": "Netflix"}).json()
+        second = client.post("/predict", json={"transaction_id": "T2", "amount": 49.99, "merchant": "Netflix"}).json()
+
+        assert second == {**first, "transaction_id": "T2"}
+        stats = client.get("/cache/stats").json()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+
+    def test_batch_uses_cache(self):
+        """Dans un lot, seules les transactions absentes du cache sont scorées"""
+        client.post("/predict", json={"amount": 49.99, "merchant": "Netflix"})
+        transactions = [{"amount": 49.99, "merchant": "Netflix"}, {"amount": 12.0, "merchant": "Spotify"}]
+        response = client.post("/predict/batch", json={"transactions": transactions})
+
+        assert response.status_code == 200
+        assert main.score_cache.stats()["hits"] == 1
+
+    def test_model_version_in_key(self):
+        """Un changement de version du modèle ne relit pas les anciens scores"""
+        client.post("/predict", json={"amount": 49.99, "merchant": "Netflix"})
+        main.bundle = ModelBundle(main.bundle.model, feature_columns=FEATURE_COLUMNS, version='test-v2')
+        client.post("/predict", json={"amount": 49.99, "merchant": "Netflix"})
+
+        assert main.score_cache.stats()["hits"] == 0
+
+
+class TestScalerFolding:
+    """Repliement du StandardScaler dans les seuils de la forêt compilée"""
+
+    def setup_method(self):
+        rng = np.random.RandomState(2)
+        self.X = rng.normal(loc=3.0, scale=5.0, size=(600, len(FEATURE_COLUMNS))).astype(np.float32)
+        self.X[:, -1] = rng.exponential(3000, size=600)
+        y = ((self.X[:, 3] + self.X[:, 10] > 8.0) | (self.X[:, -1] > 6000)).astype(int)
+        self.scaler = StandardScaler().fit(self.X)
+        self.model = RandomForestClassifier(n_estimators=15, max_depth=8, random_state=0)
+        self.model.fit(self.scaler.transform(self.X), y)
+        self.forest = CompiledForest.from_sklearn(self.model)
+
+    def teardown_method(self):
+        main.bundle = None
+
+    @pytest.mark.parametrize("n_rows", [1, 20, 600])
+    def test_folded_matches_scaler_pipeline(self, n_rows):
+        """Forêt repliée sur features brutes == sklearn sur features normalisées"""
+        folded = fold_scaler(self.forest, self.scaler)
+        expected = self.model.predict_proba(self.scaler.transform(self.X[:n_rows]))
+
+        assert folded.scaler_folded
+        np.testing.assert_allclose(folded.predict_proba(self.X[:n_rows]), expected, atol=1e-9)
+
+    def test_verification_rejects_wrong_scaler(self):
+        """La vérification sur échantillon refuse un repliement non équivalent"""
+        class InconsistentScaler:
+            # mean_ ne correspond pas à transform(): les seuils repliés sont faux
+            mean_ = self.scaler.mean_ + self.scaler.scale_
+            scale_ = self.scaler.scale_
+            transform = self.scaler.transform
+
+        with pytest.raises(ValueError):
+            fold_scaler(self.forest, InconsistentScaler())
+        with pytest.raises(ValueError):
+            fold_scaler(fold_scaler(self.forest, self.scaler), self.scaler)
+
+    def test_save_load_keeps_folded_flag(self, tmp_path):
+        fold_scaler(self.forest, self.scaler).save(tmp_path)
+        assert CompiledForest.load(tmp_path).scaler_folded
+
+    def test_service_single_and_batch(self):
+        """Réponses identiques avec et sans repliement, en unitaire et en lot"""
+        main.score_cache = None
+        main.bundle = ModelBundle(self.model, self.scaler, FEATURE_COLUMNS, version='test')
+        transactions = [{"amount": amount, "merchant": "Zara"} for amount in (10.0, 900.0, 7000.0, 30000.0)]
+        expected_batch = client.post("/predict/batch", json={"transactions": transactions}).json()
+        expected_single = client.post("/predict", json=transactions[2]).json()
+
+        main.bundle = ModelBundle(self.model, self.scaler, FEATURE_COLUMNS, version='test',
+                                  compiled_forest=fold_scaler(self.forest, self.scaler))
+        assert client.post("/predict/batch", json={"transactions": transactions}).json() == expected_batch
+        assert client.post("/predict", json=transactions[2]).json() == expected_single
+
+
+class TestModelReload:
+    """Rechargement à chaud du modèle (remplacement atomique du bundle)"""
+
+    def setup_method(self):
+        install_test_model()
+
+    def teardown_method(self):
+        main.bundle = None
+
+    def write_model(self, model_dir, **kwargs):
+        import joblib
+        joblib.dump(train_test_model(**kwargs), model_dir / main.MODEL_FILE)
+
+    def test_reload_swaps_bundle(self, tmp_path, monkeypatch):
+        """Le nouveau modèle est activé et sa version figure dans les réponses"""
+        monkeypatch.setattr(main, "MODEL_DIR", tmp_path)
+        self.write_model(tmp_path, n_estimators=12)
+
+        response = client.post("/admin/reload")
+        assert response.status_code == 200
+        report = response.json()
+        assert report["status"] == "reloaded" and report["previous_version"] == 'test'
+        assert report["canary"]["transactions"] == len(main.CANARY_TRANSACTIONS)
+
+        prediction = client.post("/predict", json={"amount": 49.99, "merchant": "Netflix"}).json()
+        assert prediction["model_version"] == report["model_version"]
+        assert client.get("/model").json()["model_version"] == report["model_version"]
+
+        # Fichiers inchangés: pas de nouveau remplacement
+        assert client.post("/admin/reload").json()["status"] == "unchanged"
+
+    def test_in_flight_requests_keep_their_bundle(self, tmp_path, monkeypatch):
+        """Un lot commencé avec l'ancien bundle est scoré entièrement par celui-ci"""
+        monkeypatch.setattr(main, "MODEL_DIR", tmp_path)
+        self.write_model(tmp_path, n_estimators=12)
+        old_bundle = main.bundle
+        main.reload_model()
+
+        transactions = [main.SimpleTransactionRequest(amount=amount, merchant="Zara") for amount in (10.0, 7000.0)]
+        results = main.score_transactions(transactions, old_bundle)
+        assert all(result.model_version == 'test' for result in results)
+        assert main.bundle is not old_bundle
+
+    def test_canary_rejection_keeps_current_model(self, tmp_path, monkeypatch):
+        """Un modèle refusé par la validation n'est pas activé"""
+        monkeypatch.setattr(main, "MODEL_DIR", tmp_path)
+        monkeypatch.setattr(main, "RELOAD_MAX_CANARY_DELTA", -1.0)
+        self.write_model(tmp_path, n_estimators=12)
+        current = main.bundle
+
+        response = client.post("/admin/reload")
+        assert response.status_code == 422
+        assert main.bundle is current
+
+    def test_missing_model_keeps_current_model(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(main, "MODEL_DIR", tmp_path)
+        current = main.bundle
+
+        assert client.post("/admin/reload").status_code == 422
+        assert main.bundle is current
+
+    def test_admin_token(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(main, "MODEL_DIR", tmp_path)
+        monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+        self.write_model(tmp_path, n_estimators=12)
+
+        assert client.post("/admin/reload").status_code == 403
+        assert client.post("/admin/reload", headers={"X-Admin-Token": "secret"}).status_code == 200
+
+
+class TestSharedModelLoading:
+    """Forêt compilée mappée en lecture seule (MODEL_MMAP)"""
+
+    def setup_method(self):
+        self.model = train_test_model(n_estimators=12)
+        rng = np.random.RandomState(3)
+        self.X = rng.normal(scale=2.0, size=(40, len(FEATURE_COLUMNS))).astype(np.float32)
+
+    def test_mmap_load_compiles_once(self, tmp_path):
+        """Le pickle est compilé une fois puis les tableaux sont mappés en lecture seule"""
+        import joblib
+        joblib.dump(self.model, tmp_path / main.MODEL_FILE)
+
+        bundle = ModelBundle.load(tmp_path, mmap=True)
+        assert bundle.model_type == 'compiled_forest'
+        assert isinstance(bundle.compiled_forest.threshold, np.memmap)
+        assert not bundle.compiled_forest.threshold.flags.writeable
+        assert bundle.describe()["mmap"]
+        np.testing.assert_allclose(bundle.predict_scores(self.X), self.model.predict_proba(self.X)[:, 1], atol=1e-12)
+
+        # Deuxième worker: réutilise le dossier compilé
+        meta_mtime = (tmp_path / main.COMPILED_DIR / "meta.json").stat().st_mtime_ns
+        assert ModelBundle.load(tmp_path, mmap=True).version == bundle.version
+        assert (tmp_path / main.COMPILED_DIR / "meta.json").stat().st_mtime_ns == meta_mtime
+        assert sorted(path.name for path in tmp_path.iterdir()) == sorted([main.MODEL_FILE, main.COMPILED_DIR])
+
+    def test_newer_pickle_is_recompiled(self, tmp_path):
+        """Un pickle plus récent que la forêt compilée la remplace sans toucher aux fichiers mappés"""
+        import joblib
+        joblib.dump(self.model, tmp_path / main.MODEL_FILE)
+        old = ModelBundle.load(tmp_path, mmap=True)
+
+        new_model = train_test_model(n_estimators=5)
+        joblib.dump(new_model, tmp_path / main.MODEL_FILE)
+        os.utime(tmp_path / main.MODEL_FILE, ns=(time.time_ns() + 10**9,) * 2)
+        new = ModelBundle.load(tmp_path, mmap=True)
+
+        assert new.version != old.version
+        np.testing.assert_allclose(new.predict_scores(self.X), new_model.predict_proba(self.X)[:, 1], atol=1e-12)
+        np.testing.assert_allclose(old.predict_scores(self.X), self.model.predict_proba(self.X)[:, 1], atol=1e-12)
+
+
+    def dump_with_scaler(self, tmp_path, scale=2.0):
+        import joblib
+        joblib.dump(self.model, tmp_path / main.MODEL_FILE)
+        scaler = StandardScaler().fit(self.X * scale)
+        joblib.dump(scaler, tmp_path / main.SCALER_FILE)
+        return scaler
+
+    def test_mmap_without_fold(self, tmp_path):
+        """FOLD_SCALER=false avec mmap: forêt recompilée sans repliement, scaler.transform appliqué"""
+        scaler = self.dump_with_scaler(tmp_path)
+        expected = self.model.predict_proba(scaler.transform(self.X))[:, 1]
+        assert ModelBundle.load(tmp_path, mmap=True).compiled_forest.scaler_folded
+
+        bundle = ModelBundle.load(tmp_path, fold=False, mmap=True)
+        assert not bundle.compiled_forest.scaler_folded
+        assert bundle.scaler is not None
+        np.testing.assert_allclose(bundle.predict_scores(self.X), expected, atol=1e-9)
+
+    def test_new_scaler_is_recompiled(self, tmp_path):
+        """Un scaler.pkl remplacé seul invalide la forêt compilée où l'ancien était replié"""
+        import joblib
+        self.dump_with_scaler(tmp_path)
+        old = ModelBundle.load(tmp_path, mmap=True)
+
+        new_scaler = StandardScaler().fit(self.X * 5.0)
+        joblib.dump(new_scaler, tmp_path / main.SCALER_FILE)
+        os.utime(tmp_path / main.SCALER_FILE, ns=(time.time_ns() + 10**9,) * 2)
+        new = ModelBundle.load(tmp_path, mmap=True)
+
+        assert new.version != old.version
+        assert new.compiled_forest.scaler_folded
+        np.testing.assert_allclose(new.predict_scores(self.X),
+                                   self.model.predict_proba(new_scaler.transform(self.X))[:, 1], atol=1e-9)
+
+
+class TestReadiness:
+    """Chargement en arrière-plan: /health (liveness) et /ready (readiness)"""
+
+    def teardown_method(self):
+        main.bundle = None
+        main.ready = False
+        main.startup_error = None
+
+    def test_ready_after_warm_prediction(self):
+        """/ready répond 503 tant que la prédiction de préchauffage n'a pas réussi"""
+        install_test_model()
+        main.ready = False
+        assert client.get("/ready").status_code == 503
+        assert client.get("/health").json()["ready"] is False
+        assert client.post("/predict", json={"amount": 10.0, "merchant": "Zara"}).status_code == 503
+
+        asyncio.run(main.warm_start())
+        response = client.get("/ready")
+        assert response.status_code == 200
+        body = response.json()
+        assert body["status"] == "ready" and body["model_version"] == 'test'
+        assert {"import", "model_load", "warmup", "total"} <= set(body["startup_seconds"])
+
+    def test_failed_startup_stays_alive(self, tmp_path, monkeypatch):
+        """Modèle introuvable: /ready signale l'échec, /health répond toujours"""
+        monkeypatch.setattr(main, "MODEL_DIR", tmp_path)
+        asyncio.run(main.warm_start())
+
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "failed" and "FileNotFoundError" in response.json()["error"]
+        assert client.get("/health").status_code == 200
+
+    def test_failed_warmup_refuses_scoring(self, monkeypatch):
+        """Modèle chargé mais préchauffage en échec: les endpoints de scoring répondent 503 comme /ready"""
+        install_test_model()
+        main.ready = False
+
+        async def failing_execute_scoring(*args, **kwargs):
+            raise RuntimeError("pool indisponible")
+        monkeypatch.setattr(main, "execute_scoring", failing_execute_scoring)
+        asyncio.run(main.warm_start())
+        transaction = {"amount": 10.0, "merchant": "Zara"}
+
+        assert main.bundle is not None and client.get("/ready").status_code == 503
+        for path, body in (("/predict", transaction), ("/predict/batch", {"transactions": [transaction]})):
+            response = client.post(path, json=body)
+            assert response.status_code == 503
+            assert "RuntimeError: pool indisponible" in response.json()["detail"]
+        assert client.post("/predict/stream", content=json.dumps(transaction)).status_code == 503
+
+    def test_reload_after_failed_startup(self, tmp_path, monkeypatch):
+        """Démarrage en échec (modèle absent) puis /admin/reload réussi: le scoring reprend sans redémarrage"""
+        import joblib
+        monkeypatch.setattr(main, "MODEL_DIR", tmp_path)
+        asyncio.run(main.warm_start())
+        transaction = {"amount": 10.0, "merchant": "Zara"}
+        assert client.post("/predict", json=transaction).status_code == 503
+
+        joblib.dump(train_test_model(), tmp_path / main.MODEL_FILE)
+        assert client.post("/admin/reload").json()["status"] == "reloaded"
+
+        assert client.post("/predict", json=transaction).status_code == 200
+        assert client.get("/ready").json()["status"] == "ready" and main.startup_error is None
+
+
+class TestMetrics:
+    """Instrumentation des étapes et exposition /metrics"""
+
+    def setup_method(self):
+        install_test_model()
+
+    def teardown_method(self):
+        main.bundle = None
+
+    def test_histogram_render(self):
+        """Buckets cumulés, +Inf, somme et effectif au format texte"""
+        histogram = Histogram("latency_seconds", "Latence", buckets=(0.1, 1.0), label_names=("stage",))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(value, stage='a"b')
+
+        lines = histogram.render()
+        assert 'latency_seconds_bucket{stage="a\\"b",le="0.1"} 1' in lines
+        assert 'latency_seconds_bucket{stage="a\\"b",le="1.0"} 3' in lines
+        assert 'latency_seconds_bucket{stage="a\\"b",le="+Inf"} 4' in lines
+        assert 'latency_seconds_count{stage="a\\"b"} 4' in lines
+
+    def test_stages_and_decisions_recorded(self):
+        """Chaque étape du scoring est chronométrée; les décisions sont comptées"""
+        before = {stage: main.STAGE_SECONDS.count(stage=stage) for stage in STAGES}
+        fraud_before = main.DECISIONS.value(decision="fraud")
+        legit_before = main.DECISIONS.value(decision="legit")
+
+        client.post("/predict", json={"amount": 75000.0, "merchant": "X"})
+        client.post("/predict/batch", json={"transactions": [{"amount": 12.0, "merchant": "Zara"}] * 3})
+
+        for stage in STAGES:
+            assert main.STAGE_SECONDS.count(stage=stage) == before[stage] + 2
+        assert main.DECISIONS.value(decision="fraud") == fraud_before + 1
+        assert main.DECISIONS.value(decision="legit") == legit_before + 3
+
+    def test_metrics_endpoint(self):
+        client.post("/predict", json={"amount": 49.99, "merchant": "Netflix"})
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "# TYPE fraud_scoring_stage_seconds histogram" in response.text
+        assert 'fraud_model_info{version="test",type="random_forest"} 1' in response.text
+
+    def test_errors_counted(self):
+        main.bundle = None
+        before = main.ERRORS.value(endpoint="/predict", type="model_unavailable")
+        assert client.post("/predict", json={"amount": 10.0, "merchant": "Zara"}).status_code == 503
+        assert main.ERRORS.value(endpoint="/predict", type="model_unavailable") == before + 1
+
+
+class TestStructuredLogging:
+    """Logs JSON via file d'attente (common/structured_logging.py)"""
+
+    def setup_method(self):
+        self.stream = io.StringIO()
+
+    def configure(self, name, **kwargs):
+        self.name = name
+        return configure_logging(name, stream=self.stream, **kwargs)
+
+    def records(self):
+        shutdown_logging(self.name)
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_json_lines_with_request_id(self):
+        logger = self.configure("test_json_lines")
+        token = request_id_var.set("req-42")
+        try:
+            logger.info("Transaction %s", "T1", extra={"amount": 12.5})
+        finally:
+            request_id_var.reset(token)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("Erreur")
+
+        first, second = self.records()
+        assert first["message"] == "Transaction T1" and first["amount"] == 12.5
+        assert first["request_id"] == "req-42" and first["service"] == "test_json_lines"
+        assert second["level"] == "ERROR" and "ValueError: boom" in second["exception"]
+        assert "request_id" not in second
+
+    def test_sampling_only_marked_info_events(self):
+        logger = self.configure("test_sampling", sample_rate=0.0)
+        for _ in range(5):
+            logger.info("Volume", extra={"sample": True})
+        logger.info("Toujours gardé")
+        logger.warning("Avertissement", extra={"sample": True})
+
+        assert [record["message"] for record in self.records()] == ["Toujours gardé", "Avertissement"]
+
+    def test_rate_limit_reports_suppressed(self):
+        logger = self.configure("test_rate_limit", rate_limits={logging.INFO: 2})
+        for i in range(10):
+            logger.info("Message %d", i)
+        logger.warning("Non limité")
+
+        assert [record["message"] for record in self.records()] == ["Message 0", "Message 1", "Non limité"]
+
+        limiter = RateLimitFilter({logging.INFO: 1000})
+        limiter._buckets[logging.INFO][0] = 0.0
+        record = logging.LogRecord("x", logging.INFO, "", 0, "m", (), None)
+        assert not limiter.filter(record)
+        time.sleep(0.01)
+        assert limiter.filter(record) and record.suppressed == 1
+
+    def test_full_queue_drops_without_blocking(self):
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=2))
+        for _ in range(5):
+            handler.handle(logging.LogRecord("x", logging.INFO, "", 0, "m", (), None))
+        assert handler.queue.qsize() == 2 and handler.dropped == 3
+
+    def test_record_is_snapshot_at_log_time(self):
+        """Les args et extras mutables sont figés à l'appel, pas au formatage par le listener"""
+        handler = NonBlockingQueueHandler(queue.Queue())
+        state, tags = {"step": 1}, ["a"]
+        record = logging.LogRecord("x", logging.INFO, "", 0, "État %s", (state,), None)
+        record.tags = tags
+        handler.handle(record)
+        state["step"], tags[:] = 2, ["b"]
+
+        queued = handler.queue.get_nowait()
+        assert queued.getMessage() == "État {'step': 1}" and queued.args is None
+        assert queued.tags == ["a"]
+
+    def test_request_id_header_roundtrip(self):
+        """X-Request-ID repris de la requête ou généré, et renvoyé dans la réponse"""
+        assert client.get("/health", headers={"X-Request-ID": "abc"}).headers["x-request-id"] == "abc"
+        assert len(client.get("/health").headers["x-request-id"]) == 32
+
+
+def legacy_business_rules(amount, merchant):
+    """Chaîne if/elif historique, référence pour le moteur de règles"""
+    risk_score = 0.0
+    reasons = []
+    if amount > 100000:
+        risk_score = 0.95
+        reasons.append("Montant tres eleve (>100K)")
+    elif amount > 50000:
+        risk_score = 0.85
+        reasons.append("Montant eleve (>50K)")
+    elif amount > 20000:
+        risk_score = 0.75
+        reasons.append("Montant suspect (>20K)")
+    elif amount > 10000:
+        risk_score = 0.65
+        reasons.append("Montant moyen (>10K)")
+    elif amount > 5000:
+        risk_score = 0.55
+        reasons.append("Montant suspect (>5K)")
+    else:
+        risk_score = 0.1
+    if len(merchant) <= 2 and amount > 1000:
+        risk_score += 0.1
+        reasons.append("Marchand suspect")
+    return risk_score, " | ".join(reasons) if reasons else None
+
+
+class TestRulesEngine:
+    """Règles métier chargées depuis rules.json et évaluées sur tout un lot"""
+
+    def setup_method(self):
+        install_test_model()
+        self.rules = main.rules
+
+    def teardown_method(self):
+        main.bundle = None
+        main.rules = self.rules
+
+    def test_default_rules_match_legacy_chain(self):
+        """Scores (au bit près) et raisons identiques à l'ancienne chaîne if/elif"""
+        boundaries = [0.01, 999.99, 1000.0, 1000.01, 5000.0, 5000.01, 10000.0, 10000.01, 20000.0,
+                      20000.01, 50000.0, 50000.01, 100000.0, 100000.01, 1e7]
+        rng = np.random.default_rng(0)
+        amounts = boundaries * 3 + rng.uniform(0, 150000, size=300).round(2).tolist()
+        merchants = (["X"] * len(boundaries) + ["AB"] * len(boundaries) + ["Zara"] * len(boundaries)
+                     + rng.choice(["A", "Zy", "Amazon", ""], size=300).tolist())
+
+        scores, reasons = self.rules.evaluate(amounts, merchants)
+        expected = [legacy_business_rules(amount, merchant) for amount, merchant in zip(amounts, merchants)]
+        assert scores.tolist() == [score for score, _ in expected]
+        assert reasons == [reason for _, reason in expected]
+
+        # Chemin scalaire (une transaction)
+        for amount, merchant, (score, reason) in zip(amounts, merchants, expected):
+            one_score, one_reason = self.rules.evaluate([amount], [merchant])
+            assert (one_score.tolist(), one_reason) == ([score], [reason])
+
+    def test_invalid_config_rejected(self):
+        with pytest.raises(ValueError):
+            RuleSet({"amount_tiers": {"tiers": [{"above": 10, "score": 0.5}, {"above": 5, "score": 0.6}]}})
+        with pytest.raises(ValueError):
+            RuleSet({"adjustments": [{"when": [{"field": "country", "op": "==", "value": 1}], "score": 0.1}]})
+
+    def test_reload_without_restart(self, tmp_path, monkeypatch):
+        """Nouvelles règles actives après rechargement; un fichier invalide est refusé"""
+        config = json.loads(main.DEFAULT_RULES_PATH.read_text())
+        config["amount_tiers"]["tiers"][0] = {"above": 500, "score": 0.6, "reason": "Montant suspect (>500)"}
+        rules_path = tmp_path / "rules.json"
+        rules_path.write_text(json.dumps(config))
+        monkeypatch.setattr(main, "RULES_PATH", rules_path)
+        main.score_cache = ScoreCache(max_size=100)
+
+        before = client.post("/predict", json={"amount": 800.0, "merchant": "Zara"}).json()
+        response = client.post("/admin/rules/reload")
+        assert response.status_code == 200 and response.json()["status"] == "reloaded"
+        after = client.post("/predict", json={"amount": 800.0, "merchant": "Zara"}).json()
+        main.score_cache = None
+
+        assert before["reason"] is None
+        assert after["reason"] == "Montant suspect (>500)" and after["is_fraud"]
+        assert client.get("/rules").json()["rules_version"] == main.rules.version
+
+        rules_path.write_text("{invalide")
+        current = main.rules
+        assert client.post("/admin/rules/reload").status_code == 422
+        assert main.rules is current
+
+
+class TestShadowScoring:
+    """Modèle candidat scoré après la réponse, sans effet sur les décisions"""
+
+    def setup_method(self):
+        install_test_model()
+        self.shadow_bundle = ModelBundle(train_test_model(n_estimators=5, max_depth=3),
+                                         feature_columns=FEATURE_COLUMNS, version='shadow')
+
+    def teardown_method(self):
+        if main.shadow is not None:
+            main.shadow.stop()
+        main.shadow = None
+        main.bundle = None
+
+    def test_shadow_compares_with_primary(self, tmp_path):
+        log_path = tmp_path / "shadow.log"
+        main.shadow = ShadowScorer(self.shadow_bundle, main.FRAUD_THRESHOLD, log_path)
+        main.shadow.start()
+        transactions = [{"amount": float(amount), "merchant": merchant}
+                        for amount, merchant in zip(range(100, 30000, 1500), ["Amazon", "AB", "Zara", "X"] * 5)]
+
+        single = client.post("/predict", json=transactions[0]).json()
+        batch = client.post("/predict/batch", json={"transactions": transactions}).json()
+        main.shadow.flush()
+
+        # Réponses servies par le modèle actif uniquement
+        assert single["model_version"] == "test"
+        assert {result["model_version"] for result in batch["results"]} == {"test"}
+
+        expected = main.score_transactions([main.SimpleTransactionRequest(**t) for t in transactions], self.shadow_bundle)
+        stats = client.get("/shadow/stats").json()
+        assert stats["enabled"] and stats["shadow_version"] == "shadow"
+        assert stats["scored"] == len(transactions) + 1 and stats["dropped"] == 0
+        assert stats["disagreements"] == 1 * (expected[0].is_fraud != single["is_fraud"]) + sum(
+            shadow_result.is_fraud != result["is_fraud"] for shadow_result, result in zip(expected, batch["results"]))
+
+        records = read_shadow_log(log_path)
+        assert len(records) == len(transactions) + 1
+        np.testing.assert_allclose(records["shadow_score"][1:], [result.fraud_score for result in expected], rtol=1e-6)
+        np.testing.assert_allclose(records["primary_score"][1:], [result["fraud_score"] for result in batch["results"]], rtol=1e-6)
+        assert "fraud_shadow_transactions_total" in client.get("/metrics").text
+
+    def test_full_queue_drops_without_blocking(self):
+        """File pleine: le lot est abandonné et compté, la requête n'attend pas"""
+        scorer = ShadowScorer(self.shadow_bundle, main.FRAUD_THRESHOLD, queue_size=1)
+        # Thread non démarré: la file se remplit
+        assert scorer.submit([100.0], ["Amazon"], [0.1], [False], main.rules)
+        main.shadow = scorer
+        response = client.post("/predict", json={"amount": 120.0, "merchant": "Amazon"})
+
+        assert response.status_code == 200
+        assert scorer.stats()["dropped"] == 1 and scorer.stats()["submitted"] == 1
+
+        scorer.start()
+        scorer.flush()
+        assert scorer.stats()["scored"] == 1
+
+
+class TestDecisionAwareScoring:
+    """Mode décision: ML sauté ou arrêté dès que la décision est acquise"""
+
+    def setup_method(self):
+        install_test_model()
+        forest = CompiledForest.from_sklearn(main.bundle.model)
+        main.bundle = ModelBundle(forest, feature_columns=FEATURE_COLUMNS, model_type='compiled_forest',
+                                  version='test', compiled_forest=forest)
+        rng = np.random.default_rng(3)
+        self.transactions = [{"amount": float(amount), "merchant": merchant} for amount, merchant in
+                             zip(rng.exponential(4000, 300).round(2), rng.choice(["Amazon", "AB", "Zara", "X"], 300))]
+
+    def teardown_method(self):
+        main.bundle = None
+        main.score_cache = None
+
+    def test_same_decisions_as_exact(self):
+        exact = client.post("/predict/batch", json={"transactions": self.transactions}).json()["results"]
+        fast = client.post("/predict/batch?exact_score=false", json={"transactions": self.transactions}).json()["results"]
+
+        assert [r["is_fraud"] for r in fast] == [r["is_fraud"] for r in exact]
+        assert all(r["score_exact"] for r in exact)
+        assert not all(r["score_exact"] for r in fast)
+        for fast_result, exact_result in zip(fast, exact):
+            if fast_result["score_exact"]:
+                assert fast_result["fraud_score"] == exact_result["fraud_score"]
+
+    def test_rules_shortcut_skips_ml(self, monkeypatch):
+        """Montant que les règles classent en fraude: aucun appel au modèle"""
+        monkeypatch.setattr(main.bundle, "predict_decision", lambda *args: pytest.fail("ML appelé"))
+        before = main.SHORTCUTS.value(shortcut="rules")
+        result = client.post("/predict?exact_score=false", json={"amount": 25000.0, "merchant": "Zara"}).json()
+
+        assert result["is_fraud"] and not result["score_exact"]
+        assert result["fraud_score"] == 0.75
+        assert main.SHORTCUTS.value(shortcut="rules") == before + 1
+        assert 'fraud_scoring_shortcuts_total{shortcut="rules"}' in client.get("/metrics").text
+
+    def test_cache_keeps_modes_apart(self):
+        """Un score approché en cache n'est pas servi à une requête exacte"""
+        main.score_cache = ScoreCache(max_size=100)
+        transaction = {"amount": 25000.0, "merchant": "Zara"}
+        assert not client.post("/predict?exact_score=false", json=transaction).json()["score_exact"]
+        assert client.post("/predict?exact_score=true", json=transaction).json()["score_exact"]
+
+
+class TestExplanations:
+    """explain=true: contributions par feature calculées pendant le parcours de la forêt"""
+
+    def setup_method(self):
+        install_test_model()
+        rng = np.random.RandomState(5)
+        self.X = rng.normal(scale=2.0, size=(50, len(FEATURE_COLUMNS)))
+        self.X[:, -1] = rng.exponential(3000, size=50)
+
+    def teardown_method(self):
+        main.bundle = None
+        main.score_cache = None
+
+    def test_matches_tree_path_decomposition(self):
+        """Même décomposition qu'un parcours des chemins de decision_path, somme exacte"""
+        model = main.bundle.model
+        scores, bias, contributions = CompiledForest.from_sklearn(model).explain(self.X)
+
+        np.testing.assert_allclose(scores, model.predict_proba(self.X)[:, 1], atol=1e-12)
+        np.testing.assert_allclose(bias + contributions.sum(axis=1), scores, atol=1e-12)
+        expected = np.zeros_like(contributions)
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            value = tree.value[:, 0, 1] / tree.value[:, 0, :].sum(axis=1)
+            for row, path in enumerate(estimator.decision_path(self.X.astype(np.float32)).tolil().rows):
+                for parent, child in zip(path, path[1:]):
+                    expected[row, tree.feature[parent]] += value[child] - value[parent]
+        np.testing.assert_allclose(contributions, expected / len(model.estimators_), atol=1e-12)
+
+    def test_explainer_built_on_first_request(self):
+        """Pas de copie compilée de la forêt sklearn tant qu'aucune explication n'est demandée"""
+        assert main.bundle.explainable and main.bundle._explainer is None
+        client.post("/predict", json={"amount": 6000.0, "merchant": "Fnac"})
+        assert main.bundle._explainer is None
+
+        client.post("/predict?explain=true", json={"amount": 6000.0, "merchant": "Fnac"})
+        explainer = main.bundle.get_explainer()
+        assert explainer is not None and explainer is main.bundle.get_explainer()
+
+    def test_predict_explain(self):
+        transaction = {"amount": 6000.0, "merchant": "Fnac"}
+        plain = client.post("/predict", json=transaction).json()
+        result = client.post("/predict?explain=true", json=transaction).json()
+
+        assert plain["explanation"] is None
+        explanation = result.pop("explanation")
+        assert result == {key: value for key, value in plain.items() if key != "explanation"}
+        contributions = explanation["contributions"]
+        assert len(contributions) == main.EXPLAIN_TOP_K
+        assert {c["feature"] for c in contributions} <= set(FEATURE_COLUMNS)
+        magnitudes = [abs(c["contribution"]) for c in contributions]
+        assert magnitudes == sorted(magnitudes, reverse=True)
+        total = explanation["bias"] + sum(c["contribution"] for c in contributions) + explanation["other"]
+        assert total == pytest.approx(explanation["ml_score"], abs=1e-9)
+        assert plain["fraud_score"] >= explanation["ml_score"]
+
+    def test_batch_with_scaler(self):
+        """Scaler non replié: appliqué avant l'explication, scores identiques au mode normal"""
+        scaler = StandardScaler().fit(generate_feature_matrix([10.0, 500.0, 9000.0], ["A", "B", "C"]))
+        main.bundle = ModelBundle(main.bundle.model, scaler, FEATURE_COLUMNS, version='test')
+        transactions = [{"amount": amount, "merchant": "Zara"} for amount in (15.0, 800.0, 6000.0, 60000.0)]
+        plain = client.post("/predict/batch", json={"transactions": transactions}).json()["results"]
+        explained = client.post("/predict/batch?explain=true", json={"transactions": transactions}).json()["results"]
+
+        assert [r["fraud_score"] for r in explained] == pytest.approx([r["fraud_score"] for r in plain], abs=1e-12)
+        assert all(r["explanation"] is not None for r in explained)
+        amount_column = FEATURE_COLUMNS[-1]
+        for transaction, result in zip(transactions, explained):
+            for contribution in result["explanation"]["contributions"]:
+                if contribution["feature"] == amount_column:
+                    assert contribution["value"] == transaction["amount"]
+
+    def test_explain_forces_exact_score(self):
+        main.score_cache = ScoreCache(max_size=100)
+        transaction = {"amount": 25000.0, "merchant": "Zara"}
+        assert client.post("/predict?exact_score=false", json=transaction).json()["explanation"] is None
+        result = client.post("/predict?exact_score=false&explain=true", json=transaction).json()
+        assert result["score_exact"] and result["explanation"] is not None
+
+    def test_model_without_trees(self):
+        class ConstantModel:
+            def predict_proba(self, X):
+                return np.tile([0.9, 0.1], (len(X), 1))
+        main.bundle = ModelBundle(ConstantModel(), version='constant')
+        assert client.post("/predict", json={"amount": 10.0, "merchant": "A"}).status_code == 200
+        assert client.post("/predict?explain=true", json={"amount": 10.0, "merchant": "A"}).status_code == 400
+
+
+class TestStreamingPrediction:
+    """POST /predict/stream: corps NDJSON/CSV lu au fil de l'eau, résultats NDJSON par lots"""
+
+    def setup_method(self):
+        install_test_model()
+        self.transactions = [{"transaction_id": f"T{i}", "amount": float(10 + i * 37 % 30000),
+                              "merchant": ["Amazon", "AB", "Zara", "X"][i % 4]} for i in range(250)]
+
+    def teardown_method(self):
+        main.bundle = None
+
+    def expected(self):
+        return client.post("/predict/batch", json={"transactions": self.transactions}).json()["results"]
+
+    def test_ndjson_in_chunks(self, monkeypatch):
+        monkeypatch.setattr(main, "STREAM_CHUNK_SIZE", 64)
+        sizes = []
+        run_scoring = main.run_scoring
+
+        async def recording_run_scoring(transactions, exact=None, explain=False):
+            sizes.append(len(transactions))
+            return await run_scoring(transactions, exact, explain)
+        monkeypatch.setattr(main, "run_scoring", recording_run_scoring)
+
+        body = "\n".join(json.dumps(t) for t in self.transactions) + "\n"
+        response = client.post("/predict/stream", content=body, headers={"Content-Type": "application/x-ndjson"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert sizes == [64, 64, 64, 58]
+        assert [json.loads(line) for line in response.text.splitlines()] == self.expected()
+
+    def test_csv_with_invalid_line(self):
+        rows = ["transaction_id,amount,merchant,category"]
+        rows += [f'{t["transaction_id"]},{t["amount"]},"{t["merchant"]}",' for t in self.transactions[:10]]
+        rows.insert(4, "T_BAD,pas-un-montant,Zara,Other")
+        response = client.post("/predict/stream", content="\r\n".join(rows), headers={"Content-Type": "text/csv"})
+
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert len(lines) == 11
+        assert lines[3]["line"] == 5 and "amount" in lines[3]["error"]
+        assert [line for i, line in enumerate(lines) if i != 3] == self.expected()[:10]
+
+    def test_line_too_long(self, monkeypatch):
+        monkeypatch.setattr(main, "STREAM_MAX_LINE_BYTES", 100)
+        body = json.dumps(self.transactions[0]) + "\n" + "x" * 500
+        lines = [json.loads(line) for line in client.post("/predict/stream", content=body).text.splitlines()]
+
+        assert lines[0]["transaction_id"] == "T0"
+        assert "trop longue" in lines[1]["error"]
+
+    def test_scoring_failure_keeps_stream(self, monkeypatch):
+        """Un lot en échec donne une ligne d'erreur par transaction, les lots suivants sont scorés"""
+        monkeypatch.setattr(main, "STREAM_CHUNK_SIZE", 4)
+        run_scoring = main.run_scoring
+        calls = []
+
+        async def failing_run_scoring(transactions, exact=None, explain=False):
+            calls.append(len(transactions))
+            if len(calls) == 2:
+                raise ValueError("modèle indisponible")
+            return await run_scoring(transactions, exact, explain)
+        monkeypatch.setattr(main, "run_scoring", failing_run_scoring)
+        errors_before = main.ERRORS.value(endpoint="/predict/stream", type="scoring")
+
+        body = "\n".join(json.dumps(t) for t in self.transactions[:10]) + "\n"
+        response = client.post("/predict/stream", content=body)
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+        assert calls == [4, 4, 2]
+        assert len(lines) == 10
+        assert [line["line"] for line in lines[4:8]] == [5, 6, 7, 8]
+        assert all("modèle indisponible" in line["error"] for line in lines[4:8])
+        assert lines[:4] + lines[8:] == self.expected()[:4] + self.expected()[8:10]
+        assert main.ERRORS.value(endpoint="/predict/stream", type="scoring") == errors_before + 4
+
+    def test_iter_lines_across_chunk_boundaries(self):
+        """Lignes coupées entre deux morceaux, y compris au milieu d'un caractère UTF-8"""
+        data = "é1\n\nligne 2\r\nmarché 3".encode()
+
+        async def collect():
+            async def chunks():
+                for i in range(len(data)):
+                    yield data[i:i + 1]
+            return [(number, line.decode()) async for number, line in iter_lines(chunks(), 100)]
+
+        assert asyncio.run(collect()) == [(1, "é1"), (3, "ligne 2"), (4, "marché 3")]
+
+
+class TestMsgpackEncoding:
+    """Content-Type / Accept: application/msgpack sur /predict et /predict/batch, JSON par défaut"""
+
+    def setup_method(self):
+        self.msgpack = pytest.importorskip("msgpack")
+        install_test_model()
+        self.transactions = [{"transaction_id": f"T{i}", "amount": float(10 + i * 997 % 30000),
+                              "merchant": ["Amazon", "AB", "Zara", "X"][i % 4]} for i in range(20)]
+        self.headers = {"Content-Type": "application/msgpack", "Accept": "application/msgpack"}
+
+    def teardown_method(self):
+        main.bundle = None
+
+    def test_single_round_trip(self):
+        response = client.post("/predict", content=self.msgpack.packb(self.transactions[0]), headers=self.headers)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/msgpack"
+        assert self.msgpack.unpackb(response.content) == client.post("/predict", json=self.transactions[0]).json()
+
+    def test_batch_round_trip(self):
+        body = self.msgpack.packb({"transactions": self.transactions})
+        response = client.post("/predict/batch", content=body, headers=self.headers)
+
+        assert response.status_code == 200
+        expected = client.post("/predict/batch", json={"transactions": self.transactions}).json()
+        assert self.msgpack.unpackb(response.content) == expected
+
+    def test_json_stays_default(self):
+        """Corps msgpack sans Accept msgpack: réponse JSON; Accept navigateur: JSON"""
+        response = client.post("/predict", content=self.msgpack.packb(self.transactions[0]),
+                               headers={"Content-Type": "application/msgpack"})
+        assert response.headers["content-type"] == "application/json"
+
+        response = client.post("/predict", json=self.transactions[0],
+                               headers={"Accept": "text/html,application/xhtml+xml,*/*;q=0.8"})
+        assert response.headers["content-type"] == "application/json"
+        assert response.json()["transaction_id"] == "T0"
+
+    def test_invalid_body_returns_422(self):
+        response = client.post("/predict", content=b"\xc1", headers=self.headers)
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["type"] == "msgpack_invalid"
+
+        response = client.post("/predict", content=self.msgpack.packb({"merchant": "Amazon"}), headers=self.headers)
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["loc"] == ["body", "amount"]
+
+
+class SlowBatcher:
+    """Remplace le micro-batcher: attente par transaction (T_SLOW* lentes) et suivi des transactions en cours"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def submit(self, transaction):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.3 if transaction.transaction_id.startswith("T_SLOW") else 0.01)
+            return (await main.run_scoring([transaction]))[0]
+        finally:
+            self.in_flight -= 1
+
+
+class TestWebSocketScoring:
+    """/ws/predict: réponses corrélées par id, désordre avec micro-batching, fenêtre bornée"""
+
+    def setup_method(self):
+        install_test_model()
+
+    def teardown_method(self):
+        main.bundle = None
+        main.batcher = None
+
+    def test_in_order_without_batching(self):
+        with client.websocket_connect("/ws/predict") as ws:
+            ws.send_json({"id": "c1", "amount": 120.5, "merchant": "Amazon"})
+            ws.send_json([{"id": "c2", "amount": 75000, "merchant": "XY"}, {"id": "c3", "merchant": "Zara"}])
+            first, second = ws.receive_json(), ws.receive_json()
+
+        expected = client.post("/predict", json={"amount": 120.5, "merchant": "Amazon"}).json()
+        assert first == {"id": "c1", **expected}
+        assert [item["id"] for item in second] == ["c2", "c3"]
+        assert second[0]["is_fraud"] is True
+        assert "amount" in second[1]["error"]
+
+    def test_out_of_order_with_batching(self):
+        main.batcher = SlowBatcher()
+        with client.websocket_connect("/ws/predict") as ws:
+            ws.send_json({"id": "slow", "transaction_id": "T_SLOW", "amount": 10.0, "merchant": "Amazon"})
+            ws.send_json({"id": "fast", "transaction_id": "T_FAST", "amount": 20.0, "merchant": "Amazon"})
+            responses = [ws.receive_json(), ws.receive_json()]
+
+        assert [response["id"] for response in responses] == ["fast", "slow"]
+        assert responses[1]["transaction_id"] == "T_SLOW"
+
+    def test_scoring_failure_is_timed(self, monkeypatch):
+        """Une trame dont le scoring échoue figure dans fraud_request_seconds comme les endpoints HTTP"""
+        async def failing_run_scoring(transactions, exact=None, explain=False):
+            raise RuntimeError("boom")
+        monkeypatch.setattr(main, "run_scoring", failing_run_scoring)
+        before = main.REQUEST_SECONDS.count(endpoint="/ws/predict")
+
+        with client.websocket_connect("/ws/predict") as ws:
+            ws.send_json({"id": "c1", "amount": 120.5, "merchant": "Amazon"})
+            response = ws.receive_json()
+
+        assert response["id"] == "c1" and "boom" in response["error"]
+        assert main.REQUEST_SECONDS.count(endpoint="/ws/predict") == before + 1
+
+    def test_in_flight_window(self, monkeypatch):
+        monkeypatch.setattr(main, "WS_MAX_IN_FLIGHT", 2)
+        main.batcher = SlowBatcher()
+        with client.websocket_connect("/ws/predict") as ws:
+            for i in range(6):
+                ws.send_json({"id": i, "transaction_id": f"T_SLOW{i}", "amount": 10.0 + i, "merchant": "Amazon"})
+            ids = sorted(ws.receive_json()["id"] for _ in range(6))
+            ws.send_json([{"id": i, "amount": 1.0, "merchant": "A"} for i in range(3)])
+            assert "max 2" in ws.receive_json()["error"]
+
+        assert ids == list(range(6))
+        assert main.batcher.max_in_flight == 2
+
+    def test_msgpack_frames(self):
+        msgpack = pytest.importorskip("msgpack")
+        with client.websocket_connect("/ws/predict") as ws:
+            ws.send_bytes(msgpack.packb({"id": "m1", "amount": 120.5, "merchant": "Amazon"}))
+            response = msgpack.unpackb(ws.receive_bytes())
+            ws.send_text("pas du json")
+            error = ws.receive_json()
+
+        expected = client.post("/predict", json={"amount": 120.5, "merchant": "Amazon"}).json()
+        assert response == {"id": "m1", **expected}
+        assert error["id"] is None and "illisible" in error["error"]
@@ -0,0 +1,410 @@
+"""
+Moteur d'inférence compilé pour le Random Forest (sans sklearn)
+
+Le modèle sklearn est converti une seule fois en tableaux NumPy contigus
+(feature, seuil, fils gauche/droit, valeur des feuilles) couvrant tous les
+arbres. Le parcours est vectorisé: tous les arbres et toutes les lignes
+descendent d'un niveau à chaque itération.
+
+Sur une ligne ou un petit lot, le moteur évite l'overhead de sklearn
+(check_array, dispatch joblib sur 100 arbres). Sur plusieurs milliers de
+lignes, le parcours Cython de sklearn reste plus rapide.
+
+predict_decision arrête le parcours dès que la décision par rapport au seuil
+est acquise: après k arbres, la moyenne finale est bornée par la somme
+partielle plus les probabilités min/max des feuilles des arbres restants.
+
+explain décompose la probabilité de fraude pendant le parcours (méthode de Saabas):
+chaque descente parent -> fils ajoute value[fils] - value[parent] à la feature
+testée par le parent. La variation de chaque noeud est précalculée une fois
+(path_deltas); proba = biais (moyenne des racines) + somme des contributions.
+
+Le StandardScaler peut être replié dans les seuils (fold_scaler): un split
+sur la feature normalisée x' <= t équivaut à x <= t * scale + mean sur la
+feature brute, ce qui supprime scaler.transform du chemin de scoring.
+
+Usage:
+    python tree_engine.py [random_forest_model.pkl] [dossier_de_sortie] [scaler.pkl]
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+ARRAY_NAMES = ("feature", "threshold", "left", "right", "value", "roots")
+META_FILE = "meta.json"
+
+# Nombre max de lignes parcourues en une passe (borne la mémoire n_lignes x n_arbres)
+ROW_CHUNK = 8192
+
+# Au-delà, le parcours compacte les couples (ligne, arbre) encore actifs
+DENSE_MAX_ROWS = 32
+
+# En dessous, le coût fixe d'un groupe d'arbres (max_depth itérations) dépasse le gain
+# de l'arrêt anticipé: predict_decision parcourt toute la forêt
+EARLY_EXIT_MIN_ROWS = 64
+
+# Marge sur les bornes de predict_decision (ordre de sommation différent de predict_proba)
+DECISION_MARGIN = 1e-9
+
+
+class CompiledForest:
+    """Forêt d'arbres de décision aplatie en tableaux NumPy"""
+
+    def __init__(self, feature, threshold, left, right, value, roots, classes, n_features, max_depth,
+                 feature_names=None, scaler_folded=False):
+        """
+        Args:
+            feature: Index de la feature testée par noeud (0 pour les feuilles)
+            threshold: Seuil de chaque noeud (X[feature] <= seuil -> gauche)
+            left, right: Index global des fils; une feuille pointe sur elle-même
+            value: Probabilités de classe de chaque noeud (n_noeuds x n_classes)
+            roots: Index global de la racine de chaque arbre
+            classes: Classes du modèle (ordre des colonnes de predict_proba)
+            n_features: Nombre de features attendues
+            max_depth: Profondeur max de la forêt (nombre d'itérations du parcours)
+            scaler_folded: Seuils exprimés sur les features brutes (scaler replié)
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = int(n_features)
+        self.max_depth = int(max_depth)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.scaler_folded = bool(scaler_folded)
+
+    @property
+    def n_estimators(self) -> int:
+        return len(self.roots)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.feature)
+
+    @classmethod
+    def from_sklearn(cls, model) -> "CompiledForest":
+        """Convertit un RandomForestClassifier (ou un arbre seul) entraîné"""
+        estimators = getattr(model, "estimators_", [model])
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            node_ids = np.arange(n_nodes)
+            is_leaf = tree.children_left == -1
+
+            # Les feuilles bouclent sur elles-mêmes: le parcours n'a pas besoin de masque
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+
+            # Selon la version de sklearn, value contient des effectifs ou des fractions
+            value = tree.value[:, 0, :].astype(np.float64)
+            values.append(value / value.sum(axis=1, keepdims=True))
+
+            roots.append(offset)
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+            right=np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            classes=model.classes_,
+            n_features=model.n_features_in_,
+            max_depth=max_depth,
+            feature_names=getattr(model, "feature_names_in_", None),
+        )
+
+    def save(self, directory):
+        """
+        Sauvegarde la forêt sous forme de fichiers .npy + meta.json
+
+        Chaque fichier est écrit à côté puis renommé: un worker qui a mappé
+        l'ancienne version (mmap_mode) garde des pages valides.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in ARRAY_NAMES:
+            tmp_path = directory / f".{name}.tmp.npy"
+            np.save(tmp_path, getattr(self, name))
+            os.replace(tmp_path, directory / f"{name}.npy")
+        tmp_path = directory / f".{META_FILE}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "classes": self.classes_.tolist(),
+                "n_features": self.n_features_in_,
+                "max_depth": self.max_depth,
+                "feature_names": self.feature_names,
+                "scaler_folded": self.scaler_folded,
+            }, f)
+        os.replace(tmp_path, directory / META_FILE)
+
+    @classmethod
+    def load(cls, directory, mmap_mode: Optional[str] = None) -> "CompiledForest":
+        """Charge une forêt sauvegardée par save() (n'importe pas sklearn)"""
+        directory = Path(directory)
+        with open(directory / META_FILE, "r") as f:
+            meta = json.load(f)
+        arrays = {name: np.load(directory / f"{name}.npy", mmap_mode=mmap_mode) for name in ARRAY_NAMES}
+        return cls(
+            classes=meta["classes"],
+            n_features=meta["n_features"],
+            max_depth=meta["max_depth"],
+            feature_names=meta.get("feature_names"),
+            scaler_folded=meta.get("scaler_folded", False),
+            **arrays,
+        )
+
+    def apply(self, X) -> np.ndarray:
+        """Retourne l'index global de la feuille atteinte (n_lignes x n_arbres)"""
+        X = self._validate(X)
+        leaves = np.empty((len(X), self.n_estimators), dtype=np.intp)
+        for start in range(0, len(X), ROW_CHUNK):
+            leaves[start:start + ROW_CHUNK] = self._traverse(X[start:start + ROW_CHUNK])
+        return leaves
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Moyenne des probabilités des feuilles atteintes, comme RandomForestClassifier"""
+        X = self._validate(X)
+        proba = np.empty((len(X), len(self.classes_)), dtype=np.float64)
+        for start in range(0, len(X), ROW_CHUNK):
+            leaves = self._traverse(X[start:start + ROW_CHUNK])
+            proba[start:start + ROW_CHUNK] = self.value[leaves].sum(axis=1) / self.n_estimators
+        return proba
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def predict_decision(self, X, threshold: float, stride: int = 20):
+        """
+        Probabilité de fraude (classe 1), parcours arrêté dès que proba >= threshold est tranché
+
+        Les arbres sont parcourus par groupes de `stride`; après chaque groupe, les
+        lignes dont la décision ne peut plus changer quittent le lot.
+
+        Returns:
+            (scores, exact, trees): scores exacts pour les lignes allées jusqu'au bout,
+            sinon moyenne partielle ramenée dans les bornes (même décision);
+            nombre d'arbres parcourus par ligne
+        """
+        X = self._validate(X)
+        n_trees = self.n_estimators
+        if len(X) < EARLY_EXIT_MIN_ROWS:
+            return self.predict_proba(X)[:, 1], np.ones(len(X), dtype=bool), np.full(len(X), n_trees, dtype=np.intp)
+        leaf_min, leaf_max = self._leaf_bounds()
+        # Contribution min/max des arbres restants après chaque groupe
+        remaining_min = np.concatenate([np.cumsum(leaf_min[::-1])[::-1], [0.0]])
+        remaining_max = np.concatenate([np.cumsum(leaf_max[::-1])[::-1], [0.0]])
+
+        scores = np.empty(len(X), dtype=np.float64)
+        exact = np.zeros(len(X), dtype=bool)
+        trees = np.full(len(X), n_trees, dtype=np.intp)
+        active = np.arange(len(X))
+        partial = np.zeros(len(X), dtype=np.float64)
+        leaves = []
+        for start in range(0, n_trees, max(1, stride)):
+            stop = min(start + max(1, stride), n_trees)
+            chunk_leaves = self._traverse(X[active], self.roots[start:stop])
+            leaves.append(chunk_leaves)
+            partial += self.value[chunk_leaves, 1].sum(axis=1)
+            if stop == n_trees:
+                break
+            lower = (partial + remaining_min[stop]) / n_trees
+            upper = (partial + remaining_max[stop]) / n_trees
+            decided = (lower >= threshold + DECISION_MARGIN) | (upper < threshold - DECISION_MARGIN)
+            if decided.any():
+                rows = active[decided]
+                scores[rows] = np.clip(partial[decided] / stop, lower[decided], upper[decided])
+                trees[rows] = stop
+                keep = ~decided
+                active, partial = active[keep], partial[keep]
+                leaves = [chunk[keep] for chunk in leaves]
+                if not len(active):
+                    return scores, exact, trees
+
+        # Lignes allées jusqu'au dernier arbre: même somme que predict_proba
+        all_leaves = np.concatenate(leaves, axis=1) if len(leaves) > 1 else leaves[0]
+        scores[active] = self.value[all_leaves].sum(axis=1)[:, 1] / n_trees
+        exact[active] = True
+        return scores, exact, trees
+
+    def path_deltas(self) -> np.ndarray:
+        """Variation de la probabilité de fraude entre chaque noeud et son parent (0 pour les racines)"""
+        deltas = getattr(self, "_deltas", None)
+        if deltas is None:
+            node_ids = np.arange(self.node_count)
+            internal = self.left != node_ids
+            parent = node_ids.copy()
+            parent[self.left[internal]] = node_ids[internal]
+            parent[self.right[internal]] = node_ids[internal]
+            deltas = self._deltas = self.value[:, 1] - self.value[parent, 1]
+        return deltas
+
+    def explain(self, X):
+        """
+        Probabilité de fraude et sa décomposition exacte par feature, en un seul parcours
+
+        Returns:
+            (scores, biais, contributions n_lignes x n_features): pour chaque ligne,
+            scores[i] = biais + contributions[i].sum(), scores identiques à predict_proba
+        """
+        X = self._validate(X)
+        deltas = self.path_deltas()
+        bias = float(self.value[self.roots, 1].mean())
+        scores = np.empty(len(X), dtype=np.float64)
+        contributions = np.empty((len(X), self.n_features_in_), dtype=np.float64)
+        for start in range(0, len(X), ROW_CHUNK):
+            leaves, chunk_contributions = self._traverse_explain(X[start:start + ROW_CHUNK], deltas)
+            scores[start:start + ROW_CHUNK] = self.value[leaves, 1].sum(axis=1) / self.n_estimators
+            contributions[start:start + ROW_CHUNK] = chunk_contributions / self.n_estimators
+        return scores, bias, contributions
+
+    def _traverse_explain(self, X: np.ndarray, deltas: np.ndarray):
+        # Parcours dense; à chaque niveau, la variation de chaque descente est cumulée sur sa feature
+        n_rows, n_features = X.shape
+        rows = np.arange(n_rows)[:, None]
+        offsets = rows * n_features
+        nodes = np.broadcast_to(self.roots, (n_rows, self.n_estimators))
+        contributions = np.zeros(n_rows * n_features, dtype=np.float64)
+        for _ in range(self.max_depth):
+            feature = self.feature[nodes]
+            go_left = X[rows, feature] <= self.threshold[nodes]
+            children = np.where(go_left, self.left[nodes], self.right[nodes])
+            # Une feuille boucle sur elle-même: pas de descente, pas de contribution
+            weights = np.where(children != nodes, deltas[children], 0.0)
+            contributions += np.bincount((offsets + feature).ravel(), weights=weights.ravel(), minlength=len(contributions))
+            nodes = children
+        return nodes, contributions.reshape(n_rows, n_features)
+
+    def _leaf_bounds(self):
+        """Probabilité de fraude min/max des feuilles de chaque arbre (calculée une fois)"""
+        bounds = getattr(self, "_bounds", None)
+        if bounds is None:
+            is_leaf = self.left == np.arange(self.node_count)
+            tree_of_node = np.searchsorted(self.roots, np.arange(self.node_count), side="right") - 1
+            leaf_values = np.where(is_leaf, self.value[:, 1], np.nan)
+            leaf_min = np.full(self.n_estimators, np.inf)
+            leaf_max = np.full(self.n_estimators, -np.inf)
+            np.fmin.at(leaf_min, tree_of_node, leaf_values)
+            np.fmax.at(leaf_max, tree_of_node, leaf_values)
+            bounds = self._bounds = (leaf_min, leaf_max)
+        return bounds
+
+    def _validate(self, X) -> np.ndarray:
+        # sklearn compare les features en float32 aux seuils en float64: on fait de même
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X a {X.shape[1]} features, le modèle en attend {self.n_features_in_}")
+        return X
+
+    def _traverse(self, X: np.ndarray, roots: Optional[np.ndarray] = None) -> np.ndarray:
+        roots = self.roots if roots is None else roots
+        if len(X) <= DENSE_MAX_ROWS:
+            return self._traverse_dense(X, roots)
+        return self._traverse_compact(X, roots)
+
+    def _traverse_dense(self, X: np.ndarray, roots: np.ndarray) -> np.ndarray:
+        # Petits lots: max_depth itérations sur toute la grille lignes x arbres
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(roots, (len(X), len(roots)))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def _traverse_compact(self, X: np.ndarray, roots: np.ndarray) -> np.ndarray:
+        # Gros lots: on retire à chaque niveau les couples (ligne, arbre) arrivés en feuille
+        n_rows, n_features = X.shape
+        n_trees = len(roots)
+        flat_X = X.ravel()
+        leaves = np.empty(n_rows * n_trees, dtype=np.intp)
+        active = np.arange(n_rows * n_trees)
+        nodes = np.tile(roots, n_rows)
+        offsets = np.repeat(np.arange(n_rows) * n_features, n_trees)
+
+        while len(active):
+            go_left = flat_X[offsets + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+            done = self.left[nodes] == nodes
+            leaves[active[done]] = nodes[done]
+            pending = ~done
+            active, nodes, offsets = active[pending], nodes[pending], offsets[pending]
+
+        return leaves.reshape(n_rows, n_trees)
+
+def fold_scaler(forest: CompiledForest, scaler, X_sample=None, atol: float = 1e-9) -> CompiledForest:
+    """
+    Replie un StandardScaler dans les seuils de la forêt
+
+    Les seuils deviennent seuil * scale + mean (feature du noeud). Le résultat
+    est vérifié sur un échantillon: les probabilités doivent être identiques à
+    forest.predict_proba(scaler.transform(X)), sinon ValueError.
+    """
+    if forest.scaler_folded:
+        raise ValueError("Le scaler est déjà replié dans cette forêt")
+
+    n_features = forest.n_features_in_
+    mean = getattr(scaler, "mean_", None)
+    scale = getattr(scaler, "scale_", None)
+    mean = np.zeros(n_features) if mean is None else np.asarray(mean, dtype=np.float64)
+    scale = np.ones(n_features) if scale is None else np.asarray(scale, dtype=np.float64)
+
+    # Les feuilles gardent un seuil infini
+    threshold = forest.threshold * scale[forest.feature] + mean[forest.feature]
+    folded = CompiledForest(
+        feature=forest.feature, threshold=np.ascontiguousarray(threshold), left=forest.left, right=forest.right,
+        value=forest.value, roots=forest.roots, classes=forest.classes_, n_features=n_features,
+        max_depth=forest.max_depth, feature_names=forest.feature_names, scaler_folded=True,
+    )
+
+    if X_sample is None:
+        rng = np.random.default_rng(0)
+        X_sample = mean + scale * rng.standard_normal((2000, n_features)) * 2
+    X_sample = np.asarray(X_sample, dtype=np.float32)
+    expected = forest.predict_proba(scaler.transform(X_sample))
+    folded_proba = folded.predict_proba(X_sample)
+    mismatches = int(np.sum(~np.isclose(folded_proba, expected, rtol=0, atol=atol).all(axis=1)))
+    if mismatches:
+        raise ValueError(f"Repliement du scaler non équivalent sur {mismatches}/{len(X_sample)} lignes")
+    return folded
+
+
+def compile_model(model_path, output_dir, scaler_path=None) -> CompiledForest:
+    """Convertit random_forest_model.pkl en forêt compilée sur disque (scaler replié si fourni)"""
+    import joblib
+
+    forest = CompiledForest.from_sklearn(joblib.load(model_path))
+    if scaler_path is not None and Path(scaler_path).exists():
+        forest = fold_scaler(forest, joblib.load(scaler_path))
+    forest.save(output_dir)
+    return forest
+
+
+if __name__ == "__main__":
+    model_dir = Path(__file__).parent.parent / "ml_model" / "models"
+    model_path = Path(sys.argv[1]) if len(sys.argv) > 1 else model_dir / "random_forest_model.pkl"
+    output_dir = Path(sys.argv[2]) if len(sys.argv) > 2 else model_path.parent / "compiled_forest"
+    scaler_path = Path(sys.argv[3]) if len(sys.argv) > 3 else model_path.parent / "scaler.pkl"
+
+    forest = compile_model(model_path, output_dir, scaler_path)
+    print(f"✅ Forêt compilée: {forest.n_estimators} arbres, {forest.node_count} noeuds, profondeur max {forest.max_depth}")
+    if forest.scaler_folded:
+        print(f"✅ Scaler replié dans les seuils: {scaler_path}")
+    print(f"   Sauvegardée dans: {output_dir}")
@@ -0,0 +1,262 @@
+"""
+Calibration du seuil de décision (FRAUD_THRESHOLD) sur un jeu étiqueté
+
+Le jeu est scoré une seule fois, les scores sont triés par ordre décroissant,
+puis précision, rappel, taux de blocage et coût attendu sont calculés pour
+chaque seuil candidat (chaque score distinct: bloquer si score >= seuil) par
+sommes cumulées sur les étiquettes triées, sans boucle Python par seuil. Le
+même calcul est fait par segment (catégorie): les lignes sont regroupées par
+segment (un tri stable), puis chaque tranche passe par le même calcul.
+
+Coût attendu par transaction = (faux positifs x --cost-fp + fraudes manquées x
+coût d'une fraude manquée) / transactions; le coût d'une fraude manquée est
+--cost-fn, ou son montant avec --cost-fn amount. Le seuil recommandé est celui
+de coût minimal parmi les seuils qui respectent --min-precision, --min-recall
+et --max-block-rate.
+
+Jeu étiqueté (CSV, étiquette dans --label-column, Class par défaut):
+- colonne --score-column (score): scores déjà calculés, utilisés tels quels
+- colonnes du modèle (V1..V28, Amount): score ML du bundle du service
+- colonnes amount et merchant: pipeline du service (features générées depuis
+  marchand et montant, puis max(ML, règles) comme FRAUD_THRESHOLD l'applique)
+
+Le service n'applique qu'un seuil global: les seuils par segment indiquent
+les catégories où le seuil global est loin de l'optimum.
+
+Usage:
+    python calibrate_threshold.py --dataset data/labeled.csv [--cost-fp 5 --cost-fn amount] [--segment-column category]
+    python calibrate_threshold.py --dataset data/scored.csv --min-precision 0.5 --max-block-rate 0.02 --output report.json
+"""
+
+import argparse
+import json
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from fraud_detection_service.executor import allocated_cpus
+from fraud_detection_service.model_bundle import ModelBundle
+from fraud_detection_service.rules import RuleSet
+
+MODEL_DIR = Path(__file__).parent / "models"
+SCORING_CHUNK = 100_000
+METRICS = ("threshold", "tp", "fp", "precision", "recall", "block_rate", "cost")
+
+
+def _as_arrays(scores, labels, fp_cost, fn_cost):
+    scores = np.asarray(scores, dtype=np.float64)
+    fp_cost = np.broadcast_to(np.asarray(fp_cost, dtype=np.float64), scores.shape)
+    fn_cost = np.broadcast_to(np.asarray(fn_cost, dtype=np.float64), scores.shape)
+    return scores, np.asarray(labels).astype(bool), fp_cost, fn_cost
+
+
+def operating_points(scores, labels, fp_cost=1.0, fn_cost=1.0) -> dict:
+    """
+    Métriques de chaque seuil candidat (bloquer si score >= seuil), seuils décroissants
+
+    Le premier point (seuil au-dessus du score max) ne bloque rien.
+
+    Args:
+        scores: Score de chaque transaction
+        labels: 1 pour une fraude, 0 sinon
+        fp_cost: Coût d'une transaction légitime bloquée (scalaire ou par transaction)
+        fn_cost: Coût d'une fraude manquée (scalaire ou par transaction, ex: montant)
+
+    Returns:
+        {métrique: tableau}: threshold, tp, fp, precision, recall, block_rate, cost
+        (coût attendu par transaction)
+    """
+    scores, labels, fp_cost, fn_cost = _as_arrays(scores, labels, fp_cost, fn_cost)
+    order = np.argsort(-scores, kind="stable")
+    return _sorted_operating_points(scores[order], labels[order], fp_cost[order], fn_cost[order])
+
+
+def segment_operating_points(scores, labels, segments, fp_cost=1.0, fn_cost=1.0) -> dict:
+    """operating_points par segment: {segment: (transactions, fraudes, points)}"""
+    scores, labels, fp_cost, fn_cost = _as_arrays(scores, labels, fp_cost, fn_cost)
+    if hasattr(segments, "factorize"):
+        # Colonne pandas: table de hachage, bien plus rapide que np.unique qui trie les chaînes
+        codes, names = segments.fillna("Other").astype(str).factorize(sort=True)
+        names = np.asarray(names)
+    else:
+        names, codes = np.unique(np.asarray(segments), return_inverse=True)
+        names = names.astype(str)
+
+    # Tri par score décroissant, puis tri stable par segment: chaque segment est une
+    # tranche contiguë, déjà triée par score
+    order = np.argsort(-scores, kind="stable")
+    order = order[np.argsort(codes[order], kind="stable")]
+    scores, labels, fp_cost, fn_cost = scores[order], labels[order], fp_cost[order], fn_cost[order]
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(names)))])
+    result = {}
+    for i, name in enumerate(names.tolist()):
+        rows = slice(bounds[i], bounds[i + 1])
+        result[name] = (int(bounds[i + 1] - bounds[i]), int(labels[rows].sum()),
+                        _sorted_operating_points(scores[rows], labels[rows], fp_cost[rows], fn_cost[rows]))
+    return result
+
+
+def _sorted_operating_points(scores, fraud, fp_cost, fn_cost) -> dict:
+    # Entrées triées par score décroissant
+    n_rows = len(scores)
+    # Dernière position de chaque score distinct: tous les ex aequo sont bloqués ensemble
+    last = np.flatnonzero(np.append(scores[1:] != scores[:-1], True)) if n_rows else np.array([], np.intp)
+
+    tp = np.concatenate([[0], np.cumsum(fraud)[last]])
+    fp = np.concatenate([[0], np.cumsum(~fraud)[last]])
+    caught_cost = np.concatenate([[0.0], np.cumsum(np.where(fraud, fn_cost, 0.0))[last]])
+    blocked_cost = np.concatenate([[0.0], np.cumsum(np.where(fraud, 0.0, fp_cost))[last]])
+    top = np.nextafter(scores[0], np.inf) if n_rows else np.inf
+    threshold = np.concatenate([[top], scores[last]])
+
+    blocked = tp + fp
+    n_fraud = int(fraud.sum())
+    missed_cost = fn_cost[fraud].sum() - caught_cost
+    return {
+        "threshold": threshold,
+        "tp": tp,
+        "fp": fp,
+        "precision": np.divide(tp, blocked, out=np.zeros(len(tp)), where=blocked > 0),
+        "recall": tp / n_fraud if n_fraud else np.zeros(len(tp)),
+        "block_rate": blocked / max(n_rows, 1),
+        "cost": (blocked_cost + missed_cost) / max(n_rows, 1),
+    }
+
+
+def ranked(points: dict, top: int, min_precision: float = 0.0, min_recall: float = 0.0,
+           max_block_rate: float = 1.0) -> np.ndarray:
+    """Index des `top` seuils de plus faible coût qui respectent les contraintes (à coût égal, le plus haut)"""
+    feasible = np.flatnonzero((points["precision"] >= min_precision) & (points["recall"] >= min_recall)
+                              & (points["block_rate"] <= max_block_rate))
+    order = np.lexsort((-points["threshold"][feasible], points["cost"][feasible]))
+    return feasible[order[:top]]
+
+
+def recommend(points: dict, min_precision: float = 0.0, min_recall: float = 0.0, max_block_rate: float = 1.0):
+    """Index du seuil recommandé: premier du classement (None si aucun seuil ne respecte les contraintes)"""
+    best = ranked(points, 1, min_precision, min_recall, max_block_rate)
+    return int(best[0]) if len(best) else None
+
+
+def point_at(points: dict, index: int) -> dict:
+    return {metric: points[metric][index].item() for metric in METRICS}
+
+
+def score_dataset(df, model_dir: Path, score_column: str, with_rules: bool = True) -> np.ndarray:
+    """Scores du jeu: colonne de scores, features du modèle ou transactions (pipeline du service)"""
+    if score_column in df.columns:
+        return df[score_column].to_numpy(dtype=np.float64)
+
+    # Lots de SCORING_CHUNK lignes: predict_proba passe en threads sur tous les CPU alloués
+    bundle = ModelBundle.load(model_dir, max_jobs=allocated_cpus())
+    scores = np.empty(len(df), dtype=np.float64)
+    if set(bundle.feature_columns) <= set(df.columns):
+        X = df[bundle.feature_columns].to_numpy(dtype=np.float64)
+        for start in range(0, len(X), SCORING_CHUNK):
+            scores[start:start + SCORING_CHUNK] = bundle.predict_scores(X[start:start + SCORING_CHUNK])
+        return scores
+    if not {"amount", "merchant"} <= set(df.columns):
+        raise ValueError(f"Colonnes attendues: {score_column}, les features du modèle, ou amount et merchant")
+
+    amounts = df["amount"].to_numpy(dtype=np.float64)
+    merchants = df["merchant"].astype(str).tolist()
+    rules = RuleSet.load() if with_rules else None
+    for start in range(0, len(df), SCORING_CHUNK):
+        chunk_amounts, chunk_merchants = amounts[start:start + SCORING_CHUNK], merchants[start:start + SCORING_CHUNK]
+        chunk = bundle.predict_scores(bundle.feature_matrix(chunk_amounts.tolist(), chunk_merchants))
+        if rules is not None:
+            chunk = np.maximum(chunk, rules.evaluate(chunk_amounts, chunk_merchants)[0])
+        scores[start:start + SCORING_CHUNK] = chunk
+    return scores
+
+
+def format_row(label: str, point: dict) -> str:
+    return (f"{label:<14} {point['threshold']:>8.4f} {point['precision']:>9.4f} {point['recall']:>7.4f} "
+            f"{point['block_rate']:>8.4%} {point['cost']:>10.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", type=Path, required=True, help="CSV étiqueté")
+    parser.add_argument("--model-dir", type=Path, default=MODEL_DIR)
+    parser.add_argument("--label-column", default="Class")
+    parser.add_argument("--score-column", default="score")
+    parser.add_argument("--segment-column", default="category", help="Segments (ignoré si la colonne est absente)")
+    parser.add_argument("--no-rules", action="store_true", help="Transactions: score ML seul, sans max(ML, règles)")
+    parser.add_argument("--cost-fp", type=float, default=1.0, help="Coût d'une transaction légitime bloquée")
+    parser.add_argument("--cost-fn", default="10", help="Coût d'une fraude manquée, ou 'amount' (son montant)")
+    parser.add_argument("--min-precision", type=float, default=0.0)
+    parser.add_argument("--min-recall", type=float, default=0.0)
+    parser.add_argument("--max-block-rate", type=float, default=1.0)
+    parser.add_argument("--current-threshold", type=float, default=0.5, help="Seuil actuel, affiché pour comparaison")
+    parser.add_argument("--top", type=int, default=10, help="Lignes du classement global")
+    parser.add_argument("--output", type=Path, help="Rapport JSON")
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    warnings.filterwarnings("ignore", category=UserWarning)
+    df = pd.read_csv(args.dataset)
+    labels = df[args.label_column].to_numpy(dtype=np.intp)
+    start = time.perf_counter()
+    scores = score_dataset(df, args.model_dir, args.score_column, not args.no_rules)
+    scoring_seconds = time.perf_counter() - start
+
+    if args.cost_fn == "amount":
+        amount_column = "amount" if "amount" in df.columns else "Amount"
+        fn_cost = df[amount_column].to_numpy(dtype=np.float64)
+    else:
+        fn_cost = float(args.cost_fn)
+    constraints = (args.min_precision, args.min_recall, args.max_block_rate)
+
+    start = time.perf_counter()
+    points = operating_points(scores, labels, args.cost_fp, fn_cost)
+    best = recommend(points, *constraints)
+    segments = {}
+    if args.segment_column in df.columns:
+        segments = segment_operating_points(scores, labels, df[args.segment_column], args.cost_fp, fn_cost)
+    calibration_seconds = time.perf_counter() - start
+
+    print(f"{args.dataset}: {len(df)} transactions, {int(labels.sum())} fraudes, {len(points['threshold']) - 1} seuils candidats")
+    print(f"Scoring {scoring_seconds:.2f} s, calibration {calibration_seconds:.2f} s")
+    header = f"{'':<14} {'seuil':>8} {'précision':>9} {'rappel':>7} {'blocage':>8} {'coût/txn':>10}"
+    print(f"\n{header}")
+    ranking = ranked(points, args.top, *constraints).tolist()
+    for rank, index in enumerate(ranking, start=1):
+        print(format_row(f"#{rank}", point_at(points, index)))
+    # Seuils décroissants: dernier candidat >= seuil actuel, ou aucun blocage
+    current = int(np.searchsorted(-points["threshold"], -args.current_threshold, side="right")) - 1
+    print(format_row("actuel", {**point_at(points, max(current, 0)), "threshold": args.current_threshold}))
+
+    report = {"dataset": str(args.dataset), "transactions": len(df), "frauds": int(labels.sum()),
+              "cost_fp": args.cost_fp, "cost_fn": fn_cost if args.cost_fn != "amount" else "amount",
+              "constraints": dict(zip(("min_precision", "min_recall", "max_block_rate"), constraints)),
+              "ranked": [point_at(points, index) for index in ranking],
+              "recommended": point_at(points, best) if best is not None else None, "segments": {}}
+    if best is None:
+        print("\nAucun seuil ne respecte les contraintes")
+    else:
+        print(f"\nSeuil recommandé: FRAUD_THRESHOLD={points['threshold'][best]:.4f}")
+
+    if segments:
+        print(f"\n{'segment':<14} {'seuil':>8} {'précision':>9} {'rappel':>7} {'blocage':>8} {'coût/txn':>10} {'txn':>8} {'fraudes':>7}")
+        for name, (n_rows, n_fraud, segment_points) in sorted(segments.items(), key=lambda item: -item[1][0]):
+            index = recommend(segment_points, *constraints)
+            point = point_at(segment_points, index) if index is not None else None
+            report["segments"][name] = {"transactions": n_rows, "frauds": n_fraud, "recommended": point}
+            if point is None:
+                print(f"{name:<14} {'-':>8} {'':>9} {'':>7} {'':>8} {'':>10} {n_rows:>8} {n_fraud:>7}")
+            else:
+                print(format_row(name, point) + f" {n_rows:>8} {n_fraud:>7}")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"\nRapport: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
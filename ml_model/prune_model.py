@@ -0,0 +1,301 @@
+"""
+Élagage du Random Forest pour le scoring temps réel
+
+Réduit le modèle entraîné (models/random_forest_model.pkl) jusqu'à un budget
+de noeuds et/ou de latence, en échangeant un peu de précision contre beaucoup
+de latence:
+1. troncature optionnelle de tous les arbres à --max-depth (les noeuds à cette
+   profondeur deviennent des feuilles avec la distribution de classes du noeud)
+2. élimination gloutonne: à chaque étape, l'arbre dont le retrait fait le moins
+   baisser l'AUC de validation est retiré (à AUC égale, celui qui éloigne le moins
+   les scores du modèle d'origine), jusqu'à respecter les budgets
+
+Chaque étape est rapportée (arbres, noeuds, latence, AUC, rappel, écart moyen
+des scores avec le modèle d'origine). Le dossier de sortie a la même structure
+que models/ (random_forest_model.pkl, scaler.pkl, feature_columns.json): le
+service le charge tel quel (MODEL_DIR, ou SHADOW_MODEL_DIR pour le comparer au
+modèle actif sur le trafic réel).
+
+Jeu de validation: CSV avec les colonnes du modèle et la colonne Class. Sans
+--validation, des transactions synthétiques sont générées comme dans le service
+et étiquetées par le modèle complet: l'AUC mesure alors la fidélité au modèle
+d'origine.
+
+Usage:
+    python prune_model.py --max-nodes 8000 [--max-depth 12] [--validation data/validation.csv]
+    python prune_model.py --max-latency-ms 0.15 --output models/pruned
+"""
+
+import argparse
+import copy
+import json
+import shutil
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import joblib
+import numpy as np
+from scipy.stats import rankdata
+from sklearn.tree._tree import Tree
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.features import FEATURE_NAMES, generate_feature_matrix
+from fraud_detection_service.tree_engine import CompiledForest
+
+MODEL_DIR = Path(__file__).parent / "models"
+MODEL_FILE = "random_forest_model.pkl"
+SCALER_FILE = "scaler.pkl"
+FEATURES_FILE = "feature_columns.json"
+REPORT_FILE = "pruning_report.json"
+
+FRAUD_THRESHOLD = 0.5
+TREE_LEAF = -1
+TREE_UNDEFINED = -2
+
+
+def truncate_tree(estimator, max_depth: int):
+    """
+    Copie de l'arbre coupée à max_depth
+
+    Passe par l'état sérialisé du Tree sklearn (__getstate__/__setstate__): les
+    noeuds au-delà de max_depth sont retirés et les noeuds internes à max_depth
+    deviennent des feuilles. Les indices restent dans l'ordre d'origine.
+    """
+    tree = estimator.tree_
+    state = tree.__getstate__()
+    nodes, values = state["nodes"], state["values"]
+
+    depth = np.zeros(len(nodes), dtype=np.intp)
+    for node in range(len(nodes)):
+        left, right = nodes["left_child"][node], nodes["right_child"][node]
+        if left != TREE_LEAF:
+            depth[left] = depth[right] = depth[node] + 1
+
+    keep = depth <= max_depth
+    new_index = np.cumsum(keep) - 1
+    new_nodes = nodes[keep].copy()
+    cut = (depth[keep] == max_depth) & (new_nodes["left_child"] != TREE_LEAF)
+    internal = (new_nodes["left_child"] != TREE_LEAF) & ~cut
+
+    new_nodes["left_child"][internal] = new_index[new_nodes["left_child"][internal]]
+    new_nodes["right_child"][internal] = new_index[new_nodes["right_child"][internal]]
+    new_nodes["left_child"][cut] = TREE_LEAF
+    new_nodes["right_child"][cut] = TREE_LEAF
+    new_nodes["feature"][cut] = TREE_UNDEFINED
+    new_nodes["threshold"][cut] = TREE_UNDEFINED
+
+    state = dict(state, nodes=new_nodes, values=np.ascontiguousarray(values[keep]),
+                 node_count=int(keep.sum()), max_depth=int(min(state["max_depth"], max_depth)))
+    truncated_tree = Tree(tree.n_features, np.asarray(tree.n_classes, dtype=np.intp), tree.n_outputs)
+    truncated_tree.__setstate__(state)
+
+    truncated = copy.copy(estimator)
+    truncated.tree_ = truncated_tree
+    truncated.max_depth = max_depth
+    return truncated
+
+
+def truncate_forest(model, max_depth: int):
+    truncated = copy.copy(model)
+    truncated.estimators_ = [truncate_tree(estimator, max_depth) for estimator in model.estimators_]
+    truncated.max_depth = max_depth
+    return truncated
+
+
+def subset_forest(model, indices):
+    """Random Forest réduit aux arbres `indices` (mêmes classes, mêmes features)"""
+    subset = copy.copy(model)
+    subset.estimators_ = [model.estimators_[i] for i in indices]
+    subset.n_estimators = len(subset.estimators_)
+    return subset
+
+
+def fraud_column(model) -> int:
+    return list(model.classes_).index(1)
+
+
+def tree_probabilities(model, X: np.ndarray) -> np.ndarray:
+    """Probabilité de fraude de chaque arbre: matrice n_arbres x n_lignes"""
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    column = fraud_column(model)
+    return np.stack([estimator.predict_proba(X, check_input=False)[:, column] for estimator in model.estimators_])
+
+
+def auc_scores(scores: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """AUC ROC de chaque ligne de `scores` (rangs moyens en cas d'égalité, comme roc_auc_score)"""
+    scores = np.atleast_2d(scores)
+    n_positive = int(y.sum())
+    n_negative = len(y) - n_positive
+    ranks = rankdata(scores, axis=1)
+    return (ranks[:, y == 1].sum(axis=1) - n_positive * (n_positive + 1) / 2) / (n_positive * n_negative)
+
+
+def evaluate(scores: np.ndarray, y: np.ndarray, threshold: float) -> dict:
+    predicted = scores >= threshold
+    true_positives = int(np.sum(predicted & (y == 1)))
+    return {
+        "auc": float(auc_scores(scores, y)[0]),
+        "recall": true_positives / max(int(y.sum()), 1),
+        "precision": true_positives / max(int(predicted.sum()), 1),
+    }
+
+
+def measure_latency_ms(model, X_row: np.ndarray, repeats: int = 200) -> float:
+    """Latence médiane (ms) d'une transaction avec la forêt compilée du service"""
+    forest = CompiledForest.from_sklearn(model)
+    forest.predict_proba(X_row)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        forest.predict_proba(X_row)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings) * 1000)
+
+
+def node_counts(model) -> np.ndarray:
+    return np.array([estimator.tree_.node_count for estimator in model.estimators_])
+
+
+def prune(model, X: np.ndarray, y: np.ndarray, max_nodes=None, max_latency_ms=None, max_depth=None,
+          min_trees: int = 1, threshold: float = FRAUD_THRESHOLD, repeats: int = 200):
+    """
+    Troncature puis élimination gloutonne des arbres jusqu'aux budgets
+
+    Returns:
+        (modèle élagué, étapes): une étape par transformation, avec ses métriques
+    """
+    if max_nodes is None and max_latency_ms is None:
+        raise ValueError("Au moins un budget est requis (max_nodes ou max_latency_ms)")
+    if len(np.unique(y)) != 2:
+        raise ValueError("Le jeu de validation doit contenir les deux classes")
+
+    X_row = np.ascontiguousarray(X[:1], dtype=np.float32)
+    steps = []
+
+    def record(step: str, candidate, probabilities, kept):
+        scores = probabilities[kept].mean(axis=0)
+        entry = {"step": step, "trees": len(kept), "nodes": int(node_counts(candidate).sum()),
+                 "max_depth": max(estimator.tree_.max_depth for estimator in candidate.estimators_),
+                 **evaluate(scores, y, threshold), "mean_abs_delta": float(np.abs(scores - reference).mean())}
+        if max_latency_ms is not None:
+            entry["latency_ms"] = measure_latency_ms(candidate, X_row, repeats)
+        if steps:
+            entry["auc_cost"] = steps[0]["auc"] - entry["auc"]
+            entry["recall_cost"] = steps[0]["recall"] - entry["recall"]
+        steps.append(entry)
+        return entry
+
+    def within_budget(entry) -> bool:
+        return ((max_nodes is None or entry["nodes"] <= max_nodes)
+                and (max_latency_ms is None or entry["latency_ms"] <= max_latency_ms))
+
+    probabilities = tree_probabilities(model, X)
+    reference = probabilities.mean(axis=0)
+    kept = list(range(len(model.estimators_)))
+    entry = record("original", model, probabilities, kept)
+
+    if max_depth is not None:
+        model = truncate_forest(model, max_depth)
+        probabilities = tree_probabilities(model, X)
+        entry = record(f"max_depth={max_depth}", model, probabilities, kept)
+
+    nodes = node_counts(model)
+    while not within_budget(entry):
+        if len(kept) <= min_trees:
+            raise ValueError(f"Budget non atteint avec {min_trees} arbre(s): {entry}")
+        # AUC de la forêt privée de chaque arbre candidat, calculée en un seul passage
+        total = probabilities[kept].sum(axis=0)
+        candidates = (total - probabilities[kept]) / (len(kept) - 1)
+        aucs = auc_scores(candidates, y)
+        deltas = np.abs(candidates - reference).mean(axis=1)
+        # À AUC égale, l'arbre dont le retrait change le moins les scores, puis le plus gros
+        best = max(range(len(kept)), key=lambda i: (aucs[i], -deltas[i], nodes[kept[i]]))
+        removed = kept.pop(best)
+        entry = record(f"remove tree {removed}", subset_forest(model, kept), probabilities, kept)
+
+    return subset_forest(model, kept), steps
+
+
+def load_validation(path, feature_columns, scaler=None):
+    """Features (dans l'ordre du modèle, scaler appliqué) et étiquettes d'un CSV de validation"""
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    X = df[feature_columns].to_numpy(dtype=np.float64)
+    if scaler is not None:
+        X = scaler.transform(X)
+    return X, df["Class"].to_numpy(dtype=np.intp)
+
+
+def synthetic_validation(model, n_rows: int, threshold: float, seed: int = 0, scaler=None):
+    """Transactions synthétiques (features du service) étiquetées par le modèle complet"""
+    rng = np.random.default_rng(seed)
+    amounts = np.round(np.exp(rng.uniform(np.log(1.0), np.log(200000.0), n_rows)), 2).tolist()
+    merchants = rng.choice(["Amazon", "Carrefour", "Zara", "Netflix", "Apple", "AB", "X"], n_rows).tolist()
+    X = generate_feature_matrix(amounts, merchants)
+    if scaler is not None:
+        X = scaler.transform(X)
+    y = (model.predict_proba(X)[:, fraud_column(model)] >= threshold).astype(np.intp)
+    return X, y
+
+
+def save_bundle(model, output_dir, model_dir, steps):
+    """Écrit le modèle élagué avec le scaler et les colonnes du modèle d'origine"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    joblib.dump(model, output_dir / MODEL_FILE)
+    for name in (SCALER_FILE, FEATURES_FILE):
+        if (Path(model_dir) / name).exists():
+            shutil.copy2(Path(model_dir) / name, output_dir / name)
+    with open(output_dir / REPORT_FILE, "w") as f:
+        json.dump({"source": str(Path(model_dir) / MODEL_FILE), "steps": steps}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", type=Path, default=MODEL_DIR)
+    parser.add_argument("--output", type=Path, default=MODEL_DIR / "pruned")
+    parser.add_argument("--validation", type=Path, help="CSV avec les colonnes du modèle et Class")
+    parser.add_argument("--synthetic-rows", type=int, default=20000)
+    parser.add_argument("--max-nodes", type=int)
+    parser.add_argument("--max-latency-ms", type=float)
+    parser.add_argument("--max-depth", type=int)
+    parser.add_argument("--min-trees", type=int, default=1)
+    parser.add_argument("--threshold", type=float, default=FRAUD_THRESHOLD)
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore", category=UserWarning)
+    model = joblib.load(args.model_dir / MODEL_FILE)
+    scaler = joblib.load(args.model_dir / SCALER_FILE) if (args.model_dir / SCALER_FILE).exists() else None
+    if (args.model_dir / FEATURES_FILE).exists():
+        with open(args.model_dir / FEATURES_FILE) as f:
+            feature_columns = json.load(f)
+    else:
+        feature_columns = list(FEATURE_NAMES)
+
+    if args.validation is not None:
+        X, y = load_validation(args.validation, feature_columns, scaler)
+        print(f"Validation: {args.validation} ({len(y)} lignes, {int(y.sum())} fraudes)")
+    else:
+        X, y = synthetic_validation(model, args.synthetic_rows, args.threshold, scaler=scaler)
+        print(f"Validation synthétique: {len(y)} lignes étiquetées par le modèle complet ({int(y.sum())} fraudes)")
+
+    pruned, steps = prune(model, X, y, args.max_nodes, args.max_latency_ms, args.max_depth,
+                          args.min_trees, args.threshold)
+
+    print(f"\n{'étape':<18} {'arbres':>6} {'noeuds':>7} {'prof.':>5} {'AUC':>7} {'rappel':>7} {'écart':>7} {'latence':>8}")
+    for step in steps:
+        latency = f"{step['latency_ms']:.3f}ms" if "latency_ms" in step else "-"
+        print(f"{step['step']:<18} {step['trees']:>6} {step['nodes']:>7} {step['max_depth']:>5} "
+              f"{step['auc']:>7.4f} {step['recall']:>7.4f} {step['mean_abs_delta']:>7.4f} {latency:>8}")
+    final = steps[-1]
+    print(f"\nCoût: AUC -{final.get('auc_cost', 0.0):.4f}, rappel -{final.get('recall_cost', 0.0):.4f}")
+
+    save_bundle(pruned, args.output, args.model_dir, steps)
+    print(f"Modèle élagué sauvegardé: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
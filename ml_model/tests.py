@@ -0,0 +1,123 @@
+"""
+Tests unitaires pour les outils du modèle (élagage, calibration du seuil)
+"""
+
+import json
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from common.features import FEATURE_NAMES
+from fraud_detection_service.model_bundle import ModelBundle
+from fraud_detection_service.tree_engine import CompiledForest
+from .calibrate_threshold import operating_points, ranked, recommend, segment_operating_points
+from .prune_model import prune, save_bundle, truncate_forest
+
+FEATURE_COLUMNS = list(FEATURE_NAMES)
+
+
+def synthetic_dataset(n_rows, seed):
+    """Transactions synthétiques (29 features) et étiquettes déterministes"""
+    rng = np.random.RandomState(seed)
+    X = rng.normal(size=(n_rows, len(FEATURE_COLUMNS)))
+    X[:, -1] = rng.exponential(2000, size=n_rows)
+    y = ((X[:, 3] + X[:, 10] > 1.0) | (X[:, -1] > 6000)).astype(int)
+    return X, y
+
+
+def train_test_model(n_estimators=10, max_depth=6):
+    """Entraîne un petit Random Forest sur des données synthétiques"""
+    X, y = synthetic_dataset(500, 0)
+    model = RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth, random_state=0)
+    model.fit(X, y)
+    return model
+
+
+class TestModelPruning:
+    """ml_model/prune_model.py: troncature, élimination gloutonne, bundle chargeable par le service"""
+
+    def setup_method(self):
+        self.model = train_test_model(n_estimators=20, max_depth=8)
+        self.X, self.y = synthetic_dataset(400, 2)
+
+    def test_truncation(self):
+        """Profondeur >= profondeur réelle: prédictions inchangées; sinon arbres plus courts"""
+        unchanged = truncate_forest(self.model, 50)
+        np.testing.assert_array_equal(unchanged.predict_proba(self.X), self.model.predict_proba(self.X))
+
+        truncated = truncate_forest(self.model, 3)
+        assert all(estimator.tree_.max_depth <= 3 for estimator in truncated.estimators_)
+        assert CompiledForest.from_sklearn(truncated).max_depth <= 3
+        np.testing.assert_allclose(CompiledForest.from_sklearn(truncated).predict_proba(self.X),
+                                   truncated.predict_proba(self.X), atol=1e-12)
+        # Le modèle d'origine n'est pas modifié
+        assert max(estimator.tree_.max_depth for estimator in self.model.estimators_) > 3
+
+    def test_prune_to_node_budget(self, tmp_path):
+        total_nodes = sum(estimator.tree_.node_count for estimator in self.model.estimators_)
+        pruned, steps = prune(self.model, self.X, self.y, max_nodes=total_nodes // 3, max_depth=6)
+
+        assert steps[0]["step"] == "original" and steps[1]["step"] == "max_depth=6"
+        assert steps[-1]["nodes"] <= total_nodes // 3 < steps[-2]["nodes"]
+        assert pruned.n_estimators == steps[-1]["trees"] < 20
+        assert all("auc_cost" in step and "recall_cost" in step for step in steps[1:])
+
+        # Bundle de sortie chargé tel quel par le service
+        save_bundle(pruned, tmp_path, tmp_path / "absent", steps)
+        bundle = ModelBundle.load(tmp_path)
+        np.testing.assert_allclose(bundle.predict_scores(self.X), pruned.predict_proba(self.X)[:, 1], atol=1e-12)
+        assert json.loads((tmp_path / "pruning_report.json").read_text())["steps"] == steps
+
+    def test_budget_required(self):
+        with pytest.raises(ValueError):
+            prune(self.model, self.X, self.y)
+
+
+class TestThresholdCalibration:
+    """ml_model/calibrate_threshold.py: métriques de tous les seuils en une passe cumulée"""
+
+    def setup_method(self):
+        rng = np.random.default_rng(6)
+        self.labels = rng.random(2000) < 0.05
+        # Scores arrondis: beaucoup d'ex aequo
+        self.scores = np.clip(rng.normal(0.3, 0.2, 2000) + 0.35 * self.labels, 0, 1).round(2)
+        self.amounts = rng.lognormal(4, 1, 2000)
+        self.segments = rng.choice(["Shopping", "Food", "Travel"], 2000)
+
+    def naive(self, scores, labels, threshold, fp_cost, fn_cost):
+        blocked = scores >= threshold
+        tp, fp = int((blocked & labels).sum()), int((blocked & ~labels).sum())
+        cost = fp * fp_cost + fn_cost[labels & ~blocked].sum()
+        return tp, fp, tp / max(tp + fp, 1), tp / labels.sum(), blocked.mean(), cost / len(scores)
+
+    def test_matches_per_threshold_loop(self):
+        points = operating_points(self.scores, self.labels, 5.0, self.amounts)
+
+        assert len(points["threshold"]) == len(np.unique(self.scores)) + 1
+        assert np.all(np.diff(points["threshold"]) < 0)
+        assert points["tp"][0] == points["fp"][0] == 0
+        for i, threshold in enumerate(points["threshold"]):
+            expected = self.naive(self.scores, self.labels, threshold, 5.0, self.amounts)
+            actual = tuple(points[metric][i] for metric in ("tp", "fp", "precision", "recall", "block_rate", "cost"))
+            assert actual == pytest.approx(expected)
+
+    def test_segments_match_subsets(self):
+        segments = segment_operating_points(self.scores, self.labels, self.segments, 5.0, self.amounts)
+
+        assert sorted(segments) == ["Food", "Shopping", "Travel"]
+        for name, (n_rows, n_fraud, points) in segments.items():
+            mask = self.segments == name
+            assert (n_rows, n_fraud) == (mask.sum(), self.labels[mask].sum())
+            expected = operating_points(self.scores[mask], self.labels[mask], 5.0, self.amounts[mask])
+            for metric, values in expected.items():
+                np.testing.assert_allclose(points[metric], values)
+
+    def test_recommendation_respects_constraints(self):
+        points = operating_points(self.scores, self.labels, 1.0, 10.0)
+        best = recommend(points)
+        assert points["cost"][best] == points["cost"].min()
+        assert ranked(points, 3)[0] == best
+
+        constrained = recommend(points, min_precision=0.6, max_block_rate=0.05)
+        assert points["precision"][constrained] >= 0.6 and points["block_rate"][constrained] <= 0.05
+        assert points["cost"][constrained] >= points["cost"][best]
+        assert recommend(points, min_precision=1.1) is None
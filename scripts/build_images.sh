@@ -9,11 +9,11 @@ docker build -t fraud-detection/auth-service:latest ./auth_service
 
 # Construire le service de transaction
 echo "Construction de transaction-service..."
-docker build -t fraud-detection/transaction-service:latest ./transaction_service
+docker build -t fraud-detection/transaction-service:latest -f transaction_service/Dockerfile .
 
 # Construire le service de détection de fraude
 echo "Construction de fraud-detection-service..."
-docker build -t fraud-detection/fraud-detection-service:latest ./fraud_detection_service
+docker build -t fraud-detection/fraud-detection-service:latest -f fraud_detection_service/Dockerfile .
 
 echo "=== Construction terminée ==="
 echo "Pour lancer avec Docker Compose: docker-compose up"
@@ -11,13 +11,25 @@ import httpx
 import os
 from datetime import datetime
 import random
-import numpy as np
+import sys
+from pathlib import Path
 from sqlalchemy.orm import Session
+try:
+    from common.features import FEATURE_NAMES, generate_features as generate_feature_vector
+except ImportError:
+    # Lancement depuis le dossier du service (uvicorn main:app): code partagé à la racine du dépôt
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from common.features import FEATURE_NAMES, generate_features as generate_feature_vector
+from common.fast_json import FastJSONResponse, RawBodyRoute
+from common.msgpack_codec import decode_response, request_options
+from common.structured_logging import REQUEST_ID_HEADER, RequestIdMiddleware, configure_logging, request_id_var
 try:
     from .models import Transaction, get_db, SessionLocal
 except ImportError:
     from models import Transaction, get_db, SessionLocal
 
+logger = configure_logging("transaction_service")
+
 # Celery optionnel
 try:
     try:
@@ -28,13 +40,16 @@ try:
         CELERY_AVAILABLE = True
 except ImportError:
     CELERY_AVAILABLE = False
-    print("⚠️ Celery non disponible - utilisation de la vérification synchrone")
+    logger.warning("Celery non disponible - utilisation de la vérification synchrone")
 
 app = FastAPI(
     title="Transaction Service",
     description="Service de capture et traitement des transactions",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
+# Corps JSON des POST validés directement depuis les octets reçus
+app.router.route_class = RawBodyRoute
 
 # Configuration CORS
 app.add_middleware(
@@ -44,6 +59,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestIdMiddleware)
 
 # Configuration
 FRAUD_DETECTION_SERVICE_URL = os.getenv(
@@ -54,6 +70,8 @@ AUTH_SERVICE_URL = os.getenv(
     "AUTH_SERVICE_URL",
     "http://localhost:8000"
 )
+# Format des échanges avec le service ML: json (défaut) ou msgpack (repli JSON si le paquet est absent)
+FRAUD_SERVICE_ENCODING = os.getenv("FRAUD_SERVICE_ENCODING", "json").lower()
 
 class TransactionCreate(BaseModel):
     """Modèle pour créer une transaction"""
@@ -78,66 +96,43 @@ class TransactionResponse(BaseModel):
 def generate_features(amount: float, merchant: str, category: str) -> dict:
     """
     Génère des features synthétiques pour la transaction
+    (mêmes valeurs que le service de détection, via common.features)
     """
-    np.random.seed(int(amount * 1000) % 10000 + len(merchant))
-    
-    features = {}
-    for i in range(1, 29):
-        if i in [1, 2, 3, 4, 5]:
-            features[f'V{i}'] = float(np.random.normal(0, 1))
-        elif i in [6, 7, 8, 9, 10]:
-            features[f'V{i}'] = float(np.random.normal(0, 2))
-        else:
-            features[f'V{i}'] = float(np.random.normal(0, 1.5))
-    
-    # Simuler des patterns de fraude pour test
-    if amount > 1000:
-        features['V11'] = float(np.random.normal(2, 1))
-        features['V12'] = float(np.random.normal(-1, 1))
-        features['V14'] = float(np.random.normal(-2, 0.8))
-    
-    if amount > 5000:  # Montant très élevé = plus suspect
-        features['V4'] = float(np.random.normal(3, 1))
-        features['V11'] = float(np.random.normal(3.5, 0.5))
-    
-    features['Amount'] = float(amount)
-    
-    return features
+    return dict(zip(FEATURE_NAMES, generate_feature_vector(amount, merchant).tolist()))
 
-async def detect_fraud(transaction_data: dict) -> dict:
+async def detect_fraud(transaction_data: dict, encoding: Optional[str] = None) -> dict:
     """
     Envoie la transaction au service ML pour détection de fraude
     ✅ CORRECTION: Utilise le bon endpoint /predict avec les bonnes données
+    encoding: json ou msgpack (par défaut FRAUD_SERVICE_ENCODING)
     """
     try:
-        print(f"🔍 Envoi vers ML Service: {FRAUD_DETECTION_SERVICE_URL}/predict")
-        print(f"📊 Données: amount={transaction_data.get('amount')}, merchant={transaction_data.get('merchant')}")
-        
         async with httpx.AsyncClient() as client:
             # ✅ CORRECTION: Envoyer directement les données de transaction
+            options = request_options(transaction_data, (encoding or FRAUD_SERVICE_ENCODING) == "msgpack")
+            # Le request_id est transmis pour corréler les logs des deux services
+            request_id = request_id_var.get()
+            if request_id:
+                options["headers"][REQUEST_ID_HEADER] = request_id
             response = await client.post(
                 f"{FRAUD_DETECTION_SERVICE_URL}/predict",  # ✅ BON ENDPOINT
-                json=transaction_data,  # ✅ BONNES DONNÉES
-                timeout=10.0
+                timeout=10.0,
+                **options  # ✅ BONNES DONNÉES
             )
             
-            print(f"📡 Réponse ML (status={response.status_code}): {response.text}")
-            
             if response.status_code == 200:
-                result = response.json()
-                print(f"✅ Résultat ML: is_fraud={result.get('is_fraud')}, score={result.get('fraud_score')}")
+                result = decode_response(response)
+                logger.debug("Réponse ML", extra={"ml_response": result})
                 return result
             else:
-                print(f"❌ Erreur ML Service: {response.status_code}")
+                logger.error("Erreur ML Service", extra={"status_code": response.status_code})
                 return {
                     "is_fraud": False,
                     "fraud_score": 0.0,
                     "confidence": 0.0
                 }
     except Exception as e:
-        print(f"❌ Exception lors de la détection de fraude: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Exception lors de la détection de fraude")
         return {
             "is_fraud": False,
             "fraud_score": 0.0,
@@ -161,8 +156,6 @@ async def health_check():
 
 @app.post("/transactions", response_model=TransactionResponse)
 async def create_transaction(transaction: TransactionCreate, db: Session = Depends(get_db)):
-    print(f"\n🆕 Nouvelle transaction: {transaction.amount}€ chez {transaction.merchant}")
-    
     # Générer un ID de transaction
     transaction_id = f"TXN_{datetime.now().strftime('%Y%m%d%H%M%S')}_{random.randint(1000, 9999)}"
     
@@ -189,10 +182,7 @@ async def create_transaction(transaction: TransactionCreate, db: Session = Depen
     db.commit()
     db.refresh(db_transaction)
     
-    print(f"💾 Transaction sauvegardée: {transaction_id}")
-    
     # Vérification de fraude avec le ML
-    print(f"🤖 Appel du service ML...")
     fraud_result = await detect_fraud(transaction_data)
     
     # Mettre à jour la transaction avec le résultat
@@ -205,8 +195,11 @@ async def create_transaction(transaction: TransactionCreate, db: Session = Depen
     db_transaction.confidence = fraud_result.get("confidence", 0.0)
     db.commit()
     
-    status_emoji = "🚫" if is_fraud else "✅"
-    print(f"{status_emoji} Transaction {db_transaction.status}: is_fraud={is_fraud}, score={fraud_score:.2%}")
+    # Événement à fort volume: les transactions approuvées sont échantillonnées (LOG_SAMPLE_RATE)
+    logger.info("Transaction traitée", extra={
+        "sample": not is_fraud, "transaction_id": transaction_id, "merchant": transaction.merchant,
+        "amount": transaction.amount, "status": db_transaction.status, "is_fraud": is_fraud, "fraud_score": fraud_score,
+    })
     
     return TransactionResponse(
         transaction_id=transaction_id,
@@ -228,7 +221,8 @@ async def get_transaction(transaction_id: str, db: Session = Depends(get_db)):
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction non trouvée")
     
-    return transaction.to_dict()
+    # Réponse encodée directement (dates comprises), sans passer par jsonable_encoder
+    return FastJSONResponse(transaction.to_dict())
 
 @app.get("/transactions")
 async def list_transactions(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
@@ -238,12 +232,10 @@ async def list_transactions(skip: int = 0, limit: int = 100, db: Session = Depen
     total = db.query(Transaction).count()
     transactions = db.query(Transaction).order_by(Transaction.created_at.desc()).offset(skip).limit(limit).all()
     
-    print(f"📋 Liste de {len(transactions)} transactions (total: {total})")
-    
-    return {
+    return FastJSONResponse({
         "total": total,
         "transactions": [tx.to_dict() for tx in transactions]
-    }
+    })
 
 @app.get("/users/{user_id}/transactions")
 async def get_user_transactions(user_id: str, db: Session = Depends(get_db)):
@@ -251,11 +243,11 @@ async def get_user_transactions(user_id: str, db: Session = Depends(get_db)):
     Récupère toutes les transactions d'un utilisateur
     """
     transactions = db.query(Transaction).filter(Transaction.user_id == user_id).all()
-    return {
+    return FastJSONResponse({
         "user_id": user_id,
         "total": len(transactions),
         "transactions": [tx.to_dict() for tx in transactions]
-    }
+    })
 
 if __name__ == "__main__":
     import uvicorn
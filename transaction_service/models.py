@@ -31,7 +31,10 @@ class Transaction(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
     def to_dict(self):
-        """Convertit le modèle en dictionnaire"""
+        """
+        Convertit le modèle en dictionnaire
+        Les dates restent des datetime: FastJSONResponse les écrit en ISO 8601 (comme isoformat)
+        """
         return {
             'id': self.id,
             'transaction_id': self.transaction_id,
@@ -44,8 +47,8 @@ class Transaction(Base):
             'is_fraud': self.is_fraud,
             'fraud_score': self.fraud_score,
             'confidence': self.confidence,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
         }
 
 
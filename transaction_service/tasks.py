@@ -4,6 +4,15 @@ Tâches Celery pour le service de transaction
 
 import httpx
 import os
+import sys
+from pathlib import Path
+from typing import Optional
+try:
+    from common.msgpack_codec import decode_response, request_options
+except ImportError:
+    # Worker lancé depuis le dossier du service: code partagé à la racine du dépôt
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from common.msgpack_codec import decode_response, request_options
 try:
     from .celery_app import celery_app
 except ImportError:
@@ -13,16 +22,20 @@ FRAUD_DETECTION_SERVICE_URL = os.getenv(
     "FRAUD_DETECTION_SERVICE_URL",
     "http://fraud-detection-service:8002"
 )
+BATCH_SIZE = int(os.getenv("FRAUD_BATCH_SIZE", "1000"))
+# json (défaut) ou msgpack: corps plus compacts et plus rapides à (dé)coder pour les gros lots
+FRAUD_SERVICE_ENCODING = os.getenv("FRAUD_SERVICE_ENCODING", "json").lower()
 
 
 @celery_app.task(name='transaction_service.check_fraud', bind=True, max_retries=3)
-def check_fraud_async(self, transaction_id: str, features: dict):
+def check_fraud_async(self, transaction_id: str, features: dict, encoding: Optional[str] = None):
     """
     Tâche asynchrone pour vérifier une transaction pour fraude
     
     Args:
         transaction_id: ID de la transaction
         features: Features de la transaction pour le modèle ML
+        encoding: json ou msgpack (par défaut FRAUD_SERVICE_ENCODING)
     
     Returns:
         dict: Résultat de la détection de fraude
@@ -35,11 +48,11 @@ def check_fraud_async(self, transaction_id: str, features: dict):
             }
             response = client.post(
                 f"{FRAUD_DETECTION_SERVICE_URL}/detect",
-                json=payload
+                **request_options(payload, (encoding or FRAUD_SERVICE_ENCODING) == "msgpack")
             )
             
             if response.status_code == 200:
-                return response.json()
+                return decode_response(response)
             else:
                 # Retry en cas d'erreur
                 raise Exception(f"Service de détection retourné {response.status_code}")
@@ -49,26 +62,38 @@ def check_fraud_async(self, transaction_id: str, features: dict):
         raise self.retry(exc=exc, countdown=2 ** self.request.retries)
 
 
-@celery_app.task(name='transaction_service.batch_check_fraud')
-def batch_check_fraud_async(transactions: list):
+@celery_app.task(name='transaction_service.batch_check_fraud', bind=True, max_retries=3)
+def batch_check_fraud_async(self, transactions: list, encoding: Optional[str] = None):
     """
     Tâche asynchrone pour vérifier plusieurs transactions en lot
     
+    Les transactions sont envoyées par paquets de BATCH_SIZE à /predict/batch,
+    qui les score en une seule inférence au lieu d'un appel HTTP par transaction.
+    
     Args:
         transactions: Liste de transactions à vérifier
+            (transaction_id, amount, merchant, category, user_id, timestamp)
+        encoding: json ou msgpack (par défaut FRAUD_SERVICE_ENCODING)
     
     Returns:
-        list: Résultats de détection pour chaque transaction
+        list: Résultats de détection pour chaque transaction, dans le même ordre
     """
     results = []
-    for transaction in transactions:
-        result = check_fraud_async.delay(
-            transaction['transaction_id'],
-            transaction['features']
-        )
-        results.append({
-            'transaction_id': transaction['transaction_id'],
-            'task_id': result.id
-        })
-    return results
-
+    use_msgpack = (encoding or FRAUD_SERVICE_ENCODING) == "msgpack"
+    try:
+        with httpx.Client(timeout=60.0) as client:
+            for start in range(0, len(transactions), BATCH_SIZE):
+                response = client.post(
+                    f"{FRAUD_DETECTION_SERVICE_URL}/predict/batch",
+                    **request_options({"transactions": transactions[start:start + BATCH_SIZE]}, use_msgpack)
+                )
+                
+                if response.status_code != 200:
+                    raise Exception(f"Service de détection retourné {response.status_code}")
+                
+                results.extend(decode_response(response)["results"])
+        return results
+    
+    except Exception as exc:
+        # Retry avec backoff exponentiel
+        raise self.retry(exc=exc, countdown=2 ** self.request.retries)
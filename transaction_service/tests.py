@@ -2,11 +2,13 @@
 Tests unitaires pour le service de transaction
 """
 
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from .main import app, get_db
+from .main import app, get_db, generate_features
+from common.features import FEATURE_NAMES, generate_features as generate_feature_vector
 from .models import Base, Transaction
 
 # Base de données de test
@@ -132,4 +134,59 @@ class TestTransactionService:
         assert response.json()["user_id"] == user_id
         assert response.json()["total"] == 2
         assert all(tx["user_id"] == user_id for tx in response.json()["transactions"])
+    
+    def test_dates_serialized_as_isoformat(self):
+        """FastJSONResponse écrit les datetime comme isoformat (format inchangé pour les clients)"""
+        transaction_id = client.post("/transactions", json={"user_id": "user1", "amount": 10.0,
+                                                            "merchant": "Amazon"}).json()["transaction_id"]
+        db = TestingSessionLocal()
+        created_at = db.query(Transaction).filter(Transaction.transaction_id == transaction_id).first().created_at
+        db.close()
+        
+        assert client.get(f"/transactions/{transaction_id}").json()["created_at"] == created_at.isoformat()
+        assert client.get("/transactions").json()["transactions"][0]["created_at"] == created_at.isoformat()
+    
+    def test_invalid_body_returns_422(self):
+        """Validation depuis les octets bruts: mêmes erreurs 422 que le chemin FastAPI habituel"""
+        response = client.post("/transactions", json={"user_id": "user1", "amount": -5, "merchant": "Amazon"})
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["loc"] == ["body", "amount"]
+        
+        response = client.post("/transactions", content=b'{"user_id": ', headers={"Content-Type": "application/json"})
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["type"] == "json_invalid"
+
+
+    def test_generate_features_shared(self):
+        """Les features sont identiques à celles du service de détection"""
+        features = generate_features(7000.0, "Zara", "Shopping")
+        
+        assert list(features) == FEATURE_NAMES
+        assert list(features.values()) == generate_feature_vector(7000.0, "Zara").tolist()
+
+
+class TestFraudServiceEncoding:
+    """Appel du service ML en msgpack (FRAUD_SERVICE_ENCODING / paramètre encoding)"""
+
+    def test_detect_fraud_msgpack(self, monkeypatch):
+        msgpack = pytest.importorskip("msgpack")
+        import httpx
+        from . import main
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            payload = msgpack.unpackb(request.content)
+            return httpx.Response(200, content=msgpack.packb({"transaction_id": payload["transaction_id"],
+                                                              "is_fraud": True, "fraud_score": 0.9}),
+                                  headers={"Content-Type": "application/msgpack"})
+
+        async_client = httpx.AsyncClient
+        monkeypatch.setattr(main.httpx, "AsyncClient",
+                            lambda **kwargs: async_client(transport=httpx.MockTransport(handler)))
+        result = asyncio.run(main.detect_fraud({"transaction_id": "T1", "amount": 10.0, "merchant": "Amazon"},
+                                               encoding="msgpack"))
 
+        assert result == {"transaction_id": "T1", "is_fraud": True, "fraud_score": 0.9}
+        assert requests[0].headers["content-type"] == "application/msgpack"
+        assert requests[0].headers["accept"] == "application/msgpack"